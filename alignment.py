@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+from cache import fingerprint, load_cached, save_cached
+from normalise import check_time_order
+
+# How each dataset is matched onto the shared timeline.
+# direction: 'backward' (last reading at or before), 'forward' (first reading at or after) or 'nearest'
+# tolerance: maximum distance to the matched reading, None for unlimited
+DEFAULT_ALIGNMENT = {
+    'CSO': {'time_col': 'DateTime', 'columns': ['Level'], 'direction': 'nearest', 'tolerance': '5min'}, # 1 minute readings
+    'SPS_A1': {'time_col': 'Timestamp', 'columns': ['Status'], 'direction': 'backward', 'tolerance': None}, # Pump state holds until the next event
+    'SPS_A2': {'time_col': 'Timestamp', 'columns': ['Status'], 'direction': 'backward', 'tolerance': None},
+    'Rainfall': {'time_col': 'time', 'columns': ['RG_A'], 'direction': 'backward', 'tolerance': '15min'} # 15 minute readings
+}
+
+def _time_values(df, time_col, name):
+    """
+    Get the timestamps of a column as int64 nanoseconds. The source must already be in time order
+    (see normalise.py); an unsorted source raises instead of silently mismatching.
+
+    :return: int64 array
+    """
+    times = pd.to_datetime(df[time_col]).to_numpy(dtype='datetime64[ns]')
+    check_time_order(times, name)
+    return times.view('i8') # View, not a copy, for datetime columns
+
+def _asof_indexer(source_times, timeline, direction, tolerance):
+    """
+    Find, for every timeline entry, the position of the matching reading in a sorted source.
+
+    :param source_times: Sorted int64 source timestamps
+    :param timeline: Sorted int64 timeline
+    :param direction: 'backward', 'forward' or 'nearest'
+    :param tolerance: Maximum distance in nanoseconds, or None
+    :return: Integer array of source positions, -1 where nothing matches
+    """
+    n = len(source_times)
+    if n == 0:
+        return np.full(len(timeline), -1, dtype=np.intp)
+
+    backward = np.searchsorted(source_times, timeline, side='right') - 1
+    forward = np.searchsorted(source_times, timeline, side='left')
+    backward_ok = backward >= 0
+    forward_ok = forward < n
+    backward_dist = np.where(backward_ok, timeline - source_times[np.clip(backward, 0, n - 1)], np.iinfo(np.int64).max)
+    forward_dist = np.where(forward_ok, source_times[np.clip(forward, 0, n - 1)] - timeline, np.iinfo(np.int64).max)
+
+    if direction == 'backward':
+        indexer, dist, ok = backward, backward_dist, backward_ok
+    elif direction == 'forward':
+        indexer, dist, ok = forward, forward_dist, forward_ok
+    elif direction == 'nearest':
+        use_forward = forward_dist < backward_dist # Ties go to the earlier reading
+        indexer = np.where(use_forward, forward, backward)
+        dist = np.minimum(forward_dist, backward_dist)
+        ok = backward_ok | forward_ok
+    else:
+        raise ValueError(f"Unknown direction '{direction}', expected 'backward', 'forward' or 'nearest'")
+
+    if tolerance is not None:
+        ok = ok & (dist <= tolerance)
+    return np.where(ok, indexer, -1)
+
+def build_aligned_frame(sources):
+    """
+    Build one time-aligned frame from several time series.
+
+    The shared timeline is the union of all source timestamps. The k sorted timestamp arrays are
+    concatenated and merged with a stable sort (timsort detects the k sorted runs, so this is a k-way merge),
+    then each source is matched onto the timeline with binary searches. Source frames are never copied.
+    Sources must be sorted by time (normalise.normalise_datasets), otherwise a ValueError is raised.
+
+    :param sources: Dictionary mapping a source name to a spec with keys 'df', 'time_col', 'columns',
+                    'direction' and 'tolerance' (see DEFAULT_ALIGNMENT)
+    :return: DataFrame with a 'DateTime' column, '<name>_<column>' value columns and a '<name>_observed'
+             column that is True where the source has a reading at exactly that timestamp
+    """
+    prepared = {}
+    for name, spec in sources.items():
+        prepared[name] = (spec, _time_values(spec['df'], spec['time_col'], name))
+
+    # k-way merge of the sorted runs, then drop repeated timestamps
+    merged = np.sort(np.concatenate([times for _, times in prepared.values()]), kind='stable')
+    if len(merged):
+        merged = merged[np.concatenate(([True], merged[1:] != merged[:-1]))]
+
+    aligned = {'DateTime': merged.view('datetime64[ns]')}
+    for name, (spec, times) in prepared.items():
+        tolerance = spec.get('tolerance')
+        if tolerance is not None:
+            tolerance = pd.Timedelta(tolerance).value
+        indexer = _asof_indexer(times, merged, spec.get('direction', 'backward'), tolerance)
+        matched = indexer >= 0
+
+        # Exact hits: the matched reading sits on this timeline entry
+        observed = np.zeros(len(merged), dtype=bool)
+        observed[matched] = times[indexer[matched]] == merged[matched]
+
+        for column in spec['columns']:
+            values = spec['df'][column].to_numpy()
+            if values.dtype.kind in 'iub':
+                values = values.astype(float) # Need NaN for unmatched rows
+            result = values.take(np.clip(indexer, 0, None)) if len(values) else np.empty(len(merged))
+            if not matched.all():
+                result[~matched] = {'O': None, 'M': np.datetime64('NaT'), 'm': np.timedelta64('NaT')}.get(result.dtype.kind, np.nan)
+            aligned[f'{name}_{column}'] = result
+        aligned[f'{name}_observed'] = observed
+
+    return pd.DataFrame(aligned)
+
+def align_datasets(cso_df, sps_a1_df, sps_a2_df, rainfall_df, overrides=None, use_cache=True):
+    """
+    Build (or load from output/cache) the aligned CSO / pump / rainfall frame used by all cross-dataset
+    checks and plots.
+
+    :param overrides: Optional dictionary mapping a source name to {'direction': ..., 'tolerance': ...}
+                      to override DEFAULT_ALIGNMENT
+    :param use_cache: Reuse a cached frame built from identical inputs and settings
+    :return: Aligned DataFrame (see build_aligned_frame)
+    """
+    frames = {'CSO': cso_df, 'SPS_A1': sps_a1_df, 'SPS_A2': sps_a2_df, 'Rainfall': rainfall_df}
+    sources = {}
+    for name, df in frames.items():
+        spec = dict(DEFAULT_ALIGNMENT[name])
+        spec.update((overrides or {}).get(name, {}))
+        sources[name] = spec
+
+    key = None
+    if use_cache:
+        key = fingerprint(*frames.values(), sources)
+        aligned = load_cached('aligned', key)
+        if aligned is not None:
+            return aligned
+
+    aligned = build_aligned_frame({name: dict(spec, df=frames[name]) for name, spec in sources.items()})
+
+    if use_cache:
+        save_cached('aligned', key, aligned)
+    return aligned
+
+def pump_activation_mask(aligned, pump_sources=('SPS_A1', 'SPS_A2')):
+    """
+    Flag the aligned rows at which any of the given pumps reported RUNNING (Status 1).
+
+    :param aligned: Aligned DataFrame from align_datasets
+    :param pump_sources: Names of the pump sources in the aligned frame
+    :return: Boolean mask over the aligned rows
+    """
+    mask = np.zeros(len(aligned), dtype=bool)
+    for name in pump_sources:
+        mask |= aligned[f'{name}_observed'].to_numpy() & (aligned[f'{name}_Status'].to_numpy() == 1)
+    return mask
@@ -0,0 +1,337 @@
+import json
+import mmap
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from normalise import NORMALISE_SETTINGS
+
+# Compact columnar archive for the four telemetry series (a few MB instead of a slow, large workbook).
+# It holds the data as loaded, only put in time order: duplicates and rows without a timestamp are kept, so
+# normalise.py reports and merges them the same way whether the data comes from the workbook or an archive.
+#
+# File layout: MAGIC, then the column buffers of every block, then a JSON footer, the footer length
+# (uint64, little endian) and MAGIC again. The footer lists each series' columns and blocks; every block
+# has its row count, time range, per-column min/max and the offset/length of each compressed buffer, so
+# a reader maps the file and decodes only the blocks that overlap the requested time range.
+#
+# Column encodings, chosen per block:
+#   time        first timestamp and first step in the block header, then the delta-of-deltas in units of
+#               their common divisor, zigzag, smallest unsigned type, zlib (regular sampling -> all zeros)
+#   bits        0/1 columns such as pump Status, packed 8 per byte
+#   dictionary  text such as Site/StateDesc as codes into a per-column dictionary
+#   quantised   floats with few decimals (Level, RG_A) as delta-encoded integers of value * 10^decimals
+#   xor         other floats: XOR with the previous value, byte planes shuffled, zlib (lossless)
+#   int         other integers and datetimes, delta encoded
+# Missing values are stored as a separate packed bitmap.
+MAGIC = b'TSARC001'
+ARCHIVE_SUFFIX = '.tsa'
+BLOCK_ROWS = 65536
+MAX_DECIMALS = 6
+
+SERIES_NAMES = ('CSO', 'SPS_A1', 'SPS_A2', 'Rainfall')
+
+def _zigzag(values):
+    # Signed to unsigned so small negative deltas stay small: 0, -1, 1, -2 -> 0, 1, 2, 3
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+def _unzigzag(values):
+    values = values.astype(np.uint64)
+    return ((values >> np.uint64(1)).view(np.int64)) ^ -((values & np.uint64(1)).view(np.int64))
+
+def _pack_uints(values):
+    """
+    Store unsigned integers in the smallest type that holds them, then zlib.
+
+    :return: Tuple of (compressed bytes, numpy type name)
+    """
+    top = int(values.max()) if len(values) else 0
+    dtype = next(dtype for dtype in ('uint8', 'uint16', 'uint32', 'uint64') if top <= np.iinfo(dtype).max)
+    return zlib.compress(values.astype(dtype).tobytes()), dtype
+
+def _unpack_uints(buffer, dtype):
+    return np.frombuffer(zlib.decompress(buffer), dtype=dtype).astype(np.uint64)
+
+def _deltas(ints, order):
+    # First value kept as is, then differences
+    for _ in range(order):
+        ints = np.diff(ints, prepend=np.int64(0))
+    return ints
+
+def _undeltas(ints, order):
+    for _ in range(order):
+        ints = np.cumsum(ints, dtype=np.int64)
+    return ints
+
+def _fill_missing(ints, valid):
+    # Missing entries repeat the previous valid value, so they add no deltas
+    if valid is None or valid.all():
+        return ints
+    positions = np.maximum.accumulate(np.where(valid, np.arange(len(ints)), 0))
+    filled = ints[positions]
+    filled[~valid & (np.cumsum(valid) == 0)] = 0 # Before the first valid value
+    return filled
+
+def _encode_column(values, is_time):
+    """
+    Encode one block of one column.
+
+    :return: Tuple of (metadata dictionary, list of buffers); the metadata refers to the buffers by position
+    """
+    valid = ~pd.isna(values)
+    meta, buffers = {}, []
+    if not valid.all():
+        meta['nulls'] = len(buffers)
+        buffers.append(zlib.compress(np.packbits(valid).tobytes()))
+
+    if is_time:
+        # Only the changes in the sampling step are packed, so regular sampling packs to zeros in one byte each
+        ints = _fill_missing(values.astype('datetime64[ns]').view(np.int64), valid)
+        steps = np.diff(ints)
+        changes = np.diff(steps)
+        scale = int(np.gcd.reduce(changes)) if len(changes) else 0
+        data, dtype = _pack_uints(_zigzag(changes // (scale or 1)))
+        meta.update(encoding='time', first=int(ints[0]), step=int(steps[0]) if len(steps) else 0, scale=scale or 1,
+                    type=dtype, data=len(buffers))
+        buffers.append(data)
+        return meta, buffers
+
+    kind = values.dtype.kind
+    if kind in 'biuf' and np.isin(values[valid], (0, 1)).all():
+        meta.update(encoding='bits', data=len(buffers))
+        buffers.append(zlib.compress(np.packbits(values == 1).tobytes()))
+    elif kind == 'f':
+        quantised = _quantise(values, valid)
+        if quantised is not None:
+            ints, decimals = quantised
+            data, dtype = _pack_uints(_zigzag(_deltas(_fill_missing(ints, valid), 1)))
+            meta.update(encoding='quantised', decimals=decimals, type=dtype, data=len(buffers))
+        else:
+            bits = values.view(np.uint64)
+            xored = bits ^ np.concatenate(([np.uint64(0)], bits[:-1]))
+            data = zlib.compress(np.ascontiguousarray(xored.view(np.uint8).reshape(-1, 8).T).tobytes())
+            meta.update(encoding='xor', data=len(buffers))
+        buffers.append(data)
+    elif kind in 'iuM' or kind == 'm':
+        ints = values.astype('datetime64[ns]' if kind == 'M' else 'timedelta64[ns]' if kind == 'm' else np.int64).view(np.int64)
+        data, dtype = _pack_uints(_zigzag(_deltas(_fill_missing(ints, valid), 1)))
+        meta.update(encoding='int', type=dtype, data=len(buffers))
+        buffers.append(data)
+    else:
+        raise ValueError(f"Cannot encode column of dtype {values.dtype}")
+    return meta, buffers
+
+def _quantise(values, valid):
+    """
+    Find the fewest decimals that represent every value exactly (as value * 10^decimals integers).
+
+    :return: Tuple of (int64 array, decimals), or None if the values need more than MAX_DECIMALS
+    """
+    present = values[valid]
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** decimals
+        ints = np.round(present * scale)
+        if (np.abs(ints) < 2 ** 53).all() and (ints / scale == present).all():
+            result = np.zeros(len(values), dtype=np.int64)
+            result[valid] = ints.astype(np.int64)
+            return result, decimals
+    return None
+
+def _decode_column(meta, buffers, rows, dtype):
+    """
+    Decode one block of one column back to a numpy array of the stored dtype.
+    """
+    encoding = meta['encoding']
+    data = buffers[meta.get('data', 0)]
+    if encoding == 'time':
+        changes = _unzigzag(_unpack_uints(data, meta['type'])).view(np.int64) * meta['scale']
+        steps = _undeltas(np.concatenate(([meta['step']], changes)), 1)
+        values = (meta['first'] + np.concatenate(([0], np.cumsum(steps))))[:rows].view('datetime64[ns]')
+    elif encoding == 'bits':
+        values = np.unpackbits(np.frombuffer(zlib.decompress(data), dtype=np.uint8), count=rows).astype(np.float64)
+    elif encoding == 'quantised':
+        values = _undeltas(_unzigzag(_unpack_uints(data, meta['type'])).view(np.int64), 1) / 10.0 ** meta['decimals']
+    elif encoding == 'xor':
+        xored = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(8, -1).T.copy().view(np.uint64).ravel()
+        values = np.bitwise_xor.accumulate(xored).view(np.float64)
+    elif encoding == 'int':
+        values = _undeltas(_unzigzag(_unpack_uints(data, meta['type'])).view(np.int64), 1)
+        if dtype.startswith('datetime64'):
+            values = values.view('datetime64[ns]') # Stored as nanoseconds whatever the original unit
+        elif dtype.startswith('timedelta64'):
+            values = values.view('timedelta64[ns]')
+    elif encoding == 'dictionary':
+        codes = _unpack_uints(data, meta['type']).astype(np.int64)
+        return codes # Looked up against the column dictionary by the caller
+    else:
+        raise ValueError(f"Unknown column encoding '{encoding}'")
+
+    if 'nulls' in meta:
+        valid = np.unpackbits(np.frombuffer(zlib.decompress(buffers[meta['nulls']]), dtype=np.uint8), count=rows).astype(bool)
+        if values.dtype.kind in 'Mm':
+            values[~valid] = np.datetime64('NaT') if values.dtype.kind == 'M' else np.timedelta64('NaT')
+        else:
+            values = values.astype(np.float64)
+            values[~valid] = np.nan
+    return values
+
+def _is_text(series):
+    return (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+            or isinstance(series.dtype, pd.CategoricalDtype))
+
+def write_archive(path, datasets, block_rows=BLOCK_ROWS):
+    """
+    Write the telemetry series to an archive file. Each series is stored in time order (a stable sort, only
+    when needed, with rows without a timestamp last), so blocks cover consecutive time ranges. Nothing else
+    is changed: normalise the data after reading it, as after extract.load_data.
+
+    :param path: Output file, conventionally with ARCHIVE_SUFFIX
+    :param datasets: Dictionary mapping a series name (see SERIES_NAMES) to its DataFrame, as loaded
+    :param block_rows: Rows per block; smaller blocks make time-range reads more selective
+    :return: Dictionary mapping series names to their compressed size in bytes
+    """
+    path = Path(path)
+    footer = {'version': 2, 'series': {}}
+    sizes = {}
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for name, df in datasets.items():
+            time_col = NORMALISE_SETTINGS[name]['time_col']
+            times = pd.to_datetime(df[time_col]).to_numpy(dtype='datetime64[ns]')
+            if len(times) > 1 and not ((times[1:] >= times[:-1]) | np.isnat(times[1:])).all():
+                order = np.argsort(times, kind='stable') # NaT sorts last
+                df, times = df.iloc[order], times[order]
+            timed = times[~np.isnat(times)]
+
+            columns = []
+            arrays = {}
+            for column in df.columns:
+                spec = {'name': str(column), 'dtype': str(df[column].dtype)}
+                if column == time_col:
+                    arrays[column] = times
+                elif _is_text(df[column]):
+                    codes, uniques = pd.factorize(df[column])
+                    if not all(isinstance(value, str) for value in uniques):
+                        raise ValueError(f"{name}.{column} mixes text with other types and cannot be dictionary encoded")
+                    spec['dictionary'] = list(uniques)
+                    arrays[column] = codes.astype(np.int64) + 1 # 0 = missing
+                else:
+                    arrays[column] = df[column].to_numpy()
+                columns.append(spec)
+
+            blocks = []
+            start_offset = f.tell()
+            for lo in range(0, len(df), block_rows):
+                hi = min(lo + block_rows, len(df))
+                # No time range for a block of rows without a timestamp; only reads of the whole series include it
+                in_block = timed[lo:hi]
+                block = {'rows': hi - lo, 't_min': int(in_block[0].view(np.int64)) if len(in_block) else None,
+                         't_max': int(in_block[-1].view(np.int64)) if len(in_block) else None, 'columns': []}
+                for spec in columns:
+                    values = arrays[spec['name']][lo:hi]
+                    if 'dictionary' in spec:
+                        data, dtype = _pack_uints(values.astype(np.uint64))
+                        meta, buffers = {'encoding': 'dictionary', 'type': dtype, 'data': 0}, [data]
+                    else:
+                        meta, buffers = _encode_column(values, spec['name'] == time_col)
+                        if values.dtype.kind in 'iuf' and not np.isnan(values.astype(float)).all():
+                            meta['min'], meta['max'] = float(np.nanmin(values)), float(np.nanmax(values))
+                    meta['buffers'] = []
+                    for buffer in buffers:
+                        meta['buffers'].append([f.tell(), len(buffer)])
+                        f.write(buffer)
+                    block['columns'].append(meta)
+                blocks.append(block)
+
+            sizes[name] = f.tell() - start_offset
+            footer['series'][name] = {'time_col': time_col, 'rows': len(df), 'columns': columns, 'blocks': blocks}
+
+        footer_bytes = json.dumps(footer, separators=(',', ':')).encode('utf-8')
+        f.write(footer_bytes)
+        f.write(struct.pack('<Q', len(footer_bytes)))
+        f.write(MAGIC)
+    tmp_path.replace(path)
+    return sizes
+
+def _read_footer(mapped):
+    if len(mapped) < 2 * len(MAGIC) + 8 or mapped[:len(MAGIC)] != MAGIC or mapped[-len(MAGIC):] != MAGIC:
+        raise ValueError("Not a telemetry archive (bad magic)")
+    footer_length = struct.unpack('<Q', mapped[-len(MAGIC) - 8:-len(MAGIC)])[0]
+    footer_end = len(mapped) - len(MAGIC) - 8
+    return json.loads(mapped[footer_end - footer_length:footer_end])
+
+def archive_info(path):
+    """
+    :param path: Archive file
+    :return: The archive footer (series, columns and block headers), without reading any data
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return _read_footer(mapped)
+
+def _read_series(mapped, series, start, end):
+    time_col = series['time_col']
+    start_ns = pd.Timestamp(start).as_unit('ns').value if start is not None else None
+    end_ns = pd.Timestamp(end).as_unit('ns').value if end is not None else None
+
+    # Only the blocks whose time range overlaps [start, end] are decompressed
+    windowed = start is not None or end is not None
+    blocks = [block for block in series['blocks'] if not windowed or (block['t_min'] is not None
+              and (start_ns is None or block['t_max'] >= start_ns) and (end_ns is None or block['t_min'] <= end_ns))]
+
+    data = {}
+    for i, spec in enumerate(series['columns']):
+        parts = []
+        for block in blocks:
+            meta = block['columns'][i]
+            buffers = [mapped[offset:offset + length] for offset, length in meta['buffers']]
+            parts.append(_decode_column(meta, buffers, block['rows'], spec['dtype']))
+        if 'dictionary' in spec:
+            codes = np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+            lookup = np.array([np.nan] + spec['dictionary'], dtype=object)
+            values = pd.Series(lookup[codes], name=spec['name'])
+        elif spec['name'] == time_col:
+            values = pd.Series(np.concatenate(parts) if parts else np.array([], dtype='datetime64[ns]'), name=spec['name'])
+        else:
+            values = pd.Series(np.concatenate(parts) if parts else np.array([], dtype=np.float64), name=spec['name'])
+        if values.dtype.kind == 'f' and spec['dtype'].startswith(('int', 'uint', 'bool')) and values.isna().any():
+            data[spec['name']] = values # Missing values: keep as float, like pandas would
+        else:
+            data[spec['name']] = values.astype(spec['dtype'])
+    df = pd.DataFrame(data)
+
+    if not windowed:
+        return df
+
+    # Trim the partial blocks at either end, and the rows without a timestamp (stored last)
+    df = df[df[time_col].notna()]
+    times = df[time_col]
+    lo = times.searchsorted(pd.Timestamp(start), side='left') if start is not None else 0
+    hi = times.searchsorted(pd.Timestamp(end), side='right') if end is not None else len(df)
+    return df.iloc[lo:hi].reset_index(drop=True)
+
+def read_series(path, name, start=None, end=None):
+    """
+    Read one series from an archive, decoding only the blocks that overlap the time range.
+
+    :param path: Archive file
+    :param name: Series name (see SERIES_NAMES)
+    :param start: First timestamp to include (None = from the start)
+    :param end: Last timestamp to include (None = to the end)
+    :return: DataFrame with the original columns and dtypes
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return _read_series(mapped, _read_footer(mapped)['series'][name], start, end)
+
+def read_archive(path, start=None, end=None):
+    """
+    Read all four series from an archive (see read_series).
+
+    :return: Tuple of (cso_df, sps_a1_df, sps_a2_df, rainfall_df), like extract.load_data
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        footer = _read_footer(mapped)
+        return tuple(_read_series(mapped, footer['series'][name], start, end) for name in SERIES_NAMES)
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from data_quality import find_spill_events
+from rainfall import STORM_SETTINGS, antecedent_rainfall, segment_storms
+
+# A spill is attributed to every storm that was raining at, or ended at most catchment_lag_hours before,
+# the start of the spill. Spills with no such storm are 'no_storm' spills; they are dry-weather spills if
+# at most dry_weather_max_mm of rain (showers too small to be a storm) fell in the lag window either.
+ATTRIBUTION_SETTINGS = {
+    'catchment_lag_hours': 12,
+    'dry_weather_max_mm': 0.0
+}
+
+def _ns(values):
+    return pd.to_datetime(pd.Series(values)).to_numpy(dtype='datetime64[ns]')
+
+def storm_windows(storms, lag_hours):
+    """
+    Interval index of the storms: the time range in which a spill can start and still be caused by each storm.
+    Storms from segment_storms are disjoint and in time order, so both window bounds are sorted.
+
+    :param storms: DataFrame from rainfall.segment_storms
+    :param lag_hours: Catchment lag, how long after the rain stops a spill can still be caused by it
+    :return: Tuple of (window starts, window ends) as datetime64 arrays
+    """
+    if not np.isfinite(lag_hours) or lag_hours < 0:
+        raise ValueError(f"The catchment lag must be a number of hours >= 0, got {lag_hours}")
+    starts, ends = _ns(storms['start_time']), _ns(storms['end_time'])
+    return starts, ends + np.timedelta64(int(lag_hours * 3600e9), 'ns')
+
+def match_spills_to_storms(spill_starts, window_starts, window_ends):
+    """
+    Sorted interval join: for each spill, the range of storms whose window contains its start.
+    Two binary searches per spill, so the join costs O((spills + storms) log storms) however far the
+    events reach.
+
+    :param spill_starts: Spill start times (datetime64 array)
+    :param window_starts: Sorted window starts from storm_windows
+    :param window_ends: Sorted window ends from storm_windows
+    :return: Tuple of (first, last) storm positions per spill; the spill matches storms first..last-1 (none if equal)
+    """
+    last = np.searchsorted(window_starts, spill_starts, side='right') # Storms that started by the spill start
+    first = np.searchsorted(window_ends, spill_starts, side='left') # Skip storms whose window closed before it
+    return first, np.maximum(first, last)
+
+def attribute_spills(spill_events, storms, rainfall_df, settings=ATTRIBUTION_SETTINGS):
+    """
+    Link each spill event to the rain that preceded it.
+
+    :param spill_events: DataFrame from data_quality.find_spill_events
+    :param storms: DataFrame from rainfall.segment_storms
+    :param rainfall_df: pandas DataFrame containing rainfall data (in time order), for the rain in the lag window
+    :param settings: Attribution settings (see ATTRIBUTION_SETTINGS)
+    :return: Copy of spill_events with storm_count, storm_id (the most recent storm), storm_start, storm_end,
+             storm_depth_mm, attributed_depth_mm (all matched storms), hours_since_rain, rain_<lag>h_mm (all
+             rain in the lag window), no_storm and dry_weather
+    """
+    lag_hours = settings['catchment_lag_hours']
+    spill_starts = _ns(spill_events['start_time'])
+    window_starts, window_ends = storm_windows(storms, lag_hours)
+    first, last = match_spills_to_storms(spill_starts, window_starts, window_ends)
+
+    storm_count = last - first
+    matched = storm_count > 0
+    latest = np.where(matched, last - 1, 0) # Most recent matching storm, only read where matched
+    depths = storms['depth_mm'].to_numpy(dtype=float)
+    cumulative_depth = np.concatenate(([0.0], np.cumsum(depths)))
+
+    def latest_storm(values, missing):
+        values = np.asarray(values)
+        return np.where(matched, values[latest], missing) if len(values) else np.full(len(spill_starts), missing)
+
+    storm_ends = latest_storm(_ns(storms['end_time']), np.datetime64('NaT', 'ns'))
+
+    attributed = spill_events.copy()
+    attributed['storm_count'] = storm_count
+    attributed['storm_id'] = pd.Series(latest_storm(storms['storm_id'].to_numpy(dtype=np.int64), 0), index=attributed.index,
+                                       dtype='Int64').mask(~matched)
+    attributed['storm_start'] = latest_storm(_ns(storms['start_time']), np.datetime64('NaT', 'ns'))
+    attributed['storm_end'] = storm_ends
+    attributed['storm_depth_mm'] = latest_storm(depths, np.nan)
+    attributed['attributed_depth_mm'] = cumulative_depth[last] - cumulative_depth[first]
+    # 0 when the spill started while it was still raining
+    attributed['hours_since_rain'] = np.maximum((spill_starts - storm_ends) / np.timedelta64(1, 'h'), 0)
+    # All rain in the lag window, including showers too small to count as a storm
+    lag_rain = antecedent_rainfall(rainfall_df, spill_starts, f'{lag_hours:g}h')
+    attributed[f'rain_{lag_hours:g}h_mm'] = lag_rain
+    attributed['no_storm'] = ~matched
+    attributed['dry_weather'] = ~matched & (np.round(lag_rain, 6) <= settings['dry_weather_max_mm']) # Rounded, as it is a difference of running totals
+    return attributed
+
+def storm_spill_counts(storms, spill_events, settings=ATTRIBUTION_SETTINGS):
+    """
+    Reverse lookup: how many spills each storm is linked to. A spill matching several storms counts for each.
+
+    :param storms: DataFrame from rainfall.segment_storms
+    :param spill_events: DataFrame from data_quality.find_spill_events (or attribute_spills)
+    :param settings: Attribution settings (see ATTRIBUTION_SETTINGS)
+    :return: Copy of storms with 'spill_count' and 'caused_spill' columns
+    """
+    first, last = match_spills_to_storms(_ns(spill_events['start_time']), *storm_windows(storms, settings['catchment_lag_hours']))
+
+    # Each spill adds 1 to its range of storms: +1 at the first, -1 after the last, then a running sum
+    counts = np.zeros(len(storms) + 1, dtype=np.int64)
+    np.add.at(counts, first, 1)
+    np.add.at(counts, last, -1)
+
+    linked = storms.copy()
+    linked['spill_count'] = np.cumsum(counts)[:-1]
+    linked['caused_spill'] = linked['spill_count'] > 0
+    return linked
+
+def analyse_spill_attribution(cso_df, rainfall_df, threshold=43.0, settings=ATTRIBUTION_SETTINGS, storm_settings=STORM_SETTINGS):
+    """
+    Attribute every CSO spill event to the storms that caused it and flag dry-weather spills, a strong sign
+    of a false spill (sensor fault or blockage rather than storm overflow). Spills after rain too light to
+    count as a storm are only counted as no_storm.
+
+    :param cso_df: pandas DataFrame containing CSO data (in time order, see normalise.py)
+    :param rainfall_df: pandas DataFrame containing rainfall data (in time order)
+    :param threshold: Level threshold for spill events (in meters)
+    :param settings: Attribution settings (see ATTRIBUTION_SETTINGS)
+    :param storm_settings: Storm settings (see rainfall.STORM_SETTINGS)
+    :return: Dictionary containing the per-spill 'events' table, the 'storms' table with spill counts and
+             summary counts
+    """
+    lag_hours = settings['catchment_lag_hours']
+    spill_events = find_spill_events(cso_df['DateTime'].to_numpy(), cso_df['Level'].to_numpy(), threshold)
+    storms = segment_storms(rainfall_df, storm_settings)
+
+    events = attribute_spills(spill_events, storms, rainfall_df, settings)
+    storms = storm_spill_counts(storms, events, settings)
+
+    no_storm_count = int(events['no_storm'].sum())
+    dry_count = int(events['dry_weather'].sum())
+    result = {
+        'catchment_lag_hours': lag_hours,
+        'spill_count': len(events),
+        'no_storm_count': no_storm_count,
+        'dry_weather_count': dry_count,
+        'storm_count': len(storms),
+        'storms_with_spills': int(storms['caused_spill'].sum()),
+        'events': events,
+        'storms': storms
+    }
+    if no_storm_count:
+        return dict(result, status='warning',
+                    message=f'Found {no_storm_count} of {len(events)} spill events with no storm in the {lag_hours:g} hours before '
+                            f'({dry_count} in dry weather).')
+    return dict(result, status='ok', message=f'All {len(events)} spill events follow a storm within {lag_hours:g} hours.')
@@ -0,0 +1,200 @@
+import functools
+import hashlib
+import inspect
+import json
+import importlib.util
+import pickle
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = Path('output/cache')
+
+# DataFrame digests already computed in this run, by id (dropped when the frame is garbage collected).
+# Loaded frames are not modified afterwards, so a frame passed to many plots is only hashed once.
+_frame_digests = {}
+
+def _frame_digest(frame):
+    memo = _frame_digests.get(id(frame))
+    if memo is not None and memo[0]() is frame:
+        return memo[1]
+    digest = hashlib.sha256(pd.util.hash_pandas_object(frame, index=True).values.tobytes())
+    digest.update(repr(list(zip(frame.columns, frame.dtypes.astype(str)))).encode())
+    key = id(frame)
+    _frame_digests[key] = (weakref.ref(frame, lambda _: _frame_digests.pop(key, None)), digest.digest())
+    return digest.digest()
+
+def _update_digest(digest, part):
+    if isinstance(part, pd.DataFrame):
+        digest.update(_frame_digest(part))
+    elif isinstance(part, pd.Series):
+        digest.update(pd.util.hash_pandas_object(part, index=True).values.tobytes())
+        digest.update(repr((part.name, str(part.dtype))).encode())
+    elif isinstance(part, np.ndarray):
+        # repr() abbreviates large arrays, so hash the data itself
+        digest.update(repr((part.dtype.str, part.shape)).encode())
+        digest.update(repr(part.tolist()).encode() if part.dtype.hasobject else np.ascontiguousarray(part).tobytes())
+    elif isinstance(part, (dict, list, tuple)):
+        # Containers element by element, so DataFrames and arrays inside them are hashed by content too
+        digest.update(f'{type(part).__name__}:{len(part)}'.encode())
+        for item in (part.items() if isinstance(part, dict) else part):
+            _update_digest(digest, item)
+    else:
+        digest.update(repr(part).encode())
+    digest.update(b'\x00') # Separator so ('ab', 'c') and ('a', 'bc') hash differently
+
+def fingerprint(*parts):
+    """
+    Build a stable hash of the given inputs, used as a cache key.
+    DataFrames and numpy arrays are hashed by content (values, index, column names, dtypes and shape), also
+    inside dicts, lists and tuples; everything else by repr. A DataFrame is hashed once per run, so it must
+    not be modified in place after it has been fingerprinted.
+
+    :param parts: DataFrames, Series, arrays or plain Python values
+    :return: Hex digest string
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        _update_digest(digest, part)
+    return digest.hexdigest()
+
+def load_cached(name, key, cache_dir=CACHE_DIR):
+    """
+    Load a cached object if it was stored under the same key.
+
+    :param name: Cache entry name (file stem in cache_dir)
+    :param key: Expected cache key, usually from fingerprint()
+    :param cache_dir: Directory holding the cache files
+    :return: The cached object, or None if missing or stale
+    """
+    path = Path(cache_dir) / f'{name}.pkl'
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+    except Exception:
+        return None # Corrupt or incompatible cache file, treat as a miss
+    if entry.get('key') != key:
+        return None
+    return entry['value']
+
+def save_cached(name, key, value, cache_dir=CACHE_DIR):
+    """
+    Store an object in the cache under the given key, replacing any previous entry.
+
+    :param name: Cache entry name (file stem in cache_dir)
+    :param key: Cache key, usually from fingerprint()
+    :param value: Picklable object to store
+    :param cache_dir: Directory holding the cache files
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f'{name}.pkl'
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'key': key, 'value': value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp_path.replace(path) # Atomic swap so a crashed run never leaves a half-written cache
+
+# Figure cache: skip re-rendering a plot whose inputs, arguments and code are unchanged
+FIGURE_MANIFEST = CACHE_DIR / 'figure_manifest.json'
+
+# Modules that draw and write figures for the plot functions; their source is part of every figure key
+FIGURE_CODE_MODULES = ('rendering',)
+
+_figure_cache = {'force': False, 'rendered': 0, 'skipped': 0}
+
+def set_force_render(force):
+    """
+    Render every figure even if the figure cache has a matching PNG (main.py --force).
+
+    :param force: True to ignore the figure cache for the rest of the run
+    """
+    _figure_cache['force'] = force
+
+def figure_cache_stats():
+    """
+    :return: Dictionary with the number of figures rendered and skipped so far in this run
+    """
+    return {'rendered': _figure_cache['rendered'], 'skipped': _figure_cache['skipped']}
+
+def _load_manifest():
+    try:
+        with open(FIGURE_MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(manifest):
+    FIGURE_MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = FIGURE_MANIFEST.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    tmp_path.replace(FIGURE_MANIFEST)
+
+def figure_code_version(source_file):
+    """
+    Hash of the code behind a figure: the module drawing it plus FIGURE_CODE_MODULES.
+
+    :param source_file: Source file of the module drawing the figure
+    :return: Hex digest string
+    """
+    digest = hashlib.sha256()
+    for source in [source_file] + [importlib.util.find_spec(name).origin for name in FIGURE_CODE_MODULES]:
+        digest.update(Path(source).read_bytes())
+    return digest.hexdigest()
+
+def cached_figure(plot_func=None, derived=()):
+    """
+    Decorator for plot functions that write PNGs. The call is skipped (and its previous return value
+    returned) when every output file exists and the manifest holds the same key for it. The key covers
+    the content of every argument, DataFrames included, and the source of the module defining the plot and
+    of FIGURE_CODE_MODULES, so editing the plotting or rendering code re-renders its figures.
+
+    Arguments whose name ends in 'output_path' are treated as the files the plot writes.
+
+    :param derived: Names of optional arguments that only save the plot recomputing something from its other
+                    arguments (e.g. counts from an earlier analysis). They draw the same figure, so they are
+                    left out of the key. Use as @cached_figure(derived=(...)).
+    """
+    if plot_func is None:
+        return functools.partial(cached_figure, derived=derived)
+    signature = inspect.signature(plot_func)
+    code_version = figure_code_version(inspect.getsourcefile(plot_func))
+
+    @functools.wraps(plot_func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        output_paths = [str(value) for name, value in bound.arguments.items() if name.endswith('output_path')]
+
+        parts = [plot_func.__module__, plot_func.__qualname__, code_version]
+        for name, value in bound.arguments.items():
+            if name not in derived:
+                parts.extend([name, value])
+        key = fingerprint(*parts)
+
+        manifest = _load_manifest()
+        if output_paths and not _figure_cache['force'] and all(manifest.get(path, {}).get('key') == key and Path(path).exists()
+                                              for path in output_paths):
+            cached = load_cached(key, key, CACHE_DIR / 'figures')
+            if cached is not None:
+                _figure_cache['skipped'] += 1
+                return cached['result']
+
+        result = plot_func(*args, **kwargs)
+        _figure_cache['rendered'] += 1
+
+        save_cached(key, key, {'result': result}, CACHE_DIR / 'figures')
+        manifest = _load_manifest() # Re-read in case another plot updated it meanwhile
+        for path in output_paths:
+            previous = manifest.get(path, {}).get('key')
+            if previous and previous != key:
+                (CACHE_DIR / 'figures' / f'{previous}.pkl').unlink(missing_ok=True) # Drop the stale return value
+            manifest[path] = {'key': key, 'function': plot_func.__qualname__}
+        _save_manifest(manifest)
+        return result
+
+    return wrapper
@@ -1,5 +1,12 @@
+import numpy as np
 import pandas as pd
 
+from alignment import pump_activation_mask
+from normalise import check_time_order
+from rainfall import analyse_rainfall_events
+from pump_cycles import analyse_pump_cycles, pump_runs, simultaneous_run_overlap
+from rules import DEFAULT_RULES, compile_rules, evaluate_rules
+
 def check_missing_values(df):
     """
     Check for missing values in the dataset.
@@ -46,35 +53,35 @@ def check_variable_ranges(df, column_ranges):
                          Format: {'column_name': (min_value, max_value)}
     :return: Dictionary containing range check results
     """
-    results = {}
-    
-    for column, (min_val, max_val) in column_ranges.items():
-        # Check if columns exist in the df
-        if column not in df.columns:
-            results[column] = {
-                'status': 'error',
-                'message': f'Column {column} not found in DataFrame'
-            }
-            continue
-        
-        # Count values outside range
-        values_below_min = len(df[df[column] < min_val])
-        values_above_max = len(df[df[column] > max_val])
-        
-        if values_below_min > 0 or values_above_max > 0:
-            results[column] = {
-                'status': 'warning',
-                'message': f'Values outside range [{min_val}, {max_val}] found',
-                'below_min_count': values_below_min,
-                'above_max_count': values_above_max
-            }
-        else:
-            results[column] = {
-                'status': 'ok',
-                'message': 'All values are within expected range'
-            }
+    return evaluate_rules(df, compile_rules({'ranges': column_ranges}))['variable_ranges']
+
+# OLD - PRENDING UPDATE/REMOVAL
+def create_missing_values_table(analyses):
+    """
+    Create a formatted table of missing values across all datasets.
     
-    return results
+    :param analyses: Dictionary containing analysis results for each dataset
+    :return: DataFrame containing the formatted table
+    """
+    # Create a list to store the data
+    data = []
+    
+    # Add data for each dataset
+    for dataset_name, analysis in analyses.items():
+        total_missing = analysis['missing_values']['Missing Values'].sum()
+        data.append({
+            'Dataset': dataset_name,
+            'Missing Values': total_missing
+        })
+    
+    # Create DataFrame and format it
+    df = pd.DataFrame(data)
+    df = df.set_index('Dataset')
+    
+    # Save to CSV
+    df.to_csv('output/tables/missing_values_summary.csv')
+    
+    return df
 
 def analyse_temporal_coverage(df, datetime_col):
     """
@@ -146,11 +153,191 @@ def check_sps_status_consistency(df):
             'message': 'Status and StateDesc columns are consistent'
         }
 
-def analyse_cso_data(cso_df):
+# Sensor fault check settings. Sample counts assume 1 minute CSO and 15 minute rainfall readings.
+CSO_FAULT_SETTINGS = {
+    'flatline_max_run': 180, # Level identical for more than 3 hours = stuck sensor
+    'flatline_ignore': (),
+    'spike_window': 31, # Rolling median over +/- 15 minutes
+    'spike_n_mads': 5.0,
+    'spike_min_deviation': 0.5, # metres, so sensor noise on a flat signal (MAD ~ 0) is not flagged
+    'max_rate_per_hour': 60.0 # metres per hour, i.e. 1m between consecutive 1 minute readings
+}
+
+RAINFALL_FAULT_SETTINGS = {
+    'flatline_max_run': 16, # Same non-zero reading for more than 4 hours
+    'flatline_ignore': (0,), # Dry weather is a legitimate flatline
+    'spike_window': 9, # Rolling median over +/- 1 hour
+    'spike_n_mads': 5.0,
+    'spike_min_deviation': 5.0, # mm
+    'max_rate_per_hour': 100.0 # mm per hour
+}
+
+def _time_ordered(df, datetime_col, value_col):
+    """
+    Get timestamps and values as arrays. The data must already be in time order (see normalise.py).
+    
+    :return: Tuple of (datetime64 array, float array)
+    """
+    times = pd.to_datetime(df[datetime_col]).to_numpy(dtype='datetime64[ns]')
+    check_time_order(times, f"The '{value_col}' series")
+    return times, df[value_col].to_numpy(dtype=float)
+
+def check_flatline(times, values, max_run, ignore_values=()):
+    """
+    Find flatlines: runs of identical consecutive readings longer than max_run samples.
+    Runs are found in one pass from the positions where the value changes.
+    
+    :param times: Sorted datetime64 array of reading times
+    :param values: Array of readings matching times
+    :param max_run: Longest acceptable run of identical readings (in samples)
+    :param ignore_values: Values allowed to repeat indefinitely (e.g. 0 for rainfall)
+    :return: Dictionary containing flatline check results
+    """
+    n = len(values)
+    if n == 0:
+        return {'status': 'ok', 'message': 'No data to check for flatlines', 'run_count': 0,
+                'flagged_samples': 0, 'longest_run': 0, 'runs': pd.DataFrame()}
+    
+    # A run starts wherever the value differs from the previous reading (NaN always starts a new run)
+    run_starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    run_lengths = np.diff(np.append(run_starts, n))
+    
+    flagged = (run_lengths > max_run) & ~np.isin(values[run_starts], ignore_values)
+    starts = run_starts[flagged]
+    lengths = run_lengths[flagged]
+    
+    runs = pd.DataFrame({
+        'start_time': times[starts],
+        'end_time': times[starts + lengths - 1],
+        'value': values[starts],
+        'samples': lengths
+    })
+    
+    if len(runs):
+        return {
+            'status': 'warning',
+            'message': f'Found {len(runs)} flatline runs longer than {max_run} samples ({lengths.sum():,} readings)',
+            'run_count': len(runs),
+            'flagged_samples': int(lengths.sum()),
+            'longest_run': int(lengths.max()),
+            'runs': runs
+        }
+    return {
+        'status': 'ok',
+        'message': f'No flatline runs longer than {max_run} samples',
+        'run_count': 0,
+        'flagged_samples': 0,
+        'longest_run': 0,
+        'runs': runs
+    }
+
+def spike_mask(values, window, n_mads=5.0, min_deviation=0.0):
+    """
+    Flag readings further than n_mads robust standard deviations (1.4826 * MAD) from the centred rolling
+    median. Rolling medians are computed by pandas' compiled rolling window code. A reading's flag only
+    depends on the readings within 2 * window of it.
+    
+    :return: Tuple of (boolean spike array, rolling median array)
+    """
+    series = pd.Series(values)
+    rolling_median = series.rolling(window, center=True, min_periods=1).median()
+    deviation = (series - rolling_median).abs()
+    mad = deviation.rolling(window, center=True, min_periods=1).median()
+    
+    is_spike = (deviation > np.maximum(n_mads * 1.4826 * mad, min_deviation)).to_numpy()
+    return is_spike, rolling_median.to_numpy()
+
+def check_spikes(times, values, window, n_mads=5.0, min_deviation=0.0):
+    """
+    Find spikes: readings further than n_mads robust standard deviations (1.4826 * MAD) from the
+    centred rolling median (see spike_mask).
+    
+    :param times: Sorted datetime64 array of reading times
+    :param values: Array of readings matching times
+    :param window: Rolling window size (in samples, centred)
+    :param n_mads: Number of robust standard deviations that counts as a spike
+    :param min_deviation: Smallest deviation from the median that can count as a spike
+    :return: Dictionary containing spike check results
+    """
+    return spike_result(times, values, *spike_mask(values, window, n_mads, min_deviation))
+
+def spike_result(times, values, is_spike, rolling_median):
+    """
+    Build the check_spikes result from the spike flags and rolling medians of every reading.
+    
+    :return: Dictionary containing spike check results
+    """
+    spikes = pd.DataFrame({
+        'time': times[is_spike],
+        'value': values[is_spike],
+        'rolling_median': rolling_median[is_spike]
+    })
+    
+    spike_count = len(spikes)
+    spike_percentage = (spike_count / len(values)) * 100 if len(values) else 0.0
+    return {
+        'status': 'warning' if spike_count else 'ok',
+        'message': f'Found {spike_count} spikes ({spike_percentage:.2f}%)' if spike_count else 'No spikes found',
+        'spike_count': spike_count,
+        'spike_percentage': spike_percentage,
+        'spikes': spikes
+    }
+
+def check_rate_of_change(times, values, max_rate_per_hour):
+    """
+    Find physically impossible jumps between consecutive readings.
+    
+    :param times: Sorted datetime64 array of reading times
+    :param values: Array of readings matching times
+    :param max_rate_per_hour: Largest plausible change per hour (in the units of values)
+    :return: Dictionary containing rate of change check results
+    """
+    hours = np.diff(times).astype('timedelta64[ns]').astype(float) / 3.6e12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(hours > 0, np.diff(values) / hours, np.nan) # Repeated timestamps have no rate
+    
+    too_fast = np.abs(rates) > max_rate_per_hour # NaN compares False
+    positions = np.flatnonzero(too_fast)
+    violations = pd.DataFrame({
+        'time': times[positions + 1],
+        'previous_value': values[positions],
+        'value': values[positions + 1],
+        'rate_per_hour': rates[positions]
+    })
+    
+    violation_count = len(violations)
+    return {
+        'status': 'warning' if violation_count else 'ok',
+        'message': (f'Found {violation_count} changes faster than {max_rate_per_hour:g}/hour' if violation_count
+                    else f'All changes within {max_rate_per_hour:g}/hour'),
+        'violation_count': violation_count,
+        'max_rate': float(np.nanmax(np.abs(rates))) if np.isfinite(rates).any() else 0.0,
+        'violations': violations
+    }
+
+def check_sensor_faults(df, datetime_col, value_col, settings):
+    """
+    Run the flatline, spike and rate of change checks on one sensor series.
+    
+    :param df: pandas DataFrame containing the data
+    :param datetime_col: Name of the column containing datetime values
+    :param value_col: Name of the column containing the sensor readings
+    :param settings: Check settings, e.g. CSO_FAULT_SETTINGS
+    :return: Dictionary with 'flatline', 'spikes' and 'rate_of_change' results
+    """
+    times, values = _time_ordered(df, datetime_col, value_col)
+    return {
+        'flatline': check_flatline(times, values, settings['flatline_max_run'], settings['flatline_ignore']),
+        'spikes': check_spikes(times, values, settings['spike_window'], settings['spike_n_mads'], settings['spike_min_deviation']),
+        'rate_of_change': check_rate_of_change(times, values, settings['max_rate_per_hour'])
+    }
+
+def analyse_cso_data(cso_df, rules=None):
     """
     Analyse CSO data quality.
     
     :param cso_df: pandas DataFrame containing CSO data
+    :param rules: Compiled rules from rules.load_rules (default: DEFAULT_RULES['CSO'])
     :return: Dictionary containing various analysis results
     """
     # Check missing values and data types
@@ -165,27 +352,34 @@ def analyse_cso_data(cso_df):
     IQR = Q3 - Q1
     outliers = cso_df[(cso_df['Level'] < (Q1 - 1.5 * IQR)) | (cso_df['Level'] > (Q3 + 1.5 * IQR))] # Needed to use bitwise or
     
-    # Check variable ranges
-    level_ranges = check_variable_ranges(cso_df, {'Level': (0, 100)}) # Assuming level should be between 0 and 100m
+    # Check variable ranges and the other data quality rules
+    rule_checks = evaluate_rules(cso_df, rules or compile_rules(DEFAULT_RULES['CSO'], 'CSO'))
     
     # Analyse temporal coverage
     temporal = analyse_temporal_coverage(cso_df, 'DateTime')
     
+    # Check for stuck sensor, spikes and impossible jumps
+    sensor_faults = check_sensor_faults(cso_df, 'DateTime', 'Level', CSO_FAULT_SETTINGS)
+    
     return {
         'missing_values': missing_values,
         'duplicates': duplicates,
         'outlier_count': len(outliers),
         'outlier_percentage': (len(outliers) / len(cso_df)) * 100,
-        'variable_ranges': level_ranges,
-        'temporal_coverage': temporal
+        'variable_ranges': rule_checks['variable_ranges'],
+        'cross_column': rule_checks['cross_column'],
+        'temporal_coverage': temporal,
+        'sensor_faults': sensor_faults
     }
 
-def analyse_sps_data(sps_df, dataset_name):
+def analyse_sps_data(sps_df, dataset_name, paired_sps_df=None, rules=None):
     """
     Analyse SPS data quality.
     
     :param sps_df: pandas DataFrame containing SPS data
     :param dataset_name: Name of the SPS dataset (e.g., 'SPS_A1' or 'SPS_A2')
+    :param paired_sps_df: Optional SPS data of the other pump station, for simultaneous-run overlap
+    :param rules: Compiled rules from rules.load_rules (default: DEFAULT_RULES[dataset_name])
     :return: Dictionary containing various analysis results
     """
     # Check missing values and data types
@@ -200,8 +394,8 @@ def analyse_sps_data(sps_df, dataset_name):
     # Analyse status changes
     status_changes = sps_df.groupby('Site')['Status'].value_counts()
     
-    # Check variable ranges
-    status_ranges = check_variable_ranges(sps_df, {'Status': (0, 1), 'StateDesc': ('RUNNING', 'STOPPED')})
+    # Check variable ranges, allowed states and the Status/StateDesc rule
+    rule_checks = evaluate_rules(sps_df, rules or compile_rules(DEFAULT_RULES[dataset_name], dataset_name))
     
     # Standardise datetime
     sps_df['Timestamp'] = pd.to_datetime(sps_df['Timestamp'])
@@ -209,20 +403,32 @@ def analyse_sps_data(sps_df, dataset_name):
     # Analyse temporal coverage
     temporal = analyse_temporal_coverage(sps_df, 'Timestamp')
     
-    return {
+    # Pump runs, duty cycle and short-cycling from the status transitions
+    pump_cycles = analyse_pump_cycles(sps_df)
+    
+    results = {
         'missing_values': missing_values,
         'duplicates': duplicates,
         'status_consistency': status_consistency,
         'status_changes': status_changes,
-        'variable_ranges': status_ranges,
-        'temporal_coverage': temporal
+        'variable_ranges': rule_checks['variable_ranges'],
+        'cross_column': rule_checks['cross_column'],
+        'temporal_coverage': temporal,
+        'pump_cycles': pump_cycles
     }
+    
+    # Time both stations were running at once
+    if paired_sps_df is not None:
+        results['simultaneous_runs'] = simultaneous_run_overlap(pump_cycles['runs'], pump_runs(paired_sps_df))
+    
+    return results
 
-def analyse_rainfall_data(rainfall_df):
+def analyse_rainfall_data(rainfall_df, rules=None):
     """
     Analyse rainfall data quality.
     
     :param rainfall_df: pandas DataFrame containing rainfall data
+    :param rules: Compiled rules from rules.load_rules (default: DEFAULT_RULES['Rainfall'])
     :return: Dictionary containing various analysis results
     """
     # Check missing values and data types
@@ -235,80 +441,152 @@ def analyse_rainfall_data(rainfall_df):
     zero_rainfall = (rainfall_df['RG_A'] == 0).sum()
     zero_rainfall_pct = (zero_rainfall / len(rainfall_df)) * 100
     
-    # Check variable ranges
-    rainfall_ranges = check_variable_ranges(rainfall_df, {'RG_A': (0, 100)}) # Assuming rainfall should be between 0 and 100mm
+    # Check variable ranges and the other data quality rules
+    rule_checks = evaluate_rules(rainfall_df, rules or compile_rules(DEFAULT_RULES['Rainfall'], 'Rainfall'))
     
     # Analyse temporal coverage
     temporal = analyse_temporal_coverage(rainfall_df, 'time')
     
+    # Check for stuck gauge, spikes and impossible jumps
+    sensor_faults = check_sensor_faults(rainfall_df, 'time', 'RG_A', RAINFALL_FAULT_SETTINGS)
+    
+    # Rolling accumulations and storm events
+    storm_events = analyse_rainfall_events(rainfall_df)
+    
     return {
         'missing_values': missing_values,
         'duplicates': duplicates,
         'zero_rainfall_count': zero_rainfall,
         'zero_rainfall_percentage': zero_rainfall_pct,
-        'variable_ranges': rainfall_ranges,
-        'temporal_coverage': temporal
+        'variable_ranges': rule_checks['variable_ranges'],
+        'cross_column': rule_checks['cross_column'],
+        'temporal_coverage': temporal,
+        'sensor_faults': sensor_faults,
+        'storm_events': storm_events
     }
 
-# TODO: MAKE THIS LESS UGLY. Too many return blocks :/
-def detect_potential_false_spills(cso_df, sps_df, threshold=43.0, window_hours=6):
+# High readings more than this many hours apart belong to separate spill events
+SPILL_EVENT_GAP_HOURS = 1
+
+def analyse_spill_events(df, datetime_col, level_col, threshold):
     """
-    Detect potential false spill events in CSO data.
+    Summarise CSO spill events (readings at or above the spill threshold).
     
-    A false spill event is defined as:
-    1. CSO level exceeding the threshold
-    2. Pump activation shortly after
-    3. Level dropping without remaining high
+    :param df: pandas DataFrame containing the data
+    :param datetime_col: Name of the column containing datetime values
+    :param level_col: Name of the column containing level values
+    :param threshold: Level threshold for spill events (in meters)
+    :return: Dictionary containing spill event statistics
+    """
+    spill_events = df[df[level_col] >= threshold]
+    
+    return {
+        'total_spills': len(spill_events),
+        'spill_dates': pd.to_datetime(spill_events[datetime_col]).dt.date.nunique(),
+        'max_level': spill_events[level_col].max(),
+        'avg_level': spill_events[level_col].mean()
+    }
+
+def find_spill_events(times, levels, threshold, gap_hours=SPILL_EVENT_GAP_HOURS):
+    """
+    Group readings at or above the spill threshold into spill events.
+    A new event starts whenever two consecutive high readings are more than gap_hours apart.
     
-    :param cso_df: DataFrame containing CSO level data
-    :param sps_df: DataFrame containing pump status data
+    :param times: Sorted datetime64 array of reading times
+    :param levels: Array of levels matching times
     :param threshold: Level threshold for spill events (in meters)
-    :param window_hours: Time window to look for pump activation after level exceeds threshold
-    :return: Dictionary containing detected false spill events
+    :param gap_hours: Gap between high readings that separates two events
+    :return: DataFrame with one row per event: start_time, end_time, max_level
     """
-    # Ensure datetime columns are properly formatted
-    cso_df['DateTime'] = pd.to_datetime(cso_df['DateTime'])
-    sps_df['Timestamp'] = pd.to_datetime(sps_df['Timestamp'])
+    times = np.asarray(times, dtype='datetime64[ns]')
+    levels = np.asarray(levels, dtype=float)
+    high = levels >= threshold
+    high_times = times[high]
+    high_levels = levels[high]
+    
+    if len(high_times) == 0:
+        return pd.DataFrame({'start_time': pd.Series(dtype='datetime64[ns]'),
+                             'end_time': pd.Series(dtype='datetime64[ns]'),
+                             'max_level': pd.Series(dtype=float)})
+    
+    # Event boundaries are where the gap to the previous high reading exceeds gap_hours
+    new_event = np.concatenate(([True], np.diff(high_times) > np.timedelta64(int(gap_hours * 3600e9), 'ns')))
+    starts = np.flatnonzero(new_event)
+    ends = np.concatenate((starts[1:], [len(high_times)])) - 1
     
-    # Find periods where level exceeds threshold
-    high_level_periods = cso_df[cso_df['Level'] >= threshold].copy()
+    return pd.DataFrame({
+        'start_time': high_times[starts],
+        'end_time': high_times[ends],
+        'max_level': np.maximum.reduceat(high_levels, starts)
+    })
+
+def classify_spill_events(aligned, spill_events, threshold=43.0, window_hours=6, pump_sources=('SPS_A1', 'SPS_A2')):
+    """
+    Decide for each spill event whether it looks like a false spill: a pump activation within window_hours
+    of the start, and the level back below the threshold for the 24 hours after that window.
+    
+    :param aligned: Aligned CSO / pump frame covering the events plus window_hours + 24 hours after them
+    :param spill_events: DataFrame from find_spill_events
+    :param threshold: Level threshold for spill events (in meters)
+    :param window_hours: Time window to look for pump activation after level exceeds threshold
+    :param pump_sources: Pump sources in the aligned frame to look for activations in
+    :return: Copy of spill_events with 'false_spill' and 'pump_activation_time' columns
+    """
+    # CSO readings and pump activations, both already in time order
+    cso_rows = aligned['CSO_observed'].to_numpy()
+    cso_times = aligned['DateTime'].to_numpy()[cso_rows]
+    cso_levels = aligned['CSO_Level'].to_numpy(dtype=float)[cso_rows]
+    pump_times = aligned['DateTime'].to_numpy()[pump_activation_mask(aligned, pump_sources)]
+    
+    # Look for pump activation within window_hours after the start of each spill event
+    window = np.timedelta64(int(window_hours * 3600e9), 'ns')
+    starts = spill_events['start_time'].to_numpy()
+    pump_window_ends = starts + window
+    first_pump = np.searchsorted(pump_times, starts, side='left')
+    has_pump = first_pump < len(pump_times)
+    has_pump[has_pump] = pump_times[first_pump[has_pump]] <= pump_window_ends[has_pump]
+    
+    # Readings in the 24 hours after the pump window
+    after_start = np.searchsorted(cso_times, pump_window_ends, side='right')
+    after_end = np.searchsorted(cso_times, pump_window_ends + np.timedelta64(24, 'h'), side='right')
+    
+    false_spill = np.zeros(len(spill_events), dtype=bool)
+    for i in np.flatnonzero(has_pump & (after_end > after_start)):
+        # This looks like a false spill - level exceeded threshold, pumps activated, level dropped.
+        # Missing levels are skipped, as Series.max() does; a window of only missing levels counts as empty.
+        level_after_pump = cso_levels[after_start[i]:after_end[i]]
+        level_after_pump = level_after_pump[~np.isnan(level_after_pump)]
+        false_spill[i] = len(level_after_pump) > 0 and np.max(level_after_pump) < threshold
+    
+    activation_times = np.full(len(spill_events), np.datetime64('NaT'), dtype='datetime64[ns]')
+    activation_times[has_pump] = pump_times[first_pump[has_pump]]
+    
+    classified = spill_events.copy()
+    classified['false_spill'] = false_spill
+    classified['pump_activation_time'] = activation_times
+    return classified
+
+# TODO: MAKE THIS LESS UGLY. Too many return blocks :/
+def false_spill_result(classified_events):
+    """
+    Build the detect_potential_false_spills result from classified spill events.
     
-    if high_level_periods.empty:
+    :param classified_events: DataFrame from classify_spill_events (may be empty)
+    :return: Dictionary containing detected false spill events
+    """
+    if classified_events.empty:
         return {
             'status': 'ok', # Used to differentiate between false spills and normal spills. ok = normal
             'message': 'No periods found where CSO level exceeds the threshold.',
             'false_spills': []
         }
     
-    # Group into 1 hour periods, i.e, only 1 spill event per hour.
-    high_level_periods['group'] = (high_level_periods['DateTime'].diff() > pd.Timedelta(hours=1)).cumsum()
-    
-    # For each spill event, check if pumps were activated shortly after
-    potential_false_spills = []
-    
-    for _, period in high_level_periods.groupby('group'):
-        start_time = period['DateTime'].min()
-        end_time = period['DateTime'].max()
-        
-        # Look for pump activation within window_hours after a spill event
-        pump_window_start = start_time
-        pump_window_end = start_time + pd.Timedelta(hours=window_hours)
-        
-        # Check if any pumps were activated during this window
-        pumps_activated = sps_df[(sps_df['Timestamp'] >= pump_window_start) & (sps_df['Timestamp'] <= pump_window_end) & (sps_df['Status'] == 1)]
-        
-        if not pumps_activated.empty:
-            # Check if level dropped within 24 hours of pump activation
-            level_after_pump = cso_df[(cso_df['DateTime'] > pump_window_end) & (cso_df['DateTime'] <= pump_window_end + pd.Timedelta(hours=24))]
-            
-            if not level_after_pump.empty and level_after_pump['Level'].max() < threshold:
-                # This looks like a false spill - level exceeded threshold, pumps activated, level dropped
-                potential_false_spills.append({
-                    'start_time': start_time,
-                    'end_time': end_time,
-                    'max_level': period['Level'].max(),
-                    'pump_activation_time': pumps_activated['Timestamp'].min()
-                })
+    potential_false_spills = [{
+        'start_time': pd.Timestamp(event.start_time),
+        'end_time': pd.Timestamp(event.end_time),
+        'max_level': event.max_level,
+        'pump_activation_time': pd.Timestamp(event.pump_activation_time)
+    } for event in classified_events[classified_events['false_spill']].itertuples()]
     
     if potential_false_spills:
         return {
@@ -321,4 +599,26 @@ def detect_potential_false_spills(cso_df, sps_df, threshold=43.0, window_hours=6
             'status': 'ok',
             'message': 'No potential false spill events found.',
             'false_spills': []
-        } 
\ No newline at end of file
+        }
+
+def detect_potential_false_spills(aligned, threshold=43.0, window_hours=6, pump_sources=('SPS_A1', 'SPS_A2')):
+    """
+    Detect potential false spill events in CSO data.
+    
+    A false spill event is defined as:
+    1. CSO level exceeding the threshold
+    2. Pump activation shortly after
+    3. Level dropping without remaining high
+    
+    :param aligned: Aligned CSO / pump frame from alignment.align_datasets
+    :param threshold: Level threshold for spill events (in meters)
+    :param window_hours: Time window to look for pump activation after level exceeds threshold
+    :param pump_sources: Pump sources in the aligned frame to look for activations in
+    :return: Dictionary containing detected false spill events
+    """
+    cso_rows = aligned['CSO_observed'].to_numpy()
+    
+    # Group into 1 hour periods, i.e, only 1 spill event per hour.
+    spill_events = find_spill_events(aligned['DateTime'].to_numpy()[cso_rows], aligned['CSO_Level'].to_numpy(dtype=float)[cso_rows], threshold)
+    
+    return false_spill_result(classify_spill_events(aligned, spill_events, threshold, window_hours, pump_sources))
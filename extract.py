@@ -1,18 +1,70 @@
+from pathlib import Path
+
 import pandas as pd
 
-def load_data(file_path):
+from archive import ARCHIVE_SUFFIX, SERIES_NAMES, read_archive
+from cache import fingerprint, load_cached, save_cached
+from normalise import NORMALISE_SETTINGS
+
+def _time_window(datasets, start, end):
+    """
+    Keep the rows of each dataset with start <= time <= end (either bound may be None).
+    """
+    if start is None and end is None:
+        return datasets
+    windowed = []
+    for name, df in zip(SERIES_NAMES, datasets):
+        times = pd.to_datetime(df[NORMALISE_SETTINGS[name]['time_col']])
+        keep = pd.Series(True, index=df.index)
+        if start is not None:
+            keep &= times >= pd.Timestamp(start)
+        if end is not None:
+            keep &= times <= pd.Timestamp(end)
+        windowed.append(df[keep])
+    return tuple(windowed)
+
+def load_data(file_path, start=None, end=None):
     """
     Loads the CSO, sewage pump station (SPS), and rainfall (RG_A) data.
 
     Parameters:
-    - file_path: Path to the Excel file.
+    - file_path: Path to the Excel file, or to an archive written by archive.write_archive
+      (ARCHIVE_SUFFIX), which is much faster to read and only decodes the blocks in the time range.
+    - start, end: Optional time range to load (inclusive).
 
     Returns:
     - Tuple of (cso_df, sps_a1_df, sps_a2_df, rainfall_df)
     """
+    if Path(file_path).suffix == ARCHIVE_SUFFIX:
+        return read_archive(file_path, start, end)
+
     cso_df = pd.read_excel(file_path, sheet_name='CSO_A')
     sps_a1_df = pd.read_excel(file_path, sheet_name='SPS_A1')
     sps_a2_df = pd.read_excel(file_path, sheet_name='SPS_A2')
     rainfall_df = pd.read_excel(file_path, sheet_name='RG_A')
 
-    return cso_df, sps_a1_df, sps_a2_df, rainfall_df
\ No newline at end of file
+    return _time_window((cso_df, sps_a1_df, sps_a2_df, rainfall_df), start, end)
+
+def load_data_cached(file_path, use_cache=True, start=None, end=None):
+    """
+    Same as load_data, but keeps the parsed sheets in output/cache so repeated runs (and the query
+    service) skip the slow Excel parse until the workbook changes. Archives are read directly.
+
+    Parameters:
+    - file_path: Path to the Excel file or archive.
+    - use_cache: Set to False to always re-read the workbook (the cache is still refreshed).
+    - start, end: Optional time range to load (inclusive).
+
+    Returns:
+    - Tuple of (cso_df, sps_a1_df, sps_a2_df, rainfall_df)
+    """
+    if Path(file_path).suffix == ARCHIVE_SUFFIX:
+        return load_data(file_path, start, end)
+
+    stat = Path(file_path).stat()
+    key = fingerprint(str(Path(file_path).resolve()), stat.st_size, stat.st_mtime_ns)
+    datasets = load_cached('datasets', key) if use_cache else None
+    if datasets is None:
+        datasets = load_data(file_path)
+        save_cached('datasets', key, datasets)
+    return _time_window(datasets, start, end)
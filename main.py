@@ -1,42 +1,38 @@
+import time
+_START = time.perf_counter() # Taken before any heavy imports so startup can be measured against the budget
+
+import argparse
+import sys
 from pathlib import Path
 from extract import *
+from alignment import align_datasets
+from normalise import normalise_datasets, describe_normalisation
+from rainfall import segment_storms
+from attribution import analyse_spill_attribution
+from parallel import (analyse_cso_data_parallel, analyse_sps_data_parallel, analyse_rainfall_data_parallel,
+                      detect_potential_false_spills_parallel)
+from cache import set_force_render, figure_cache_stats
 from data_quality import *
-from visualisation import *
+from rules import load_rules
 import pandas as pd
 
-# TODO: CREATE APPROPRIATE CSV FILES RATHER THAN PRINTING. Target location: output/tables
-def main():
-    # Create output directories
-    Path('output/figures').mkdir(parents=True, exist_ok=True)
-    Path('output/tables').mkdir(parents=True, exist_ok=True)
-    
-    # Load data
-    print("Loading data...")
-    cso_df, sps_a1_df, sps_a2_df, rainfall_df = load_data("data/DataChallengeData2025.xlsx")
-    
-    # Analyse CSO data
-    print("\nAnalyzing CSO data...")
-    cso_analysis = analyse_cso_data(cso_df)
-    
-    # Analyse SPS data
-    print("Analyzing SPS_A1 data...")
-    sps_a1_analysis = analyse_sps_data(sps_a1_df, 'SPS_A1')
-    print("Analyzing SPS_A2 data...")
-    sps_a2_analysis = analyse_sps_data(sps_a2_df, 'SPS_A2')
-    
-    # Analyse rainfall data
-    print("Analyzing rainfall data...")
-    rainfall_analysis = analyse_rainfall_data(rainfall_df)
+DATA_PATH = 'data/DataChallengeData2025.xlsx'
+SPILL_THRESHOLD = 43.0
 
-    # Create missing values summary table
-    analyses = {
-        'CSO': cso_analysis,
-        'SPS_A1': sps_a1_analysis,
-        'SPS_A2': sps_a2_analysis,
-        'Rainfall': rainfall_analysis
-    }
-    missing_values_table = create_missing_values_table(analyses)
+# Startup budget (interpreter + imports) for the non-plotting subcommands, in seconds.
+# pandas alone costs ~0.3-0.4s here; matplotlib roughly doubles that, which is why
+# visualisation is only imported by the subcommands that draw something.
+# Check with: python main.py quality --timings  (or python -X importtime main.py quality)
+IMPORT_TIME_BUDGET = 1.0
+
+PLOTTING_MODULES = ('matplotlib', 'visualisation')
 
+def print_quality_report(analyses):
+    """
+    Print the data quality report for all datasets.
+
+    :param analyses: Dictionary mapping dataset names to their analysis results
+    """
     print("\n" + "="*80)
     print("DATA QUALITY REPORT")
     print("="*80)
@@ -44,16 +40,16 @@ def main():
     for dataset_name, analysis in analyses.items():
         print(f"\n{dataset_name} DATA QUALITY")
         print("-"*40)
-        
+
         # Missing values
         print("\nMISSING VALUES:")
         print(analysis['missing_values'])
-        
+
         # Duplicates
         duplicates = analysis.get('duplicates', {})
         if duplicates:
             print(f"\nDUPLICATES: {duplicates['duplicate_count']:,} records ({duplicates['duplicate_percentage']:.2f}%)")
-        
+
         # Variable ranges
         ranges = analysis.get('variable_ranges', {})
         if ranges:
@@ -66,18 +62,53 @@ def main():
                     if 'below_min_count' in result:
                         print(f"Values below min: {result['below_min_count']}")
                         print(f"Values above max: {result['above_max_count']}")
-        
+
+        # Rules linking two columns, e.g. Status and StateDesc
+        cross_column = analysis.get('cross_column', {})
+        if cross_column:
+            print("\nCROSS-COLUMN RULES:")
+            for name, result in cross_column.items():
+                print(f"{name}: {result['message']}")
+                for pair in result.get('violating_pairs', [])[:5]:
+                    print("  " + ", ".join(f"{key}={value}" for key, value in pair.items()))
+
         # Dataset-specific checks
         if dataset_name == 'CSO':
             print(f"\nOUTLIERS: {analysis['outlier_count']:,} records ({analysis['outlier_percentage']:.2f}%)")
-        
+
         elif dataset_name.startswith('SPS'):
             print("\nSTATUS CHANGES:")
             print(analysis['status_changes'])
-        
+
+            pump_cycles = analysis['pump_cycles']
+            print(f"\nPUMP CYCLES: {pump_cycles['message']}")
+            print(pump_cycles['site_summary'].round(2).T)
+            duty_cycle = pump_cycles['daily_duty_cycle']
+            if not duty_cycle.empty:
+                print(f"Mean daily duty cycle: {(duty_cycle.mean() * 100).round(2).to_dict()} (%)")
+            if 'simultaneous_runs' in analysis:
+                overlap = analysis['simultaneous_runs']
+                print(f"Simultaneous running with other station: {overlap['overlap_count']:,} periods, "
+                      f"{overlap['overlap_hours']:.2f} hours ({overlap['overlap_percentage']:.2f}% of running time)")
+
         elif dataset_name == 'Rainfall':
             print(f"\nZERO RAINFALL: {analysis['zero_rainfall_count']:,} records ({analysis['zero_rainfall_percentage']:.2f}%)")
-        
+
+            storm_events = analysis['storm_events']
+            print("\nMAX ROLLING ACCUMULATION (mm):")
+            print("  " + ", ".join(f"{window}: {total:.1f}" for window, total in storm_events['max_accumulations'].items()))
+            print(f"\nSTORM EVENTS: {storm_events['storm_count']:,}")
+            if storm_events['storm_count']:
+                print(storm_events['storms'].sort_values('depth_rank').head(5)[
+                    ['start_time', 'duration_hours', 'depth_mm', 'peak_intensity_mm_h', 'antecedent_72h_mm']].to_string(index=False, float_format='{:.2f}'.format))
+
+        # Rolling-window sensor fault checks
+        sensor_faults = analysis.get('sensor_faults', {})
+        if sensor_faults:
+            print("\nSENSOR FAULTS:")
+            for check, result in sensor_faults.items():
+                print(f"  {check}: {result['message']}")
+
         # Temporal coverage
         temporal = analysis.get('temporal_coverage', {})
         if temporal:
@@ -87,80 +118,345 @@ def main():
             print(f"  Total Days: {temporal['Total Days']}")
             print(f"  Days with Data: {temporal['Unique Days']}")
             print(f"  Missing Days: {temporal['Missing Dates']}")
-    
+
     print("\n" + "="*80)
-    
+
+# TODO: CREATE APPROPRIATE CSV FILES RATHER THAN PRINTING. Target location: output/tables
+def run_quality(cso_df, sps_a1_df, sps_a2_df, rainfall_df, workers=1, rules=None, raw_datasets=None):
+    """
+    Run the data quality analysis for every dataset and print the report.
+
+    :param workers: Worker processes for the time-partitioned analysis (1 = single pass, 0 = one per CPU)
+    :param rules: Compiled data quality rules from rules.load_rules (default: DEFAULT_RULES)
+    :param raw_datasets: The datasets as loaded, before normalisation merged their duplicates. Duplicates are
+                         counted on these when given.
+    :return: Dictionary mapping dataset names to their analysis results
+    """
+    rules = rules or load_rules()
+
+    # Analyse CSO data
+    if workers == 1:
+        print("\nAnalyzing CSO data...")
+        cso_analysis = analyse_cso_data(cso_df, rules['CSO'])
+
+        # Analyse SPS data
+        print("Analyzing SPS_A1 data...")
+        sps_a1_analysis = analyse_sps_data(sps_a1_df, 'SPS_A1', paired_sps_df=sps_a2_df, rules=rules['SPS_A1'])
+        print("Analyzing SPS_A2 data...")
+        sps_a2_analysis = analyse_sps_data(sps_a2_df, 'SPS_A2', paired_sps_df=sps_a1_df, rules=rules['SPS_A2'])
+
+        # Analyse rainfall data
+        print("Analyzing rainfall data...")
+        rainfall_analysis = analyse_rainfall_data(rainfall_df, rules['Rainfall'])
+    else:
+        # Same results, computed per month on a process pool
+        max_workers = workers or None
+        print(f"\nAnalyzing CSO data ({max_workers or 'all'} workers)...")
+        cso_analysis = analyse_cso_data_parallel(cso_df, max_workers=max_workers, rules=rules['CSO'])
+        print("Analyzing SPS_A1 data...")
+        sps_a1_analysis = analyse_sps_data_parallel(sps_a1_df, 'SPS_A1', paired_sps_df=sps_a2_df, max_workers=max_workers,
+                                                    rules=rules['SPS_A1'])
+        print("Analyzing SPS_A2 data...")
+        sps_a2_analysis = analyse_sps_data_parallel(sps_a2_df, 'SPS_A2', paired_sps_df=sps_a1_df, max_workers=max_workers,
+                                                    rules=rules['SPS_A2'])
+        print("Analyzing rainfall data...")
+        rainfall_analysis = analyse_rainfall_data_parallel(rainfall_df, max_workers=max_workers, rules=rules['Rainfall'])
+
+    # Create missing values summary table
+    analyses = {
+        'CSO': cso_analysis,
+        'SPS_A1': sps_a1_analysis,
+        'SPS_A2': sps_a2_analysis,
+        'Rainfall': rainfall_analysis
+    }
+
+    # Normalisation merges every duplicate row, so count them on the data as loaded
+    if raw_datasets is not None:
+        for name, raw_df in zip(analyses, raw_datasets):
+            analyses[name]['duplicates'] = check_duplicates(raw_df)
+
+    create_missing_values_table(analyses)
+
+    print_quality_report(analyses)
+
+    return analyses
+
+def run_spills(cso_df, aligned, workers=1, rainfall_df=None):
+    """
+    Compute CSO spill statistics, detect potential false spills and attribute spills to storms.
+
+    :param cso_df: CSO level data
+    :param aligned: Aligned CSO / pump / rainfall frame from align_datasets
+    :param rainfall_df: Rainfall data, for the storm attribution (skipped if not given)
+    :param workers: Worker processes for the time-partitioned detection (1 = single pass, 0 = one per CPU)
+    :return: Result dictionary from detect_potential_false_spills
+    """
+    print("Analysing CSO Spill Events...")
+    spill_stats = analyse_spill_events(cso_df, 'DateTime', 'Level', SPILL_THRESHOLD)
+
+    # Print spill statistics
+    print("\nCSO Spill Event Statistics:")
+    print(f"Total number of spill events: {spill_stats['total_spills']:,}")
+    print(f"Number of days with spills: {spill_stats['spill_dates']:,}")
+    print(f"Maximum level during spills: {spill_stats['max_level']:.2f}m")
+    print(f"Average level during spills: {spill_stats['avg_level']:.2f}m")
+
+    # Analyse potential false spill events
+    print("\nAnalysing potential false spill events...")
+    if workers == 1:
+        false_spills_result = detect_potential_false_spills(aligned, threshold=SPILL_THRESHOLD, window_hours=6)
+    else:
+        false_spills_result = detect_potential_false_spills_parallel(aligned, threshold=SPILL_THRESHOLD, window_hours=6,
+                                                                     max_workers=workers or None)
+
+    if false_spills_result['status'] == 'warning': # warning = false spill
+        print(f"Found {len(false_spills_result['false_spills'])} potential false spill events.")
+    else:
+        print(false_spills_result['message']) # For normal spills
+
+    # Which storm caused each spill, and which spills had no rain before them
+    if rainfall_df is not None:
+        print("\nAttributing spill events to storms...")
+        attribution = analyse_spill_attribution(cso_df, rainfall_df, threshold=SPILL_THRESHOLD)
+        print(f"{attribution['storms_with_spills']:,} of {attribution['storm_count']:,} storms caused a spill")
+        print(attribution['message'])
+        no_storm = attribution['events'][attribution['events']['no_storm']]
+        if not no_storm.empty:
+            print(no_storm[['start_time', 'end_time', 'max_level', f"rain_{attribution['catchment_lag_hours']:g}h_mm",
+                            'dry_weather']].to_string(index=False))
+        attribution['events'].to_csv('output/tables/spill_attribution.csv', index=False)
+
+    return false_spills_result
+
+def run_plots(cso_df, sps_a1_df, sps_a2_df, rainfall_df, aligned, false_spills_result=None, analyses=None):
+    """
+    Generate all figures in output/figures.
+
+    :param aligned: Aligned CSO / pump / rainfall frame from align_datasets
+    :param analyses: Output of run_quality, reused where a plot needs the same numbers (optional)
+    :param false_spills_result: Output of run_spills, recomputed (without printing the stats) if not given
+    """
+    # Imported here so the quality/spills subcommands never pay for matplotlib
+    from visualisation import (plot_sps_status_consistency, plot_distribution, plot_sps_status_distribution,
+                               plot_spill_events, plot_potential_false_spills, plot_rainfall_cso_correlation,
+                               plot_sps_cso_correlation, flush_figures)
+
     # # Create data type distribution visualisations
     # print("\nGenerating data type distribution visualisations...")
     # plot_data_types_distribution(cso_df, 'CSO Data Types', 'output/figures/cso_data_types.png')
     # plot_data_types_distribution(sps_a1_df, 'SPS_A1 Data Types', 'output/figures/sps_a1_data_types.png')
     # plot_data_types_distribution(sps_a2_df, 'SPS_A2 Data Types', 'output/figures/sps_a2_data_types.png')
     # plot_data_types_distribution(rainfall_df, 'Rainfall Data Types', 'output/figures/rainfall_data_types.png')
-    
+
     # Create SPS status consistency visualisations
     print("\nGenerating SPS status consistency visualisations...")
     plot_sps_status_consistency(sps_a1_df, 'SPS_A1', 'output/figures/sps_a1_status_consistency.png')
     plot_sps_status_consistency(sps_a2_df, 'SPS_A2', 'output/figures/sps_a2_status_consistency.png')
-    
+
     # Create distribution plots for each dataset
     plot_distribution(cso_df, 'Level', 'CSO Level Distribution', 'output/figures/cso_level_distribution.png')
     plot_distribution(rainfall_df, 'RG_A', 'Rainfall Distribution', 'output/figures/rainfall_distribution.png')
-    
+
     # Create SPS status distribution plots
-    plot_sps_status_distribution(sps_a1_df, 'SPS_A1 Status Distribution by Site', 'output/figures/sps_a1_status_distribution.png')
-    plot_sps_status_distribution(sps_a2_df, 'SPS_A2 Status Distribution by Site', 'output/figures/sps_a2_status_distribution.png')
-    
+    analyses = analyses or {}
+    plot_sps_status_distribution(sps_a1_df, 'SPS_A1 Status Distribution by Site', 'output/figures/sps_a1_status_distribution.png',
+                                 status_counts=analyses.get('SPS_A1', {}).get('status_changes'))
+    plot_sps_status_distribution(sps_a2_df, 'SPS_A2 Status Distribution by Site', 'output/figures/sps_a2_status_distribution.png',
+                                 status_counts=analyses.get('SPS_A2', {}).get('status_changes'))
+
     # Plot CSO spill events
-    print("Analysing CSO Spill Events...")
-    spill_stats = plot_spill_events(cso_df, 'DateTime', 'Level', 43.0,'CSO Spill Events (Level ≥ 43m)','output/figures/cso_spill_events.png')
-    
-    # Print spill statistics
-    print("\nCSO Spill Event Statistics:")
-    print(f"Total number of spill events: {spill_stats['total_spills']:,}")
-    print(f"Number of days with spills: {spill_stats['spill_dates']:,}")
-    print(f"Maximum level during spills: {spill_stats['max_level']:.2f}m")
-    print(f"Average level during spills: {spill_stats['avg_level']:.2f}m")
-    
-    # Analyse potential false spill events
-    print("\nAnalysing potential false spill events...")
-    # Combine SPS data from both sites
-    sps_combined = pd.concat([sps_a1_df, sps_a2_df])
-    
-    # Detect potential false spills
-    false_spills_result = detect_potential_false_spills(cso_df, sps_combined, threshold=43.0, window_hours=6)
-    
+    print("Plotting CSO Spill Events...")
+    plot_spill_events(cso_df, 'DateTime', 'Level', SPILL_THRESHOLD, f'CSO Spill Events (Level ≥ {SPILL_THRESHOLD:g}m)', 'output/figures/cso_spill_events.png')
+
+    if false_spills_result is None:
+        false_spills_result = detect_potential_false_spills(aligned, threshold=SPILL_THRESHOLD, window_hours=6)
+
     # Create visualisation for potential false spills
     if false_spills_result['status'] == 'warning': # warning = false spill
-        false_spills = false_spills_result['false_spills']
         plot_potential_false_spills(
-            cso_df, sps_combined, false_spills, threshold=43.0,
-            title="Potential False Spill Events (CSO Level > 43m with Pump Activation)",
+            aligned, false_spills_result['false_spills'], threshold=SPILL_THRESHOLD,
+            title=f"Potential False Spill Events (CSO Level > {SPILL_THRESHOLD:g}m with Pump Activation)",
             output_path="output/figures/potential_false_spills.png"
         )
-        print(f"Found {len(false_spills)} potential false spill events.")
-    else:
-        print(false_spills_result['message']) # For normal spills
-    
+
     # Plot rainfall vs CSO level correlation for a few days
     print("\nGenerating rainfall vs CSO level correlation plot...")
 
-    significant_rainfall = rainfall_df[rainfall_df['RG_A'] > 5.0]  # More than 5mm of rain
+    # Start the 5 day window just before the deepest storm, reusing the storm table from the quality run if there is one
+    storm_events = analyses.get('Rainfall', {}).get('storm_events')
+    storms = storm_events['storms'] if storm_events else segment_storms(rainfall_df)
 
-    # Find a 5 day period with significant rainfall
-    if not significant_rainfall.empty:
-        start_date = significant_rainfall['time'].iloc[0]
+    if not storms.empty:
+        deepest_storm = storms[storms['depth_rank'] == 1].iloc[0]
+        start_date = deepest_storm['start_time'] - pd.Timedelta(hours=12)
         end_date = start_date + pd.Timedelta(days=5)
-        
+
         # Create the plot
-        plot_rainfall_cso_correlation(cso_df, rainfall_df, start_date, end_date, 'Rainfall vs CSO Level Correlation', 'output/figures/rainfall_cso_correlation.png')
+        plot_rainfall_cso_correlation(aligned, start_date, end_date, 'Rainfall vs CSO Level Correlation', 'output/figures/rainfall_cso_correlation.png', threshold=SPILL_THRESHOLD)
 
         # Put these here for nice related plots
-        plot_sps_cso_correlation(cso_df, sps_a1_df, start_date, end_date,'SPS_A1 vs CSO Level Correlation', 'output/figures/sps_a1_cso_correlation.png')
-        plot_sps_cso_correlation(cso_df, sps_a2_df, start_date, end_date,'SPS_A2 vs CSO Level Correlation', 'output/figures/sps_a2_cso_correlation.png')
+        plot_sps_cso_correlation(aligned, 'SPS_A1', start_date, end_date,'SPS_A1 vs CSO Level Correlation', 'output/figures/sps_a1_cso_correlation.png', threshold=SPILL_THRESHOLD)
+        plot_sps_cso_correlation(aligned, 'SPS_A2', start_date, end_date,'SPS_A2 vs CSO Level Correlation', 'output/figures/sps_a2_cso_correlation.png', threshold=SPILL_THRESHOLD)
     else:
-        print("\nNo significant rainfall events found in the dataset.")
-    
+        print("\nNo storm events found in the dataset.")
+
+    # PNGs are encoded and written in the background while the next figure is drawn
+    flush_figures()
+    stats = figure_cache_stats()
+    print(f"\nFigures: {stats['rendered']} rendered, {stats['skipped']} unchanged (skipped)")
+
+def run_tiles(aligned, serve=False, port=8000, force=False):
+    """
+    Render the zoomable tile pyramid (CSO level, pump activations, rainfall) in output/tiles and
+    optionally serve the viewer.
+
+    :param aligned: Aligned CSO / pump / rainfall frame from align_datasets
+    :param serve: Serve output/tiles over HTTP after rendering
+    :param port: Port for the viewer
+    :param force: Re-render every tile, even if its buckets are unchanged
+    """
+    # Imported here for the same reason as visualisation in run_plots
+    from tiles import render_tiles, TILE_DIR
+
+    print("\nRendering time-series tiles...")
+    stats = render_tiles(aligned, threshold=SPILL_THRESHOLD, force=force)
+    print(f"Tiles: {stats['rendered']} rendered, {stats['skipped']} unchanged (skipped)")
+    print(f"Viewer: {TILE_DIR / 'index.html'}")
+
+    if serve:
+        from server import run, static_handler
+        run(static_handler(TILE_DIR), port=port)
+
+def run_archive(datasets, data_path, output_path=None):
+    """
+    Write the datasets to a compact archive that --data can read instead of the workbook. They are archived as
+    loaded (only sorted), so normalisation reports the same duplicates for the archive as for the workbook.
+
+    :param datasets: (cso_df, sps_a1_df, sps_a2_df, rainfall_df) as loaded, before normalisation
+    :param data_path: Path the data was loaded from
+    :param output_path: Archive path (default: data_path with ARCHIVE_SUFFIX)
+    """
+    from archive import write_archive, SERIES_NAMES, ARCHIVE_SUFFIX
+
+    output_path = Path(output_path or Path(data_path).with_suffix(ARCHIVE_SUFFIX))
+    print(f"\nWriting archive {output_path}...")
+    sizes = write_archive(output_path, dict(zip(SERIES_NAMES, datasets)))
+    for name, size in sizes.items():
+        print(f"  {name}: {size:,} bytes")
+    source_size, archive_size = Path(data_path).stat().st_size, output_path.stat().st_size
+    print(f"Archive: {archive_size:,} bytes ({source_size / archive_size:.1f}x smaller than {Path(data_path).name})")
+    print(f"Use it with: python main.py --data {output_path}")
+
+def print_timings(startup_seconds):
+    """
+    Print startup time against IMPORT_TIME_BUDGET and whether plotting libraries were loaded.
+
+    :param startup_seconds: Seconds from interpreter start of main.py until the data started loading
+    """
+    loaded = [name for name in PLOTTING_MODULES if name in sys.modules]
+    status = 'within' if startup_seconds <= IMPORT_TIME_BUDGET else 'OVER'
+    print(f"\nStartup: {startup_seconds:.3f}s ({status} budget of {IMPORT_TIME_BUDGET:.2f}s)")
+    print(f"Plotting libraries loaded: {', '.join(loaded) if loaded else 'none'}")
+
+def _common_options(defaults=True):
+    """
+    Options shared by every subcommand. They are accepted both before and after the subcommand, so the subcommand
+    copies have no defaults: otherwise they would overwrite an option given before it.
+    """
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--data', default=default(DATA_PATH), help=f'Path to the Excel workbook or a .tsa archive (default: {DATA_PATH})')
+    common.add_argument('--start', default=default(None), help='Only analyse data from this date/time on (e.g. 2017-11-01)')
+    common.add_argument('--end', default=default(None), help='Only analyse data up to this date/time (inclusive)')
+    common.add_argument('--timings', action='store_true', default=default(False), help='Report startup time against the import budget')
+    common.add_argument('--no-cache', action='store_true', default=default(False), help='Rebuild cached intermediates in output/cache')
+    common.add_argument('--workers', type=int, default=default(1),
+                        help='Worker processes for the quality and spill analyses, split by month (default: 1, 0 = one per CPU)')
+    common.add_argument('--force', action='store_true', default=default(False), help='Re-render every figure, even if its inputs are unchanged')
+    common.add_argument('--rules', default=default(None), help='JSON or YAML file of data quality rules, replacing the defaults per dataset')
+    return common
+
+def parse_args(argv=None):
+    common = _common_options(defaults=False)
+    parser = argparse.ArgumentParser(description='CSO, SPS and rainfall data analysis.', parents=[_common_options()])
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('quality', parents=[common], help='Data quality report only (no plotting imports)')
+    subparsers.add_parser('spills', parents=[common], help='Spill statistics and potential false spills (no plotting imports)')
+    subparsers.add_parser('plots', parents=[common], help='Generate the figures in output/figures')
+    subparsers.add_parser('all', parents=[common], help='Run everything (default)')
+    tiles = subparsers.add_parser('tiles', parents=[common], help='Render zoomable CSO / pump / rainfall tiles in output/tiles')
+    tiles.add_argument('--serve', action='store_true', help='Serve the tile viewer over HTTP after rendering')
+    tiles.add_argument('--port', type=int, default=8000, help='Port for --serve (default: 8000)')
+    archive = subparsers.add_parser('archive', parents=[common], help='Convert the workbook to a compact .tsa archive')
+    archive.add_argument('--output', help='Archive path (default: the --data path with a .tsa suffix)')
+    serve = subparsers.add_parser('serve', parents=[common], help='Long-running local query service (JSON over HTTP)')
+    serve.add_argument('--port', type=int, default=8001, help='Port to listen on (default: 8001)')
+    serve.add_argument('--cache-size', type=int, default=256, help='Number of query results kept in memory (default: 256)')
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args.command = 'all'
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    startup_seconds = time.perf_counter() - _START
+
+    set_force_render(args.force)
+
+    # Compiled once up front, so a bad rules file fails before the data is loaded
+    try:
+        rules = load_rules(args.rules)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Invalid rules file: {e}")
+
+    if args.command == 'serve':
+        # Loads the data itself and keeps it in memory until stopped
+        from service import run_service
+        run_service(args.data, port=args.port, cache_size=args.cache_size, use_cache=not args.no_cache, rules_path=args.rules)
+        return
+
+    # Create output directories
+    Path('output/figures').mkdir(parents=True, exist_ok=True)
+    Path('output/tables').mkdir(parents=True, exist_ok=True)
+
+    # Load data
+    print("Loading data...")
+    raw_datasets = load_data_cached(args.data, use_cache=not args.no_cache, start=args.start, end=args.end)
+
+    # Time order and one row per timestamp, which everything downstream relies on
+    datasets, normalisation = normalise_datasets(*raw_datasets)
+    print("\nTimestamp normalisation:")
+    for name, report in normalisation.items():
+        print(f"  {name}: {describe_normalisation(report)}")
+
+    if args.command == 'archive':
+        run_archive(raw_datasets, args.data, args.output)
+        return
+
+    analyses = None
+    if args.command in ('quality', 'all'):
+        analyses = run_quality(*datasets, workers=args.workers, rules=rules, raw_datasets=raw_datasets)
+
+    # One shared time-aligned frame for every cross-dataset check and plot (cached in output/cache)
+    aligned = None
+    if args.command in ('spills', 'plots', 'all', 'tiles'):
+        aligned = align_datasets(*datasets, use_cache=not args.no_cache)
+
+    false_spills_result = None
+    if args.command in ('spills', 'all'):
+        false_spills_result = run_spills(datasets[0], aligned, workers=args.workers, rainfall_df=datasets[3])
+    if args.command in ('plots', 'all'):
+        run_plots(*datasets, aligned, false_spills_result=false_spills_result, analyses=analyses)
+    if args.command == 'tiles':
+        run_tiles(aligned, serve=args.serve, port=args.port, force=args.force)
+
     print("\nAnalysis complete. Results saved to output directory.")
 
+    if args.timings:
+        print_timings(startup_seconds)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+DUPLICATE_POLICIES = ('first', 'last', 'mean', 'max')
+
+# How each dataset is normalised. Rows sharing the time and key columns are duplicates and are merged
+# with the policy: 'first'/'last' keep that whole row, 'mean'/'max' combine the numeric columns (other
+# columns keep the first row's value). Pump states are not averaged: the last reported state wins.
+NORMALISE_SETTINGS = {
+    'CSO': {'time_col': 'DateTime', 'key_cols': ('Site',), 'policy': 'mean'},
+    'SPS_A1': {'time_col': 'Timestamp', 'key_cols': ('Site',), 'policy': 'last'},
+    'SPS_A2': {'time_col': 'Timestamp', 'key_cols': ('Site',), 'policy': 'last'},
+    'Rainfall': {'time_col': 'time', 'key_cols': (), 'policy': 'max'}
+}
+
+def check_time_order(times, name='data'):
+    """
+    Raise if timestamps are not in ascending order. For code that relies on normalised input
+    (see normalise_timestamps) instead of re-sorting it.
+
+    :param times: datetime64 or int64 array
+    :param name: Dataset name for the error message
+    """
+    times = np.asarray(times)
+    if len(times) > 1 and not (times[1:] >= times[:-1]).all():
+        raise ValueError(f"{name} is not sorted by time. Run it through normalise.normalise_timestamps first.")
+
+def _equal_to(values, positions):
+    """
+    Compare every element with the element at positions (NaN and None count as equal to each other).
+    """
+    other = values[positions]
+    equal = values == other
+    if values.dtype.kind in 'fcOMm':
+        equal = equal | (pd.isna(values) & pd.isna(other))
+    return np.asarray(equal, dtype=bool)
+
+def normalise_timestamps(df, time_col, key_cols=(), policy='first'):
+    """
+    Put a dataset in time order with one row per timestamp (per key, e.g. per site), in vectorised passes.
+
+    Rows without a timestamp are dropped. The data is only sorted if it is not already in order (a stable
+    sort, so duplicates keep their original order for 'first'/'last'). Rows sharing a timestamp and key are
+    then merged with the duplicate policy.
+
+    :param df: pandas DataFrame to normalise
+    :param time_col: Name of the timestamp column
+    :param key_cols: Columns that, with the timestamp, identify a reading (missing columns are ignored)
+    :param policy: How duplicates are merged: 'first', 'last', 'mean' or 'max'
+    :return: Tuple of (normalised DataFrame with a fresh index, report dictionary)
+    """
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicate policy '{policy}', expected one of {', '.join(DUPLICATE_POLICIES)}")
+
+    rows_in = len(df)
+    times = pd.to_datetime(df[time_col]).to_numpy(dtype='datetime64[ns]')
+
+    # Rows without a timestamp cannot be placed on the timeline
+    missing_time = np.isnat(times)
+    if missing_time.any():
+        df, times = df[~missing_time], times[~missing_time]
+
+    # Only sort when some row is earlier than the one before it
+    out_of_order = int((times[1:] < times[:-1]).sum()) if len(times) > 1 else 0
+    order = np.argsort(times, kind='stable') if out_of_order else np.arange(len(times))
+
+    # Within a run of equal timestamps, group rows with the same key next to each other
+    key_cols = [column for column in key_cols if column in df.columns]
+    sorted_times = times[order]
+    group_key = np.cumsum(np.concatenate(([True], sorted_times[1:] != sorted_times[:-1]))) if len(order) else np.array([], dtype=np.int64)
+    if key_cols and len(order):
+        key_codes = pd.MultiIndex.from_frame(df[key_cols]).factorize()[0] if len(key_cols) > 1 else pd.factorize(df[key_cols[0]])[0]
+        group_key = group_key * (key_codes.max() + 2) + key_codes[order] + 1 # NaN keys (-1) form their own group
+        if (np.diff(group_key) < 0).any():
+            regroup = np.argsort(group_key, kind='stable')
+            order, group_key = order[regroup], group_key[regroup]
+
+    starts = np.flatnonzero(np.concatenate(([True], group_key[1:] != group_key[:-1]))) if len(order) else np.array([], dtype=np.intp)
+    ends = np.concatenate((starts[1:], [len(order)])) - 1
+    reordered = (np.diff(order) != 1).any() if len(order) > 1 else False
+    ordered = df.iloc[order] if reordered else df # Clean data is not copied
+
+    # Exact duplicates match the first row of their group in every column; anything else is a conflict
+    same_as_first = np.ones(len(order), dtype=bool)
+    conflicting = np.zeros(len(starts), dtype=bool)
+    if len(starts) < len(order):
+        group_of_row = np.repeat(np.arange(len(starts)), np.diff(np.concatenate((starts, [len(order)]))))
+        first_of_row = starts[group_of_row]
+        for column in ordered.columns:
+            same_as_first &= _equal_to(ordered[column].to_numpy(), first_of_row)
+        np.logical_or.at(conflicting, group_of_row, ~same_as_first)
+
+    if len(starts) == len(order):
+        normalised = ordered.reset_index(drop=True)
+    elif policy in ('first', 'mean', 'max'):
+        normalised = ordered.iloc[starts].reset_index(drop=True)
+    else:
+        normalised = ordered.iloc[ends].reset_index(drop=True)
+
+    if policy in ('mean', 'max') and len(starts) < len(order):
+        for column in ordered.columns:
+            if column == time_col or column in key_cols or ordered[column].dtype.kind not in 'iuf':
+                continue
+            values = ordered[column].to_numpy(dtype=float)
+            if policy == 'max':
+                combined = np.fmax.reduceat(values, starts) # Ignores NaN unless the whole group is NaN
+            else:
+                counts = np.add.reduceat(~np.isnan(values), starts)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    combined = np.add.reduceat(np.nan_to_num(values), starts) / counts
+                combined[counts == 0] = np.nan
+            normalised[column] = combined
+
+    report = {
+        'rows_in': rows_in,
+        'rows_out': len(normalised),
+        'missing_timestamps': int(missing_time.sum()),
+        'out_of_order': out_of_order,
+        'sorted': bool(out_of_order),
+        'duplicate_rows': len(order) - len(starts),
+        'exact_duplicate_rows': int(same_as_first.sum()) - len(starts), # First rows always match themselves
+        'conflicting_timestamps': int(conflicting.sum()),
+        'policy': policy
+    }
+    return normalised, report
+
+def normalise_datasets(cso_df, sps_a1_df, sps_a2_df, rainfall_df, settings=NORMALISE_SETTINGS):
+    """
+    Normalise all four datasets (see normalise_timestamps). Run between load_data and any analysis.
+
+    :param settings: Per-dataset time column, key columns and duplicate policy (see NORMALISE_SETTINGS)
+    :return: Tuple of ((cso_df, sps_a1_df, sps_a2_df, rainfall_df), dictionary of reports by dataset name)
+    """
+    frames = {'CSO': cso_df, 'SPS_A1': sps_a1_df, 'SPS_A2': sps_a2_df, 'Rainfall': rainfall_df}
+    normalised, reports = [], {}
+    for name, df in frames.items():
+        spec = settings[name]
+        df, reports[name] = normalise_timestamps(df, spec['time_col'], spec.get('key_cols', ()), spec.get('policy', 'first'))
+        normalised.append(df)
+    return tuple(normalised), reports
+
+def describe_normalisation(report):
+    """
+    :param report: Report from normalise_timestamps
+    :return: One-line summary of what normalisation changed
+    """
+    if report['rows_in'] == report['rows_out'] and not report['sorted']:
+        return f"{report['rows_in']:,} rows, already sorted with unique timestamps"
+    return (f"{report['rows_in']:,} -> {report['rows_out']:,} rows: "
+            f"{report['out_of_order']:,} out of order ({'sorted' if report['sorted'] else 'no sort needed'}), "
+            f"{report['duplicate_rows']:,} duplicate rows merged ({report['exact_duplicate_rows']:,} exact, "
+            f"{report['conflicting_timestamps']:,} timestamps with conflicting values, policy '{report['policy']}'), "
+            f"{report['missing_timestamps']:,} rows without a timestamp dropped")
@@ -0,0 +1,386 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from data_quality import (CSO_FAULT_SETTINGS, RAINFALL_FAULT_SETTINGS, SPILL_EVENT_GAP_HOURS, _time_ordered,
+                          check_flatline, check_rate_of_change, spike_mask, spike_result, find_spill_events,
+                          classify_spill_events, false_spill_result, analyse_cso_data, analyse_sps_data,
+                          analyse_rainfall_data)
+from pump_cycles import analyse_pump_cycles, pump_runs, simultaneous_run_overlap
+from rainfall import analyse_rainfall_events
+from rules import DEFAULT_RULES, compile_rules, count_rule_violations, merge_rule_counts, rule_results
+
+# Partition size, as a pandas period alias ('M' = calendar month)
+PARTITION_FREQ = 'M'
+
+# Time-partitioned versions of the analyse_* functions and detect_potential_false_spills.
+# Each partition produces a partial result that can be merged with any other (counts, day sets, row
+# positions and exact value-count sketches), so partitions run independently on a process pool and the
+# merged result is identical to the single-pass function. The spike check (two rolling medians, most of
+# the sensor fault cost) is partitioned too, each partition reading a halo of 2 * window readings on either
+# side. Checks that depend on reading order across the whole series (flatlines, rate of change, pump cycles,
+# storms) are single O(n) vectorised passes, a few percent of the work; they run as extra tasks on the same
+# pool instead of being split and stitched.
+
+def partition_positions(times, freq=PARTITION_FREQ):
+    """
+    Row positions of each time partition (ascending within a partition). Rows without a timestamp form
+    their own partition.
+
+    :param times: Datetime values of the rows
+    :param freq: Pandas period alias for the partition size
+    :return: List of position arrays
+    """
+    codes = pd.DatetimeIndex(times).to_period(freq).asi8 # NaT gets its own (minimum) code
+    order = np.argsort(codes, kind='stable') # Already in order for sorted data
+    boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+    return np.split(order, boundaries)
+
+def _run_tasks(tasks, max_workers):
+    """
+    Run (function, args) tasks on a process pool, or inline when there is nothing to parallelise.
+
+    :return: List of results in task order
+    """
+    if max_workers == 1 or len(tasks) <= 1:
+        return [func(*args) for func, args in tasks]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(func, *args) for func, args in tasks]
+        return [future.result() for future in futures]
+
+def _value_sketch(series):
+    """
+    Exact, mergeable sketch of a numeric column: its distinct values and how often each occurs.
+    Sensor readings are quantised, so this stays small however many rows there are.
+    """
+    values = series.to_numpy(dtype=float)
+    return np.unique(values[~np.isnan(values)], return_counts=True)
+
+def _merge_sketches(sketches):
+    values, inverse = np.unique(np.concatenate([values for values, _ in sketches]), return_inverse=True)
+    counts = np.zeros(len(values), dtype=np.int64)
+    np.add.at(counts, inverse, np.concatenate([counts for _, counts in sketches]))
+    return values, counts
+
+def _sketch_quantile(sketch, q):
+    """
+    Quantile from a value sketch, computed exactly as Series.quantile (numpy 'linear' method) would.
+    """
+    values, counts = sketch
+    n = counts.sum()
+    if n == 0:
+        return np.nan
+    cumulative = np.cumsum(counts)
+    virtual_index = (n - 1) * q # numpy's virtual index for the 'linear' method
+    previous_index = np.floor(virtual_index)
+    gamma = virtual_index - previous_index
+    below = values[np.searchsorted(cumulative, int(previous_index), side='right')]
+    above = values[np.searchsorted(cumulative, min(int(previous_index) + 1, n - 1), side='right')]
+
+    # numpy's _lerp, including its switch to the upper end for gamma >= 0.5
+    difference = above - below
+    if gamma >= 0.5:
+        return above - difference * (1 - gamma)
+    return below + difference * gamma
+
+def _partial_quality(part, positions, datetime_col, rules, kind):
+    """
+    Mergeable data quality partial for one partition.
+
+    :param part: Rows of the partition
+    :param positions: Positions of those rows in the full DataFrame
+    :param rules: Compiled data quality rules of the dataset
+    :param kind: 'cso', 'sps' or 'rainfall', for the dataset-specific parts
+    """
+    partial = {
+        'rows': len(part),
+        'missing': part.isnull().sum(),
+        'duplicate_positions': positions[part.duplicated(keep='first').to_numpy()],
+        'rule_counts': count_rule_violations(part, rules),
+        'start': part[datetime_col].min(),
+        'end': part[datetime_col].max(),
+        'days': set(part[datetime_col].dt.date.unique())
+    }
+
+    if kind == 'cso':
+        partial['level_sketch'] = _value_sketch(part['Level'])
+    elif kind == 'sps':
+        inconsistent = (((part['Status'] == 1) & (part['StateDesc'] != 'RUNNING')) |
+                        ((part['Status'] == 0) & (part['StateDesc'] != 'STOPPED')))
+        partial['inconsistent_positions'] = positions[inconsistent.to_numpy()]
+        partial['status_counts'] = part.groupby(['Site', 'Status'], sort=False).size() # First-appearance order, for ties
+    elif kind == 'rainfall':
+        partial['zero_rainfall'] = (part['RG_A'] == 0).sum()
+    return partial
+
+def _merge_quality(df, partials, datetime_col, rules):
+    """
+    Merge partition partials into the common part of the analyse_* result dictionaries.
+    """
+    n = len(df)
+    missing = reduce(lambda a, b: a + b, [partial['missing'] for partial in partials])
+    duplicate_records = df.iloc[np.sort(np.concatenate([partial['duplicate_positions'] for partial in partials]))]
+
+    rule_checks = rule_results(rules, merge_rule_counts([partial['rule_counts'] for partial in partials]))
+
+    # Temporal coverage, as analyse_temporal_coverage computes it
+    start_date = min((partial['start'] for partial in partials if pd.notna(partial['start'])), default=pd.NaT)
+    end_date = max((partial['end'] for partial in partials if pd.notna(partial['end'])), default=pd.NaT)
+    unique_days = set().union(*[partial['days'] for partial in partials])
+    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
+
+    return {
+        'missing_values': pd.DataFrame({
+            'Missing Values': missing,
+            'Percentage': (missing / n) * 100
+        }),
+        'duplicates': {
+            'duplicate_count': len(duplicate_records),
+            'duplicate_percentage': (len(duplicate_records) / n) * 100,
+            'duplicate_records': duplicate_records
+        },
+        'variable_ranges': rule_checks['variable_ranges'],
+        'cross_column': rule_checks['cross_column'],
+        'temporal_coverage': {
+            'Start Date': start_date,
+            'End Date': end_date,
+            'Total Days': (end_date - start_date).days + 1,
+            'Total Entries': n,
+            'Unique Days': len(unique_days),
+            'Missing Dates': len(date_range) - len(unique_days)
+        }
+    }
+
+def _flatline_and_rate(times, values, settings):
+    return {
+        'flatline': check_flatline(times, values, settings['flatline_max_run'], settings['flatline_ignore']),
+        'rate_of_change': check_rate_of_change(times, values, settings['max_rate_per_hour'])
+    }
+
+def _partial_spikes(values, core_start, core_end, settings):
+    """
+    Spike flags and rolling medians of one partition, computed on the partition plus its halo.
+
+    :param values: Readings of the partition with the halo on either side
+    :param core_start, core_end: Positions of the partition itself within values
+    """
+    is_spike, rolling_median = spike_mask(values, settings['spike_window'], settings['spike_n_mads'], settings['spike_min_deviation'])
+    return is_spike[core_start:core_end], rolling_median[core_start:core_end]
+
+def _sensor_fault_tasks(df, datetime_col, value_col, settings, freq):
+    """
+    Tasks for check_sensor_faults: one for the flatline and rate of change checks, then one spike task per
+    partition. Merge their results with _merge_sensor_faults.
+
+    :return: Tuple of (times, values, tasks)
+    """
+    times, values = _time_ordered(df, datetime_col, value_col)
+    halo = 2 * settings['spike_window'] # Rolling median of the deviations from a rolling median
+    tasks = [(_flatline_and_rate, (times, values, settings))]
+    for positions in partition_positions(times, freq):
+        lo, hi = positions[0], positions[-1] + 1 # In time order, so partitions are contiguous
+        halo_lo, halo_hi = max(lo - halo, 0), min(hi + halo, len(values))
+        tasks.append((_partial_spikes, (values[halo_lo:halo_hi], lo - halo_lo, hi - halo_lo, settings)))
+    return times, values, tasks
+
+def _merge_sensor_faults(times, values, results):
+    checks, *spike_parts = results
+    is_spike = np.concatenate([part[0] for part in spike_parts])
+    rolling_median = np.concatenate([part[1] for part in spike_parts])
+    return {
+        'flatline': checks['flatline'],
+        'spikes': spike_result(times, values, is_spike, rolling_median),
+        'rate_of_change': checks['rate_of_change']
+    }
+
+def _quality_tasks(df, datetime_col, rules, kind, freq):
+    try:
+        df[datetime_col] = pd.to_datetime(df[datetime_col]) # Same standardisation as analyse_temporal_coverage
+    except Exception as e:
+        raise ValueError(f"Error converting {datetime_col} to datetime format. Error: {str(e)}")
+    return [(_partial_quality, (df.iloc[positions], positions, datetime_col, rules, kind))
+            for positions in partition_positions(df[datetime_col], freq)]
+
+def analyse_cso_data_parallel(cso_df, max_workers=None, freq=PARTITION_FREQ, rules=None):
+    """
+    Time-partitioned, multi-process version of analyse_cso_data with an identical result.
+
+    :param cso_df: pandas DataFrame containing CSO data
+    :param max_workers: Number of worker processes (None = one per CPU, 1 = run inline)
+    :param freq: Partition size as a pandas period alias
+    :param rules: Compiled rules from rules.load_rules (default: DEFAULT_RULES['CSO'])
+    :return: Dictionary containing various analysis results
+    """
+    rules = rules or compile_rules(DEFAULT_RULES['CSO'], 'CSO')
+    if cso_df.empty:
+        return analyse_cso_data(cso_df, rules)
+
+    tasks = _quality_tasks(cso_df, 'DateTime', rules, 'cso', freq)
+    times, levels, fault_tasks = _sensor_fault_tasks(cso_df, 'DateTime', 'Level', CSO_FAULT_SETTINGS, freq)
+    results = _run_tasks(tasks + fault_tasks, max_workers)
+    partials = results[:len(tasks)]
+    sensor_faults = _merge_sensor_faults(times, levels, results[len(tasks):])
+    merged = _merge_quality(cso_df, partials, 'DateTime', rules)
+
+    # IQR outliers from the merged (exact) value sketch
+    sketch = _merge_sketches([partial['level_sketch'] for partial in partials])
+    Q1 = _sketch_quantile(sketch, 0.25)
+    Q3 = _sketch_quantile(sketch, 0.75)
+    IQR = Q3 - Q1
+    values, counts = sketch
+    outlier_count = int(counts[(values < (Q1 - 1.5 * IQR)) | (values > (Q3 + 1.5 * IQR))].sum())
+
+    return {
+        'missing_values': merged['missing_values'],
+        'duplicates': merged['duplicates'],
+        'outlier_count': outlier_count,
+        'outlier_percentage': (outlier_count / len(cso_df)) * 100,
+        'variable_ranges': merged['variable_ranges'],
+        'cross_column': merged['cross_column'],
+        'temporal_coverage': merged['temporal_coverage'],
+        'sensor_faults': sensor_faults
+    }
+
+def analyse_sps_data_parallel(sps_df, dataset_name, paired_sps_df=None, max_workers=None, freq=PARTITION_FREQ, rules=None):
+    """
+    Time-partitioned, multi-process version of analyse_sps_data with an identical result.
+
+    :param sps_df: pandas DataFrame containing SPS data
+    :param dataset_name: Name of the SPS dataset (e.g., 'SPS_A1' or 'SPS_A2')
+    :param paired_sps_df: Optional SPS data of the other pump station, for simultaneous-run overlap
+    :param max_workers: Number of worker processes (None = one per CPU, 1 = run inline)
+    :param freq: Partition size as a pandas period alias
+    :param rules: Compiled rules from rules.load_rules (default: DEFAULT_RULES[dataset_name])
+    :return: Dictionary containing various analysis results
+    """
+    rules = rules or compile_rules(DEFAULT_RULES[dataset_name], dataset_name)
+    if sps_df.empty:
+        return analyse_sps_data(sps_df, dataset_name, paired_sps_df, rules)
+
+    tasks = _quality_tasks(sps_df, 'Timestamp', rules, 'sps', freq)
+    tasks.append((analyse_pump_cycles, (sps_df[['Site', 'Timestamp', 'Status']],)))
+    *partials, pump_cycles = _run_tasks(tasks, max_workers)
+    merged = _merge_quality(sps_df, partials, 'Timestamp', rules)
+
+    inconsistent_records = sps_df.iloc[np.sort(np.concatenate([partial['inconsistent_positions'] for partial in partials]))]
+    if len(inconsistent_records) > 0:
+        status_consistency = {
+            'status': 'warning',
+            'message': f'Found {len(inconsistent_records)} records where Status and StateDesc are inconsistent',
+            'inconsistent_count': len(inconsistent_records),
+            'inconsistent_records': inconsistent_records
+        }
+    else:
+        status_consistency = {
+            'status': 'ok',
+            'message': 'Status and StateDesc columns are consistent'
+        }
+
+    # Sum the per-partition counts, then order like groupby().value_counts(): by site, then count descending,
+    # ties in order of first appearance (partials are in time order and the stable sort keeps that order)
+    status_changes = pd.concat([partial['status_counts'] for partial in partials]).groupby(level=[0, 1], sort=False).sum()
+    site_rank = pd.factorize(status_changes.index.get_level_values(0), sort=True)[0]
+    status_changes = status_changes.iloc[np.lexsort((-status_changes.to_numpy(), site_rank))]
+    status_changes.name = 'count'
+
+    results = {
+        'missing_values': merged['missing_values'],
+        'duplicates': merged['duplicates'],
+        'status_consistency': status_consistency,
+        'status_changes': status_changes,
+        'variable_ranges': merged['variable_ranges'],
+        'cross_column': merged['cross_column'],
+        'temporal_coverage': merged['temporal_coverage'],
+        'pump_cycles': pump_cycles
+    }
+
+    if paired_sps_df is not None:
+        results['simultaneous_runs'] = simultaneous_run_overlap(pump_cycles['runs'], pump_runs(paired_sps_df))
+
+    return results
+
+def analyse_rainfall_data_parallel(rainfall_df, max_workers=None, freq=PARTITION_FREQ, rules=None):
+    """
+    Time-partitioned, multi-process version of analyse_rainfall_data with an identical result.
+
+    :param rainfall_df: pandas DataFrame containing rainfall data
+    :param max_workers: Number of worker processes (None = one per CPU, 1 = run inline)
+    :param freq: Partition size as a pandas period alias
+    :param rules: Compiled rules from rules.load_rules (default: DEFAULT_RULES['Rainfall'])
+    :return: Dictionary containing various analysis results
+    """
+    rules = rules or compile_rules(DEFAULT_RULES['Rainfall'], 'Rainfall')
+    if rainfall_df.empty:
+        return analyse_rainfall_data(rainfall_df, rules)
+
+    tasks = _quality_tasks(rainfall_df, 'time', rules, 'rainfall', freq)
+    tasks.append((analyse_rainfall_events, (rainfall_df[['time', 'RG_A']],)))
+    times, rain, fault_tasks = _sensor_fault_tasks(rainfall_df, 'time', 'RG_A', RAINFALL_FAULT_SETTINGS, freq)
+    results = _run_tasks(tasks + fault_tasks, max_workers)
+    *partials, storm_events = results[:len(tasks)]
+    sensor_faults = _merge_sensor_faults(times, rain, results[len(tasks):])
+    merged = _merge_quality(rainfall_df, partials, 'time', rules)
+
+    zero_rainfall = reduce(lambda a, b: a + b, [partial['zero_rainfall'] for partial in partials])
+    return {
+        'missing_values': merged['missing_values'],
+        'duplicates': merged['duplicates'],
+        'zero_rainfall_count': zero_rainfall,
+        'zero_rainfall_percentage': (zero_rainfall / len(rainfall_df)) * 100,
+        'variable_ranges': merged['variable_ranges'],
+        'cross_column': merged['cross_column'],
+        'temporal_coverage': merged['temporal_coverage'],
+        'sensor_faults': sensor_faults,
+        'storm_events': storm_events
+    }
+
+def _partial_spills(frame, core_rows, threshold, window_hours, pump_sources):
+    """
+    Spill events starting in one partition, classified using the partition plus its look-ahead rows.
+
+    :param frame: Aligned rows of the partition followed by the look-ahead rows
+    :param core_rows: Number of leading rows that belong to the partition itself
+    """
+    core = frame.iloc[:core_rows]
+    cso_rows = core['CSO_observed'].to_numpy()
+    events = find_spill_events(core['DateTime'].to_numpy()[cso_rows], core['CSO_Level'].to_numpy(dtype=float)[cso_rows], threshold)
+    return classify_spill_events(frame, events, threshold, window_hours, pump_sources)
+
+def detect_potential_false_spills_parallel(aligned, threshold=43.0, window_hours=6, pump_sources=('SPS_A1', 'SPS_A2'),
+                                           max_workers=None, freq=PARTITION_FREQ):
+    """
+    Time-partitioned, multi-process version of detect_potential_false_spills with an identical result.
+    Each partition sees window_hours + 24 hours of the next partition, so its events are classified exactly
+    as in a single pass. Events that continue across a partition boundary are stitched back together.
+
+    :param aligned: Aligned CSO / pump frame from alignment.align_datasets
+    :param threshold: Level threshold for spill events (in meters)
+    :param window_hours: Time window to look for pump activation after level exceeds threshold
+    :param pump_sources: Pump sources in the aligned frame to look for activations in
+    :param max_workers: Number of worker processes (None = one per CPU, 1 = run inline)
+    :param freq: Partition size as a pandas period alias
+    :return: Dictionary containing detected false spill events
+    """
+    times = aligned['DateTime']
+    look_ahead = pd.Timedelta(hours=window_hours) + pd.Timedelta(hours=24)
+
+    tasks = []
+    for positions in partition_positions(times, freq):
+        lo, hi = positions[0], positions[-1] + 1 # The aligned frame is sorted, so partitions are contiguous
+        halo_end = times.searchsorted(times.iat[hi - 1] + look_ahead, side='right')
+        tasks.append((_partial_spills, (aligned.iloc[lo:halo_end], hi - lo, threshold, window_hours, pump_sources)))
+
+    # Stitch events split by a partition boundary: the earlier part decides the classification
+    gap = pd.Timedelta(hours=SPILL_EVENT_GAP_HOURS)
+    events = []
+    for classified in _run_tasks(tasks, max_workers):
+        for event in classified.to_dict('records'):
+            if events and event['start_time'] - events[-1]['end_time'] <= gap:
+                events[-1]['end_time'] = event['end_time']
+                events[-1]['max_level'] = max(events[-1]['max_level'], event['max_level'])
+            else:
+                events.append(event)
+
+    return false_spill_result(pd.DataFrame(events))
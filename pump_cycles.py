@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+# Short-cycling limits. A run shorter than min_run_minutes, or a start less than min_off_minutes after the
+# previous stop, counts as a short cycle. max_starts_per_hour is the usual pump manufacturer limit.
+SHORT_CYCLE_SETTINGS = {
+    'min_run_minutes': 2.0,
+    'min_off_minutes': 5.0,
+    'max_starts_per_hour': 12
+}
+
+def pump_runs(sps_df):
+    """
+    Turn SPS status events into pump runs (RUNNING until the next STOPPED) in one vectorised pass.
+    Events are ordered by site and time (sorting only if needed), repeated statuses are dropped, and every
+    remaining 0 -> 1 transition starts a run that ends at the site's next transition.
+
+    :param sps_df: pandas DataFrame containing SPS data (Site, Timestamp, Status)
+    :return: DataFrame with one row per run: Site, start_time, end_time, duration_minutes, off_minutes
+             (time since the previous stop at the same site). Runs still going at the end of the data have
+             no end_time.
+    """
+    times = pd.to_datetime(sps_df['Timestamp']).to_numpy(dtype='datetime64[ns]')
+    status = sps_df['Status'].to_numpy(dtype=float)
+    site_codes, site_names = pd.factorize(sps_df['Site'])
+
+    valid = ~np.isnan(status) & ~np.isnat(times) & (site_codes >= 0)
+    times, status, site_codes = times[valid], status[valid], site_codes[valid]
+
+    # Order by (site, time), only sorting when the events are not already in that order
+    in_order = ((np.diff(site_codes) > 0) | ((np.diff(site_codes) == 0) & (np.diff(times) >= np.timedelta64(0, 'ns')))).all()
+    if not in_order:
+        order = np.lexsort((times, site_codes))
+        times, status, site_codes = times[order], status[order], site_codes[order]
+
+    # Keep only transitions: the first event of each site and every change of status
+    new_site = np.concatenate(([True], site_codes[1:] != site_codes[:-1]))
+    transition = new_site | np.concatenate(([True], status[1:] != status[:-1]))
+    t_times, t_status, t_sites, t_new_site = times[transition], status[transition], site_codes[transition], new_site[transition]
+
+    starts = np.flatnonzero(t_status == 1)
+    ends = starts + 1
+    has_end = ends < len(t_times)
+    has_end[has_end] = t_sites[ends[has_end]] == t_sites[starts[has_end]] # Next transition must be the same site
+    end_times = np.where(has_end, t_times[np.clip(ends, 0, len(t_times) - 1)], np.datetime64('NaT', 'ns'))
+
+    # The transition before a start (same site) is the previous stop
+    has_previous = (starts > 0) & ~t_new_site[starts]
+    previous_stop = np.where(has_previous, t_times[np.clip(starts - 1, 0, None)], np.datetime64('NaT', 'ns'))
+
+    start_times = t_times[starts]
+    return pd.DataFrame({
+        'Site': np.asarray(site_names)[t_sites[starts]] if len(starts) else np.array([], dtype=object),
+        'start_time': start_times,
+        'end_time': end_times,
+        'duration_minutes': (end_times - start_times) / np.timedelta64(1, 'm'),
+        'off_minutes': (start_times - previous_stop) / np.timedelta64(1, 'm')
+    })
+
+def daily_duty_cycle(runs):
+    """
+    Fraction of each calendar day that each site's pump was running.
+    Uses the cumulative running time F(t) of each site, evaluated at the day boundaries with a binary search,
+    so runs crossing midnight are split correctly without looping over runs.
+
+    :param runs: DataFrame from pump_runs
+    :return: DataFrame indexed by date with one column per site (0 to 1)
+    """
+    columns = {}
+    day_ns = np.timedelta64(1, 'D').astype('timedelta64[ns]').astype(np.int64)
+    for site, site_runs in runs.dropna(subset=['end_time']).groupby('Site', sort=False):
+        starts = site_runs['start_time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        durations = site_runs['end_time'].to_numpy(dtype='datetime64[ns]').astype(np.int64) - starts
+        cumulative = np.concatenate(([0], np.cumsum(durations)))
+
+        days = pd.date_range(pd.Timestamp(starts[0]).floor('D'), pd.Timestamp(starts[-1] + durations[-1]).ceil('D'), freq='D')
+        boundaries = days.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+        # F(t) = running time of all earlier runs + the elapsed part of the run in progress
+        k = np.searchsorted(starts, boundaries, side='right') - 1
+        k_clipped = np.clip(k, 0, None)
+        running_time = np.where(k >= 0, cumulative[k_clipped] + np.minimum(boundaries - starts[k_clipped], durations[k_clipped]), 0)
+
+        columns[site] = pd.Series(np.diff(running_time) / day_ns, index=days[:-1].date)
+
+    duty_cycle = pd.DataFrame(columns)
+    duty_cycle.index.name = 'Date'
+    return duty_cycle
+
+def analyse_pump_cycles(sps_df, settings=SHORT_CYCLE_SETTINGS):
+    """
+    Operational pump metrics from SPS status events: starts per hour, run durations, daily duty cycle
+    and short-cycling.
+
+    :param sps_df: pandas DataFrame containing SPS data
+    :param settings: Short-cycling limits (see SHORT_CYCLE_SETTINGS)
+    :return: Dictionary containing pump cycle results
+    """
+    runs = pump_runs(sps_df)
+    runs['short_cycle'] = ((runs['duration_minutes'] < settings['min_run_minutes']) |
+                           (runs['off_minutes'] < settings['min_off_minutes'])) # NaN compares False
+
+    # Starts per clock hour, to find hours above the manufacturer limit
+    hourly_starts = runs.groupby(['Site', runs['start_time'].dt.floor('h')]).size()
+    busy_hours = hourly_starts[hourly_starts > settings['max_starts_per_hour']]
+
+    # Span of the event log per site, for the average start rate
+    timestamps = pd.to_datetime(sps_df['Timestamp'])
+    span_hours = (timestamps.groupby(sps_df['Site']).max() - timestamps.groupby(sps_df['Site']).min()) / pd.Timedelta(hours=1)
+
+    grouped = runs.groupby('Site')
+    site_summary = pd.DataFrame({
+        'runs': grouped.size(),
+        'starts_per_hour': grouped.size() / span_hours.replace(0, np.nan),
+        'max_starts_in_hour': hourly_starts.groupby(level='Site').max(),
+        'mean_run_minutes': grouped['duration_minutes'].mean(),
+        'median_run_minutes': grouped['duration_minutes'].median(),
+        'max_run_minutes': grouped['duration_minutes'].max(),
+        'total_run_hours': grouped['duration_minutes'].sum() / 60,
+        'short_cycles': grouped['short_cycle'].sum()
+    })
+
+    short_cycle_count = int(runs['short_cycle'].sum())
+    return {
+        'status': 'warning' if short_cycle_count or len(busy_hours) else 'ok',
+        'message': (f'{len(runs)} runs, {short_cycle_count} short cycles, '
+                    f'{len(busy_hours)} hours with more than {settings["max_starts_per_hour"]} starts'),
+        'site_summary': site_summary,
+        'runs': runs,
+        'daily_duty_cycle': daily_duty_cycle(runs),
+        'busy_hours': busy_hours
+    }
+
+def simultaneous_run_overlap(runs_a, runs_b):
+    """
+    Find the periods when pumps from two stations were running at the same time.
+    All run start/end points are swept in one sorted pass, tracking how many runs of each station are active.
+
+    :param runs_a: DataFrame from pump_runs for the first station
+    :param runs_b: DataFrame from pump_runs for the second station
+    :return: Dictionary containing overlap statistics and the overlapping periods
+    """
+    runs_a = runs_a.dropna(subset=['end_time'])
+    runs_b = runs_b.dropna(subset=['end_time'])
+
+    # One +1 event per start and one -1 event per end, tagged with the station it belongs to
+    times = np.concatenate([runs_a['start_time'], runs_a['end_time'], runs_b['start_time'], runs_b['end_time']]).astype('datetime64[ns]')
+    delta_a = np.concatenate([np.ones(len(runs_a)), -np.ones(len(runs_a)), np.zeros(2 * len(runs_b))])
+    delta_b = np.concatenate([np.zeros(2 * len(runs_a)), np.ones(len(runs_b)), -np.ones(len(runs_b))])
+
+    order = np.argsort(times, kind='stable')
+    times, active_a, active_b = times[order], np.cumsum(delta_a[order]), np.cumsum(delta_b[order])
+
+    # Segment i runs from times[i] to times[i + 1]; both stations are running where both counts are positive
+    both = (active_a[:-1] > 0) & (active_b[:-1] > 0)
+    padded = np.concatenate(([False], both, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    overlaps = pd.DataFrame({'start_time': times[edges[0::2]], 'end_time': times[edges[1::2]]})
+    overlaps = overlaps[overlaps['end_time'] > overlaps['start_time']].reset_index(drop=True)
+    overlaps['duration_minutes'] = (overlaps['end_time'] - overlaps['start_time']) / pd.Timedelta(minutes=1)
+
+    overlap_hours = overlaps['duration_minutes'].sum() / 60
+    run_hours_a = runs_a['duration_minutes'].sum() / 60
+    return {
+        'overlap_count': len(overlaps),
+        'overlap_hours': overlap_hours,
+        'overlap_percentage': (overlap_hours / run_hours_a) * 100 if run_hours_a else 0.0, # Share of this station's running time
+        'overlaps': overlaps
+    }
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from normalise import check_time_order
+
+ACCUMULATION_WINDOWS = ('1h', '6h', '24h', '72h')
+
+# A storm ends after min_dry_hours without rain. Storms below min_depth (mm) are ignored.
+STORM_SETTINGS = {
+    'min_dry_hours': 6,
+    'min_depth': 1.0,
+    'antecedent_windows': ('24h', '72h')
+}
+
+def _rain_series(rainfall_df, datetime_col='time', value_col='RG_A'):
+    """
+    Get rainfall timestamps and depths with the running total. The data must already be in time order
+    (see normalise.py).
+
+    :return: Tuple of (datetime64 array, float array, cumulative array with a leading 0)
+    """
+    times = pd.to_datetime(rainfall_df[datetime_col]).to_numpy(dtype='datetime64[ns]')
+    check_time_order(times, 'Rainfall')
+    values = np.nan_to_num(rainfall_df[value_col].to_numpy(dtype=float)) # Missing readings count as no rain
+    return times, values, np.concatenate(([0.0], np.cumsum(values)))
+
+def _window_totals(times, cumulative, window_ends, window, include_end=True):
+    """
+    Total rainfall in the window of the given length ending at each of window_ends, from the running total.
+    Two binary searches per window, so the cost does not depend on the window length.
+
+    :param include_end: True for (end - window, end], False for [end - window, end)
+    """
+    window = np.timedelta64(pd.Timedelta(window).value, 'ns')
+    if include_end:
+        lo = np.searchsorted(times, window_ends - window, side='right')
+        hi = np.searchsorted(times, window_ends, side='right')
+    else:
+        lo = np.searchsorted(times, window_ends - window, side='left')
+        hi = np.searchsorted(times, window_ends, side='left')
+    return cumulative[hi] - cumulative[lo]
+
+def rolling_accumulations(rainfall_df, windows=ACCUMULATION_WINDOWS, datetime_col='time', value_col='RG_A'):
+    """
+    Rolling rainfall totals over each window, at every reading, in O(n) per window using a running total.
+
+    :param rainfall_df: pandas DataFrame containing rainfall data
+    :param windows: Window lengths as pandas offset strings (e.g. '1h', '24h')
+    :return: DataFrame with the time, the reading and one 'rain_<window>' column per window
+    """
+    times, values, cumulative = _rain_series(rainfall_df, datetime_col, value_col)
+    accumulations = pd.DataFrame({datetime_col: times, value_col: values})
+    for window in windows:
+        accumulations[f'rain_{window}'] = _window_totals(times, cumulative, times, window)
+    return accumulations
+
+def antecedent_rainfall(rainfall_df, query_times, window, datetime_col='time', value_col='RG_A'):
+    """
+    Rainfall in the window before each query time, e.g. the 72 hours before a spill.
+
+    :param rainfall_df: pandas DataFrame containing rainfall data
+    :param query_times: Times to look back from
+    :param window: Window length as a pandas offset string
+    :return: Array of totals in [query_time - window, query_time)
+    """
+    times, _, cumulative = _rain_series(rainfall_df, datetime_col, value_col)
+    query_times = pd.to_datetime(pd.Series(query_times)).to_numpy(dtype='datetime64[ns]')
+    return _window_totals(times, cumulative, query_times, window, include_end=False)
+
+def segment_storms(rainfall_df, settings=STORM_SETTINGS, datetime_col='time', value_col='RG_A'):
+    """
+    Split rainfall into storm events using an inter-event dry period: a storm ends when no rain is recorded
+    for settings['min_dry_hours']. Storms are ranked by depth and by peak intensity.
+
+    :param rainfall_df: pandas DataFrame containing rainfall data
+    :param settings: Storm settings (see STORM_SETTINGS)
+    :return: DataFrame with one row per storm: storm_id, start_time, end_time, depth_mm, peak_mm,
+             duration_hours, mean_intensity_mm_h, peak_intensity_mm_h, antecedent_<window>_mm, depth_rank,
+             intensity_rank
+    """
+    times, values, cumulative = _rain_series(rainfall_df, datetime_col, value_col)
+
+    # Reading interval, used for the duration of the last reading and for intensities
+    interval = np.median(np.diff(times)) if len(times) > 1 else np.timedelta64(0, 'ns')
+    interval_hours = interval / np.timedelta64(1, 'h')
+
+    wet = values > 0
+    wet_times, wet_values = times[wet], values[wet]
+    if len(wet_times) == 0:
+        return pd.DataFrame(columns=['storm_id', 'start_time', 'end_time', 'depth_mm', 'peak_mm', 'duration_hours',
+                                     'mean_intensity_mm_h', 'peak_intensity_mm_h']
+                                    + [f'antecedent_{window}_mm' for window in settings['antecedent_windows']]
+                                    + ['depth_rank', 'intensity_rank'])
+
+    # New storm after a dry gap longer than min_dry_hours
+    dry_gap = np.timedelta64(pd.Timedelta(hours=settings['min_dry_hours']).value, 'ns')
+    starts = np.flatnonzero(np.concatenate(([True], np.diff(wet_times) > dry_gap)))
+    ends = np.concatenate((starts[1:], [len(wet_times)])) - 1
+
+    storms = pd.DataFrame({
+        'start_time': wet_times[starts],
+        'end_time': wet_times[ends],
+        'depth_mm': np.add.reduceat(wet_values, starts),
+        'peak_mm': np.maximum.reduceat(wet_values, starts)
+    })
+    storms['duration_hours'] = (storms['end_time'] - storms['start_time']) / pd.Timedelta(hours=1) + interval_hours
+    storms['mean_intensity_mm_h'] = storms['depth_mm'] / storms['duration_hours']
+    storms['peak_intensity_mm_h'] = storms['peak_mm'] / interval_hours if interval_hours else np.nan
+
+    # Rain that had already fallen before each storm started
+    for window in settings['antecedent_windows']:
+        storms[f'antecedent_{window}_mm'] = _window_totals(times, cumulative, storms['start_time'].to_numpy(), window, include_end=False)
+
+    storms = storms[storms['depth_mm'] >= settings['min_depth']].reset_index(drop=True)
+    storms.insert(0, 'storm_id', np.arange(len(storms)))
+    storms['depth_rank'] = storms['depth_mm'].rank(ascending=False, method='first').astype(int)
+    storms['intensity_rank'] = storms['peak_intensity_mm_h'].rank(ascending=False, method='first').astype(int)
+    return storms
+
+def analyse_rainfall_events(rainfall_df, settings=STORM_SETTINGS):
+    """
+    Rolling accumulation maxima and the storm table for the rainfall series.
+
+    :param rainfall_df: pandas DataFrame containing rainfall data
+    :param settings: Storm settings (see STORM_SETTINGS)
+    :return: Dictionary containing accumulation and storm results
+    """
+    accumulations = rolling_accumulations(rainfall_df)
+    storms = segment_storms(rainfall_df, settings)
+    return {
+        'max_accumulations': {window: accumulations[f'rain_{window}'].max() for window in ACCUMULATION_WINDOWS},
+        'storm_count': len(storms),
+        'storms': storms
+    }
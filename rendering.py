@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Figures are drawn on the main thread; PNG encoding and writing happen on background threads so they
+# overlap with laying out the next figure (Pillow's zlib encoder runs without the GIL). max_pending caps
+# how many drawn images wait in memory for a writer.
+RENDER_SETTINGS = {
+    'dpi': 100,
+    'writers': 2,
+    'max_pending': 8
+}
+
+_templates = {}
+_writer = {'executor': None, 'pending': []}
+
+def figure_template(name, figsize, build):
+    """
+    Get the figure for a family of plots, building it on first use. Every plot of a family (e.g. the daily
+    counts of each dataset) is drawn on the same figure: build sets up the axes, labels and artists once,
+    and each plot only updates the artists' data before save_figure. Uses the Agg canvas directly, without
+    pyplot, so the figures are never registered or closed.
+
+    :param name: Template name (one figure per name)
+    :param figsize: Figure size in inches
+    :param build: Function (fig) -> dictionary of the axes and artists the plot updates
+    :return: The dictionary from build, plus the figure under 'fig'
+    """
+    template = _templates.get(name)
+    if template is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=figsize, dpi=RENDER_SETTINGS['dpi'])
+        FigureCanvasAgg(fig)
+        fig.set_layout_engine('tight', rect=None) # Re-run on every draw, as labels and tick widths change between plots
+        template = dict(build(fig), fig=fig)
+        _templates[name] = template
+    return template
+
+def rescale(*axes):
+    """
+    Fit the axes' limits to the artists' current data (after set_data, set_height, ...).
+    """
+    for ax in axes:
+        ax.relim()
+        ax.autoscale_view()
+
+def save_figure(fig, output_path, temporary=()):
+    """
+    Draw the figure and queue its pixels for a background writer (see flush_figures).
+
+    :param fig: Figure to save
+    :param output_path: Path of the PNG
+    :param temporary: Artists that only belong to this plot, removed once drawn so the figure is ready for the next
+    """
+    fig.canvas.draw()
+    pixels = np.array(fig.canvas.buffer_rgba()) # Copy, the next draw reuses the buffer
+    for artist in temporary:
+        artist.remove()
+    write_png(pixels, output_path, fig.dpi)
+
+def _write_png(pixels, output_path, dpi):
+    from PIL import Image
+
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    Image.fromarray(pixels).save(tmp_path, format='png', dpi=(dpi, dpi))
+    tmp_path.replace(output_path)
+
+def write_png(pixels, output_path, dpi=100):
+    """
+    Encode and write an RGBA image on a background thread. Returns once the image is queued, or once a
+    slot frees up when max_pending images are already waiting.
+
+    :param pixels: (height, width, 4) uint8 array
+    :param output_path: Path of the PNG
+    :param dpi: Resolution stored in the PNG
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.unlink(missing_ok=True) # An interrupted run leaves no file rather than the previous figure
+
+    if _writer['executor'] is None:
+        _writer['executor'] = ThreadPoolExecutor(RENDER_SETTINGS['writers'], thread_name_prefix='png-writer')
+    pending = _writer['pending']
+    while len(pending) >= RENDER_SETTINGS['max_pending']:
+        pending.pop(0).result()
+    pending.append(_writer['executor'].submit(_write_png, pixels, output_path, dpi))
+
+def flush_figures():
+    """
+    Wait until every queued PNG is written. Call before reading the files or reporting that they exist.
+    Raises the first error a writer hit, after the other writes have finished.
+    """
+    pending, _writer['pending'] = _writer['pending'], []
+    errors = [future.exception() for future in pending]
+    for error in errors:
+        if error is not None:
+            raise error
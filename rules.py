@@ -0,0 +1,337 @@
+import json
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Data quality rules per dataset. A rules file (see load_rules) uses the same layout:
+# - 'ranges': column -> [min, max], either bound may be null. Missing values are not range checked.
+# - 'allowed': column -> list of the values a categorical column may hold
+# - 'cross_column': list of {'name', 'if', 'then', 'pairs'} rules. A row whose 'if' column holds the first value
+#   of a pair must hold the second value (or one of a list of values) in its 'then' column.
+# - 'sites': site -> {'ranges': ..., 'allowed': ...}, replacing the dataset's rule for a column on that site's rows
+# - 'site_col': column the 'sites' keys refer to (default 'Site')
+_SPS_RULES = {
+    'ranges': {'Status': [0, 1]},
+    'allowed': {'StateDesc': ['RUNNING', 'STOPPED']},
+    'cross_column': [{'name': 'Status/StateDesc', 'if': 'Status', 'then': 'StateDesc', 'pairs': [[1, 'RUNNING'], [0, 'STOPPED']]}]
+}
+
+DEFAULT_RULES = {
+    'CSO': {'ranges': {'Level': [0, 100]}}, # Assuming level should be between 0 and 100m
+    'SPS_A1': _SPS_RULES,
+    'SPS_A2': _SPS_RULES,
+    'Rainfall': {'ranges': {'RG_A': [0, 100]}} # Assuming rainfall should be between 0 and 100mm
+}
+
+RULE_KEYS = ('ranges', 'allowed', 'cross_column', 'sites', 'site_col')
+SITE_RULE_KEYS = ('ranges', 'allowed')
+
+# Most frequent unexpected values listed in a result
+UNEXPECTED_VALUES_SHOWN = 10
+
+def _bounds(value, where):
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"{where}: a range is [min, max], got {value!r}")
+    for bound in value:
+        if bound is not None and (isinstance(bound, bool) or not isinstance(bound, (int, float))):
+            raise ValueError(f"{where}: range bounds must be numbers or null, got {value!r} (use 'allowed' for categorical values)")
+    return value[0], value[1]
+
+def _allowed(value, where):
+    if not isinstance(value, (list, tuple)):
+        raise ValueError(f"{where}: allowed values must be a list, got {value!r}")
+    return list(value)
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+def compile_rules(spec, name='rules'):
+    """
+    Validate one dataset's rules and turn them into lookup tables, so evaluating them is a few vectorised
+    gathers and comparisons per rule however many sites have overrides.
+
+    Every range and allowed-values rule gets one row per site in 'sites', plus a last row with the dataset
+    rule. Each data row then uses the row of its site (site position, or -1 for the dataset rule).
+
+    :param spec: Rules for one dataset (see DEFAULT_RULES)
+    :param name: Dataset name, for error messages
+    :return: Compiled rules for count_rule_violations and rule_results
+    """
+    unknown = set(spec) - set(RULE_KEYS)
+    if unknown:
+        raise ValueError(f"{name}: unknown rule keys {sorted(unknown)}, expected some of {', '.join(RULE_KEYS)}")
+    site_rules = spec.get('sites') or {}
+    for site, override in site_rules.items():
+        unknown = set(override) - set(SITE_RULE_KEYS)
+        if unknown:
+            raise ValueError(f"{name}: unknown rule keys {sorted(unknown)} for site '{site}', expected some of {', '.join(SITE_RULE_KEYS)}")
+
+    sites = list(site_rules)
+    levels = [site_rules[site] for site in sites] + [spec] # Site overrides, then the dataset rule
+    where = [f"{name}, site '{site}'" for site in sites] + [name]
+
+    def columns(kind):
+        return list(dict.fromkeys(column for level in levels for column in (level.get(kind) or {})))
+
+    ranges = {}
+    for column in columns('ranges'):
+        default = _bounds(spec['ranges'][column], f"{name} '{column}'") if column in (spec.get('ranges') or {}) else (None, None)
+        rows = [_bounds(level['ranges'][column], f"{at} '{column}'") if column in (level.get('ranges') or {}) else default
+                for level, at in zip(levels, where)]
+        ranges[column] = {
+            'bounds': default,
+            'lower': np.array([-np.inf if lower is None else lower for lower, _ in rows], dtype=float),
+            'upper': np.array([np.inf if upper is None else upper for _, upper in rows], dtype=float)
+        }
+
+    allowed = {}
+    for column in columns('allowed'):
+        default = _allowed(spec['allowed'][column], f"{name} '{column}'") if column in (spec.get('allowed') or {}) else None
+        allowed[column] = {
+            'default': default,
+            'values': [_allowed(level['allowed'][column], f"{at} '{column}'") if column in (level.get('allowed') or {}) else default
+                       for level, at in zip(levels, where)] # None = not checked for that site
+        }
+
+    cross_column = []
+    for i, rule in enumerate(spec.get('cross_column') or []):
+        missing = {'if', 'then', 'pairs'} - set(rule)
+        if missing:
+            raise ValueError(f"{name}: cross-column rule {i + 1} is missing {', '.join(sorted(missing))}")
+        keys, values = [], []
+        for pair in rule['pairs']:
+            if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+                raise ValueError(f"{name}: cross-column pairs are [if value, then value(s)], got {pair!r}")
+            if pair[0] in keys:
+                raise ValueError(f"{name}: cross-column rule {i + 1} lists '{pair[0]}' twice")
+            keys.append(pair[0])
+            values.append(list(pair[1]) if isinstance(pair[1], (list, tuple)) else [pair[1]])
+        cross_column.append({'name': rule.get('name', f"{rule['if']}/{rule['then']}"), 'if': rule['if'], 'then': rule['then'],
+                             'keys': keys, 'values': values})
+
+    return {'name': name, 'site_col': spec.get('site_col', 'Site'), 'sites': sites,
+            'ranges': ranges, 'allowed': allowed, 'cross_column': cross_column}
+
+def _site_rows(df, rules):
+    """
+    Table row for every data row: its site's position in rules['sites'], or -1 (the dataset rule).
+    None when no site has overrides, so the dataset rule applies as a scalar.
+    """
+    if not rules['sites'] or rules['site_col'] not in df.columns:
+        return None
+    codes, uniques = pd.factorize(df[rules['site_col']])
+    rows = pd.Index(rules['sites']).get_indexer(uniques) # Sites are factorised first, so this is one lookup per site
+    return np.append(rows, -1)[codes] # Rows without a site (code -1) use the dataset rule
+
+def count_rule_violations(df, rules):
+    """
+    Evaluate compiled rules on a DataFrame in one pass. The counts of separate parts of a dataset (e.g. time
+    partitions) add up with merge_rule_counts to the counts of the whole.
+
+    :param df: pandas DataFrame
+    :param rules: Rules from compile_rules
+    :return: Dictionary of violation counts for rule_results
+    """
+    counts = {'errors': {}, 'ranges': {}, 'allowed': {}, 'cross_column': {}}
+    site_rows = _site_rows(df, rules)
+
+    def per_row(table):
+        return table[-1] if site_rows is None else table[site_rows]
+
+    for column, table in rules['ranges'].items():
+        if column not in df.columns:
+            counts['errors'][column] = f'Column {column} not found in DataFrame'
+            continue
+        if df[column].dtype.kind not in 'iufb':
+            counts['errors'][column] = f"Column {column} is not numeric, check it with 'allowed' values instead"
+            continue
+        values = df[column].to_numpy(dtype=float) # NaN compares False on both sides
+        counts['ranges'][column] = (int((values < per_row(table['lower'])).sum()), int((values > per_row(table['upper'])).sum()))
+
+    for column, table in rules['allowed'].items():
+        if column not in df.columns:
+            counts['errors'][column] = f'Column {column} not found in DataFrame'
+            continue
+        codes, uniques = pd.factorize(df[column])
+        # Rows: one per table row. Columns: the values plus a last one for missing values (code -1), which
+        # are not checked
+        member = np.ones((len(table['values']), len(uniques) + 1), dtype=bool)
+        for i, values in enumerate(table['values']):
+            if values is not None:
+                member[i, :-1] = uniques.isin(values)
+        unexpected = ~member[per_row(np.arange(len(member))), codes]
+        tally = np.bincount(codes[unexpected], minlength=len(uniques))
+        counts['allowed'][column] = Counter({_plain(uniques[i]): int(tally[i]) for i in np.flatnonzero(tally)})
+
+    for rule in rules['cross_column']:
+        absent = [column for column in (rule['if'], rule['then']) if column not in df.columns]
+        if absent:
+            counts['errors'][rule['name']] = f'Column {absent[0]} not found in DataFrame'
+            continue
+        if_codes, if_uniques = pd.factorize(df[rule['if']])
+        then_codes, then_uniques = pd.factorize(df[rule['then']])
+        # Rows: one per pair plus a last, unconstrained one. Columns: the 'then' values plus a last one for
+        # missing values, which never satisfy a constraint.
+        member = np.ones((len(rule['keys']) + 1, len(then_uniques) + 1), dtype=bool)
+        for i, values in enumerate(rule['values']):
+            member[i, :-1] = then_uniques.isin(values)
+            member[i, -1] = False
+        pair_row = np.append(pd.Index(rule['keys']).get_indexer(if_uniques), -1)[if_codes]
+        violating = ~member[pair_row, then_codes]
+        pairs, tally = np.unique(np.stack([if_codes[violating], then_codes[violating]]), axis=1, return_counts=True)
+        counts['cross_column'][rule['name']] = Counter({
+            (_plain(if_uniques[a]), _plain(then_uniques[b]) if b >= 0 else None): int(n) for (a, b), n in zip(pairs.T, tally)
+        })
+    return counts
+
+def merge_rule_counts(counts_list):
+    """
+    Add up the counts of count_rule_violations over parts of a dataset.
+    """
+    merged = {'errors': {}, 'ranges': {}, 'allowed': {}, 'cross_column': {}}
+    for counts in counts_list:
+        merged['errors'].update(counts['errors'])
+        for column, (below, above) in counts['ranges'].items():
+            previous = merged['ranges'].get(column, (0, 0))
+            merged['ranges'][column] = (previous[0] + below, previous[1] + above)
+        for kind in ('allowed', 'cross_column'):
+            for key, tally in counts[kind].items():
+                merged[kind][key] = merged[kind].get(key, Counter()) + tally
+    return merged
+
+def range_check_result(min_val, max_val, values_below_min, values_above_max):
+    """
+    Build the range check result for one column from its out-of-range counts.
+
+    :return: Dictionary containing the range check result
+    """
+    if values_below_min > 0 or values_above_max > 0:
+        return {
+            'status': 'warning',
+            'message': f'Values outside range [{min_val}, {max_val}] found',
+            'below_min_count': values_below_min,
+            'above_max_count': values_above_max
+        }
+    else:
+        return {
+            'status': 'ok',
+            'message': 'All values are within expected range'
+        }
+
+def _most_common(tally):
+    # Ties in value order, so merged partition counts list the same values as a single pass
+    return sorted(tally.items(), key=lambda item: (-item[1], str(item[0])))
+
+def rule_results(rules, counts):
+    """
+    Turn violation counts into the result dictionaries of the data quality report.
+
+    :param rules: Rules from compile_rules
+    :param counts: Counts from count_rule_violations or merge_rule_counts
+    :return: Dictionary with 'variable_ranges' (range and allowed-values results by column) and 'cross_column'
+             (results by rule name)
+    """
+    def error(key):
+        return {'status': 'error', 'message': counts['errors'][key]}
+
+    variable_ranges = {}
+    for column, table in rules['ranges'].items():
+        if column in counts['errors']:
+            variable_ranges[column] = error(column)
+            continue
+        variable_ranges[column] = range_check_result(*table['bounds'], *counts['ranges'][column])
+        if rules['sites']:
+            variable_ranges[column]['message'] += ' (default range, some sites have their own)' if variable_ranges[column]['status'] == 'warning' else ''
+
+    for column, table in rules['allowed'].items():
+        key = column if column not in variable_ranges else f'{column} (allowed values)'
+        if column in counts['errors']:
+            variable_ranges[key] = error(column)
+            continue
+        tally = counts['allowed'][column]
+        total = sum(tally.values())
+        if total > 0:
+            allowed = f" {table['default']}" if table['default'] is not None else ''
+            variable_ranges[key] = {
+                'status': 'warning',
+                'message': f'{total} values outside the allowed set{allowed} found',
+                'unexpected_count': total,
+                'unexpected_values': [value for value, _ in _most_common(tally)[:UNEXPECTED_VALUES_SHOWN]]
+            }
+        else:
+            variable_ranges[key] = {
+                'status': 'ok',
+                'message': 'All values are in the allowed set'
+            }
+
+    cross_column = {}
+    for rule in rules['cross_column']:
+        if rule['name'] in counts['errors']:
+            cross_column[rule['name']] = error(rule['name'])
+            continue
+        tally = counts['cross_column'][rule['name']]
+        total = sum(tally.values())
+        if total > 0:
+            cross_column[rule['name']] = {
+                'status': 'warning',
+                'message': f"Found {total} records where {rule['then']} does not match {rule['if']}",
+                'violation_count': total,
+                'violating_pairs': [{rule['if']: a, rule['then']: b, 'count': n} for (a, b), n in _most_common(tally)]
+            }
+        else:
+            cross_column[rule['name']] = {
+                'status': 'ok',
+                'message': f"{rule['then']} matches {rule['if']} in every record"
+            }
+
+    return {'variable_ranges': variable_ranges, 'cross_column': cross_column}
+
+def evaluate_rules(df, rules):
+    """
+    Check a DataFrame against compiled rules in one pass.
+
+    :param df: pandas DataFrame
+    :param rules: Rules from compile_rules
+    :return: Dictionary with 'variable_ranges' and 'cross_column' results (see rule_results)
+    """
+    return rule_results(rules, count_rule_violations(df, rules))
+
+def read_rules_file(path):
+    """
+    Read rules from a JSON file, or a YAML file (.yaml / .yml, needs PyYAML).
+
+    :param path: Path to the rules file, laid out as DEFAULT_RULES (dataset name -> rules)
+    :return: Dictionary of rules by dataset name
+    """
+    path = Path(path)
+    text = path.read_text()
+    if path.suffix in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"Reading {path} needs PyYAML (pip install pyyaml), or write the rules as JSON")
+        specs = yaml.safe_load(text)
+    else:
+        specs = json.loads(text)
+
+    if not isinstance(specs, dict):
+        raise ValueError(f"{path}: expected an object mapping dataset names to their rules")
+    unknown = set(specs) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"{path}: unknown datasets {sorted(unknown)}, expected some of {', '.join(DEFAULT_RULES)}")
+    return specs
+
+def load_rules(path=None):
+    """
+    Compile the rules of every dataset, once per run. A rules file replaces the rules of the datasets it lists;
+    the others keep DEFAULT_RULES.
+
+    :param path: Optional rules file (see read_rules_file)
+    :return: Dictionary of compiled rules by dataset name
+    """
+    specs = dict(DEFAULT_RULES)
+    if path is not None:
+        specs.update(read_rules_file(path))
+    return {name: compile_rules(spec, name) for name, spec in specs.items()}
@@ -0,0 +1,144 @@
+import asyncio
+import mimetypes
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+REASONS = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error'
+}
+
+async def read_request(reader):
+    """
+    Read one HTTP/1.1 request (request line and headers) from a connection. Request bodies are skipped.
+
+    :param reader: asyncio StreamReader of the connection
+    :return: Tuple of (method, path, query dictionary, headers dictionary), or None if the client closed the connection
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise ValueError(f'Malformed request line: {request_line!r}')
+    method, target, _ = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('content-length'):
+        await reader.readexactly(int(headers['content-length'])) # Nothing here takes a body
+
+    url = urlsplit(target)
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    return method.upper(), unquote(url.path), query, headers
+
+def write_response(writer, status, body=b'', content_type='text/plain; charset=utf-8', headers=None, head_only=False):
+    """
+    Write an HTTP/1.1 response to a connection.
+
+    :param writer: asyncio StreamWriter of the connection
+    :param status: HTTP status code
+    :param body: Response body as bytes or str
+    :param content_type: Content-Type header
+    :param headers: Extra headers as a dictionary
+    :param head_only: Send the headers only (HEAD requests)
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}', f'Content-Type: {content_type}', f'Content-Length: {len(body)}']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    if not head_only:
+        writer.write(body)
+
+def static_handler(directory):
+    """
+    Request handler serving the files in a directory (index.html for '/'). Files get an ETag from their size
+    and modification time, so a browser revisiting a tile gets a 304 instead of the PNG.
+
+    :param directory: Directory to serve
+    :return: Async handler for serve()
+    """
+    root = Path(directory).resolve()
+
+    async def handle(method, path, query, headers):
+        if method not in ('GET', 'HEAD'):
+            return 405, 'Method not allowed', 'text/plain; charset=utf-8', {}
+
+        file_path = (root / path.lstrip('/')).resolve()
+        if file_path.is_dir():
+            file_path = file_path / 'index.html'
+        if not file_path.is_relative_to(root) or not file_path.is_file():
+            return 404, 'Not found', 'text/plain; charset=utf-8', {}
+
+        stat = file_path.stat()
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        if headers.get('if-none-match') == etag:
+            return 304, b'', None, {'ETag': etag}
+
+        content_type = mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+        return 200, file_path.read_bytes(), content_type, {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+    return handle
+
+async def serve(handler, host='127.0.0.1', port=8000):
+    """
+    Serve HTTP requests with the given handler until cancelled. Connections are kept alive, so a viewer
+    loading many tiles reuses a few connections.
+
+    :param handler: Async function (method, path, query, headers) -> (status, body, content_type, headers)
+    :param host: Interface to listen on
+    :param port: Port to listen on
+    """
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError):
+                    write_response(writer, 400, 'Bad request', headers={'Connection': 'close'})
+                    break
+                if request is None:
+                    break
+                method, path, query, headers = request
+
+                try:
+                    status, body, content_type, extra_headers = await handler(method, path, query, headers)
+                except Exception as e:
+                    status, body, content_type, extra_headers = 500, f'{type(e).__name__}: {e}', 'text/plain; charset=utf-8', {}
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                extra_headers = dict(extra_headers, Connection='keep-alive' if keep_alive else 'close')
+                write_response(writer, status, body, content_type or 'text/plain; charset=utf-8', extra_headers,
+                               head_only=method == 'HEAD' or status == 304)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass # Client went away
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f"Serving on http://{host}:{port}/ (Ctrl+C to stop)")
+    async with server:
+        await server.serve_forever()
+
+def run(handler, host='127.0.0.1', port=8000):
+    """
+    Run serve() until interrupted with Ctrl+C.
+    """
+    try:
+        asyncio.run(serve(handler, host, port))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from alignment import align_datasets
+from attribution import ATTRIBUTION_SETTINGS, analyse_spill_attribution
+from data_quality import (analyse_cso_data, analyse_sps_data, analyse_rainfall_data, analyse_spill_events,
+                          check_duplicates, find_spill_events, detect_potential_false_spills)
+from extract import load_data_cached
+from normalise import normalise_datasets
+from rules import load_rules
+from server import serve, static_handler
+
+# Number of distinct query results kept in memory (least recently used are dropped first)
+RESULT_CACHE_SIZE = 256
+
+# Largest number of rows an extract returns unless the request asks for fewer
+EXTRACT_ROW_LIMIT = 100_000
+
+DATASET_TIME_COLUMNS = {'CSO': 'DateTime', 'SPS_A1': 'Timestamp', 'SPS_A2': 'Timestamp', 'Rainfall': 'time', 'aligned': 'DateTime'}
+
+# Computed in the background at startup so the first dashboard request is already a cache hit
+WARM_QUERIES = (('/quality', {}), ('/spills', {}), ('/false-spills', {}))
+
+def to_jsonable(value):
+    """
+    Convert analysis results to plain JSON types. DataFrames become lists of records (a non-default
+    index becomes columns), Series with a simple index become objects, timestamps become ISO strings
+    and NaN becomes null.
+
+    :param value: Analysis result (dict, list, DataFrame, Series, numpy or pandas scalar, ...)
+    :return: Value that json.dumps accepts
+    """
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, pd.Series):
+        if isinstance(value.index, pd.MultiIndex):
+            return to_jsonable(value.reset_index())
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, pd.DataFrame):
+        if not isinstance(value.index, pd.RangeIndex):
+            value = value.reset_index()
+        return json.loads(value.to_json(orient='records', date_format='iso')) # pandas' C encoder, much faster than per cell
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return None if pd.isna(value) else value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if value is pd.NaT or value is None:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat() # datetime.date
+    return value
+
+def json_body(payload):
+    """
+    :return: payload encoded as compact JSON bytes
+    """
+    return json.dumps(to_jsonable(payload), separators=(',', ':')).encode('utf-8')
+
+def load_state(data_path, use_cache=True, rules_path=None):
+    """
+    Load the datasets once for the lifetime of the service: each dataset normalised (sorted by time with
+    unique timestamps, so extracts are binary searches), plus the aligned frame.
+
+    :param data_path: Path to the Excel workbook
+    :param use_cache: Reuse the cached parsed workbook and aligned frame in output/cache
+    :param rules_path: Optional data quality rules file (see rules.load_rules)
+    :return: Dictionary with 'datasets' (name -> DataFrame, including 'aligned'), 'normalisation'
+             (reports from normalise_datasets), 'duplicates' (check_duplicates of each dataset as loaded),
+             'rules' (compiled data quality rules) and 'loaded_at'
+    """
+    rules = load_rules(rules_path) # Before the slow load, so a bad rules file fails fast
+    raw_datasets = load_data_cached(data_path, use_cache=use_cache)
+    (cso_df, sps_a1_df, sps_a2_df, rainfall_df), normalisation = normalise_datasets(*raw_datasets)
+    duplicates = {name: check_duplicates(raw_df) for name, raw_df in zip(('CSO', 'SPS_A1', 'SPS_A2', 'Rainfall'), raw_datasets)}
+    aligned = align_datasets(cso_df, sps_a1_df, sps_a2_df, rainfall_df, use_cache=use_cache)
+
+    datasets = {'CSO': cso_df, 'SPS_A1': sps_a1_df, 'SPS_A2': sps_a2_df, 'Rainfall': rainfall_df, 'aligned': aligned}
+    for name, df in datasets.items():
+        time_col = DATASET_TIME_COLUMNS[name]
+        if df[time_col].dtype.kind != 'M':
+            datasets[name] = df.assign(**{time_col: pd.to_datetime(df[time_col])}) # Timestamps read as text
+
+    return {'datasets': datasets, 'normalisation': normalisation, 'duplicates': duplicates, 'rules': rules,
+            'loaded_at': pd.Timestamp.now()}
+
+def _parse_float(query, name, default):
+    try:
+        value = float(query.get(name, default))
+    except ValueError:
+        value = np.nan
+    if not np.isfinite(value): # float() also accepts 'nan' and 'inf'
+        raise ValueError(f"'{name}' must be a number, got '{query[name]}'")
+    return value
+
+def _parse_time(query, name):
+    if name not in query:
+        return None
+    try:
+        value = pd.Timestamp(query[name])
+    except ValueError:
+        value = pd.NaT
+    if value is pd.NaT:
+        raise ValueError(f"'{name}' must be a date/time, got '{query[name]}'")
+    if value.tzinfo is not None:
+        value = value.tz_convert('UTC').tz_localize(None) # The datasets hold naive UTC times
+    return value
+
+def _parse_dataset(query, allowed, default=None):
+    dataset = query.get('dataset', default)
+    if dataset is not None and dataset not in allowed:
+        raise ValueError(f"Unknown dataset '{dataset}', expected one of {', '.join(allowed)}")
+    return dataset
+
+def query_quality(state, dataset):
+    """
+    Data quality analysis for one dataset (same results as main.py quality).
+    """
+    # The analyses standardise columns in place and requests run concurrently in worker threads, so each
+    # call works on its own copies of the shared frames
+    datasets = {name: df.copy() for name, df in state['datasets'].items() if name != 'aligned'}
+    rules = state['rules']
+    if dataset == 'CSO':
+        result = analyse_cso_data(datasets['CSO'], rules['CSO'])
+    elif dataset == 'SPS_A1':
+        result = analyse_sps_data(datasets['SPS_A1'], 'SPS_A1', paired_sps_df=datasets['SPS_A2'], rules=rules['SPS_A1'])
+    elif dataset == 'SPS_A2':
+        result = analyse_sps_data(datasets['SPS_A2'], 'SPS_A2', paired_sps_df=datasets['SPS_A1'], rules=rules['SPS_A2'])
+    else:
+        result = analyse_rainfall_data(datasets['Rainfall'], rules['Rainfall'])
+    return dict(result, duplicates=state['duplicates'][dataset]) # Counted before normalisation merged them
+
+def query_spills(state, threshold):
+    """
+    Spill statistics and the list of spill events for a threshold.
+    """
+    cso_df = state['datasets']['CSO']
+    events = find_spill_events(cso_df['DateTime'].to_numpy(), cso_df['Level'].to_numpy(), threshold)
+    return dict(analyse_spill_events(cso_df, 'DateTime', 'Level', threshold), threshold=threshold, events=events)
+
+def query_false_spills(state, threshold, window_hours):
+    """
+    Potential false spills for a threshold and pump activation window.
+    """
+    result = detect_potential_false_spills(state['datasets']['aligned'], threshold=threshold, window_hours=window_hours)
+    return dict(result, threshold=threshold, window_hours=window_hours)
+
+def query_attribution(state, threshold, lag_hours):
+    """
+    Spill events attributed to storms, with dry-weather spills flagged.
+    """
+    datasets = state['datasets']
+    return dict(analyse_spill_attribution(datasets['CSO'], datasets['Rainfall'], threshold, dict(ATTRIBUTION_SETTINGS, catchment_lag_hours=lag_hours)),
+                threshold=threshold)
+
+def query_extract(state, dataset, start, end, limit):
+    """
+    Rows of a dataset with start <= time <= end, found by binary search on the sorted time column.
+    """
+    df = state['datasets'][dataset]
+    times = df[DATASET_TIME_COLUMNS[dataset]]
+    lo = times.searchsorted(start, side='left') if start is not None else 0
+    hi = times.searchsorted(end, side='right') if end is not None else len(df)
+    hi = max(lo, hi)
+    return {
+        'dataset': dataset,
+        'start': start,
+        'end': end,
+        'row_count': hi - lo,
+        'truncated': hi - lo > limit,
+        'rows': df.iloc[lo:min(hi, lo + limit)]
+    }
+
+def make_handler(state, cache_size=RESULT_CACHE_SIZE, tile_dir='output/tiles'):
+    """
+    Build the request handler for serve().
+
+    Results are cached as encoded JSON in an LRU keyed on the endpoint and its normalised parameters,
+    so a repeated query is a dictionary lookup. The cache holds futures rather than results: concurrent
+    requests for the same query share one computation, which runs in a worker thread so the event loop
+    keeps answering other requests meanwhile.
+
+    :param state: Loaded data from load_state
+    :param cache_size: Number of results to keep
+    :param tile_dir: Directory served under /tiles/ (see tiles.py)
+    :return: Async handler
+    """
+    cache = OrderedDict()
+    stats = {'hits': 0, 'misses': 0}
+    tiles = static_handler(tile_dir)
+
+    async def cached(key, func, *args):
+        future = cache.get(key)
+        if future is not None:
+            stats['hits'] += 1
+            cache.move_to_end(key)
+        else:
+            stats['misses'] += 1
+            loop = asyncio.get_running_loop()
+            future = asyncio.ensure_future(loop.run_in_executor(None, lambda: json_body(func(state, *args))))
+            cache[key] = future
+            while len(cache) > cache_size:
+                cache.popitem(last=False)
+        try:
+            return await asyncio.shield(future) # A client disconnecting must not cancel the shared computation
+        except Exception:
+            if cache.get(key) is future:
+                del cache[key] # Do not keep failures
+            raise
+
+    def ok(body, content_type='application/json'):
+        return 200, body, content_type, {}
+
+    def error(status, message):
+        return status, json_body({'status': 'error', 'message': message}), 'application/json', {}
+
+    async def handle(method, path, query, headers):
+        if path.startswith('/tiles/'):
+            return await tiles(method, path[len('/tiles'):], query, headers)
+        if method not in ('GET', 'HEAD'):
+            return error(405, 'Only GET is supported')
+
+        try:
+            if path == '/':
+                return ok(json_body({
+                    'endpoints': {
+                        '/quality': 'dataset=CSO|SPS_A1|SPS_A2|Rainfall (default: all)',
+                        '/spills': 'threshold (default 43.0)',
+                        '/false-spills': 'threshold (default 43.0), window_hours (default 6)',
+                        '/attribution': f"threshold (default 43.0), lag_hours (default {ATTRIBUTION_SETTINGS['catchment_lag_hours']})",
+                        '/extract': f'dataset=CSO|SPS_A1|SPS_A2|Rainfall|aligned, start, end, limit (default {EXTRACT_ROW_LIMIT}), format=json|csv',
+                        '/stats': 'result cache statistics',
+                        '/tiles/': 'tile viewer (python main.py tiles)'
+                    },
+                    'loaded_at': state['loaded_at'],
+                    'normalisation': state['normalisation'],
+                    'rows': {name: len(df) for name, df in state['datasets'].items()}
+                }))
+
+            if path == '/stats':
+                return ok(json_body(dict(stats, size=len(cache), capacity=cache_size)))
+
+            if path == '/quality':
+                dataset = _parse_dataset(query, ('CSO', 'SPS_A1', 'SPS_A2', 'Rainfall'))
+                if dataset is not None:
+                    return ok(await cached(('quality', dataset), query_quality, dataset))
+                # All datasets: the per-dataset entries, computed concurrently and joined without re-encoding
+                names = ('CSO', 'SPS_A1', 'SPS_A2', 'Rainfall')
+                bodies = await asyncio.gather(*(cached(('quality', name), query_quality, name) for name in names))
+                return ok(b'{' + b','.join(json.dumps(name).encode() + b':' + body for name, body in zip(names, bodies)) + b'}')
+
+            if path == '/spills':
+                threshold = _parse_float(query, 'threshold', 43.0)
+                return ok(await cached(('spills', threshold), query_spills, threshold))
+
+            if path == '/false-spills':
+                threshold = _parse_float(query, 'threshold', 43.0)
+                window_hours = _parse_float(query, 'window_hours', 6)
+                return ok(await cached(('false-spills', threshold, window_hours), query_false_spills, threshold, window_hours))
+
+            if path == '/attribution':
+                threshold = _parse_float(query, 'threshold', 43.0)
+                lag_hours = _parse_float(query, 'lag_hours', ATTRIBUTION_SETTINGS['catchment_lag_hours'])
+                return ok(await cached(('attribution', threshold, lag_hours), query_attribution, threshold, lag_hours))
+
+            if path == '/extract':
+                dataset = _parse_dataset(query, tuple(DATASET_TIME_COLUMNS), default='CSO')
+                start, end = _parse_time(query, 'start'), _parse_time(query, 'end')
+                limit = int(_parse_float(query, 'limit', EXTRACT_ROW_LIMIT))
+                if limit < 0:
+                    raise ValueError(f"'limit' must not be negative, got '{query['limit']}'")
+                if query.get('format', 'json') == 'csv':
+                    # Not cached: slicing is a binary search and the CSV is written straight from the slice
+                    result = query_extract(state, dataset, start, end, limit)
+                    return ok(result['rows'].to_csv(index=False).encode('utf-8'), 'text/csv; charset=utf-8')
+                return ok(await cached(('extract', dataset, start, end, limit), query_extract, dataset, start, end, limit))
+
+            return error(404, f"Unknown endpoint '{path}'")
+        except ValueError as e:
+            return error(400, str(e))
+
+    return handle
+
+def run_service(data_path, host='127.0.0.1', port=8001, cache_size=RESULT_CACHE_SIZE, use_cache=True, rules_path=None):
+    """
+    Load the data once and serve the query endpoints until interrupted with Ctrl+C.
+
+    :param data_path: Path to the Excel workbook
+    :param host: Interface to listen on
+    :param port: Port to listen on
+    :param cache_size: Number of query results to keep in memory
+    :param use_cache: Reuse the cached parsed workbook and aligned frame in output/cache
+    :param rules_path: Optional data quality rules file (see rules.load_rules)
+    """
+    print("Loading data...")
+    start = time.perf_counter()
+    state = load_state(data_path, use_cache=use_cache, rules_path=rules_path)
+    print(f"Loaded in {time.perf_counter() - start:.2f}s")
+
+    handler = make_handler(state, cache_size)
+
+    async def main():
+        warm_up = [asyncio.create_task(handler('GET', path, query, {})) for path, query in WARM_QUERIES]
+        await serve(handler, host, port)
+        await asyncio.gather(*warm_up)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
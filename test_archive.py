@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from archive import SERIES_NAMES, archive_info, read_archive, write_archive
+from normalise import normalise_datasets
+
+def _datasets():
+    cso = pd.DataFrame({'Site': ['CSO_A'] * 6,
+                        'DateTime': pd.to_datetime(['2017-11-01 00:02', '2017-11-01 00:00', '2017-11-01 00:01', '2017-11-01 00:01',
+                                                    None, '2017-11-01 00:03']),
+                        'Level': [1.25, 1.5, np.nan, 1.75, 2.0, 1 / 3]}) # Quantised and xor floats, missing values
+    sps = pd.DataFrame({'Site': ['SPS_A1', 'SPS_A1', None], 'Timestamp': pd.to_datetime(['2017-11-01 00:00:07', '2017-11-01 02:13:00', '2017-11-03 00:00:00']),
+                        'Status': [1, 0, 1], 'StateDesc': ['RUNNING', np.nan, 'RUNNING']})
+    rainfall = pd.DataFrame({'time': pd.date_range('2017-11-01', periods=5, freq='15min'), 'RG_A': [0, 0.2, 0.2, 0, 1.4]})
+    return dict(zip(SERIES_NAMES, (cso, sps, sps.assign(Site='SPS_A2'), rainfall)))
+
+def _time_sorted(df, time_col):
+    return df.iloc[np.argsort(df[time_col].to_numpy(), kind='stable')].reset_index(drop=True)
+
+def test_round_trip(tmp_path):
+    datasets = _datasets()
+    for block_rows in (1, 2, 1000):
+        path = tmp_path / f'{block_rows}.tsa'
+        write_archive(path, datasets, block_rows=block_rows)
+        for (name, df), read in zip(datasets.items(), read_archive(path)):
+            time_col = archive_info(path)['series'][name]['time_col']
+            pd.testing.assert_frame_equal(read, _time_sorted(df, time_col)) # Duplicates and missing timestamps kept
+
+def test_normalised_on_read(tmp_path):
+    datasets = _datasets()
+    write_archive(tmp_path / 'data.tsa', datasets)
+    reports = normalise_datasets(*read_archive(tmp_path / 'data.tsa'))[1]
+    expected = normalise_datasets(*datasets.values())[1]
+    for name in SERIES_NAMES:
+        for key in ('rows_out', 'duplicate_rows', 'missing_timestamps', 'conflicting_timestamps'):
+            assert reports[name][key] == expected[name][key]
+    assert reports['CSO']['duplicate_rows'] == 1
+
+def test_time_range(tmp_path):
+    datasets = _datasets()
+    write_archive(tmp_path / 'data.tsa', datasets, block_rows=2)
+    cso = read_archive(tmp_path / 'data.tsa', start='2017-11-01 00:01', end='2017-11-01 00:02')[0]
+    assert list(cso['DateTime'].dt.minute) == [1, 1, 2]
+    assert read_archive(tmp_path / 'data.tsa', start='2018-01-01')[0].empty
+
+def test_regular_times_pack_small(tmp_path):
+    write_archive(tmp_path / 'data.tsa', _datasets())
+    blocks = archive_info(tmp_path / 'data.tsa')['series']['Rainfall']['blocks']
+    assert blocks[0]['columns'][0]['type'] == 'uint8'
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from attribution import ATTRIBUTION_SETTINGS, analyse_spill_attribution, attribute_spills, storm_spill_counts
+
+def _storms(*spans, depths=None):
+    starts, ends = zip(*spans)
+    return pd.DataFrame({'storm_id': np.arange(1, len(spans) + 1), 'start_time': pd.to_datetime(starts),
+                         'end_time': pd.to_datetime(ends), 'depth_mm': depths or [1.0] * len(spans)})
+
+def _spills(*starts):
+    return pd.DataFrame({'start_time': pd.to_datetime(starts)})
+
+STORMS = _storms(('2017-11-01 00:00', '2017-11-01 02:00'), ('2017-11-01 10:00', '2017-11-01 11:00'),
+                 ('2017-11-02 12:00', '2017-11-02 13:00'), depths=[5.0, 3.0, 10.0])
+
+# A 0.4mm shower at 20:00 on the first day, too small to be a storm
+RAINFALL = pd.DataFrame({'time': pd.date_range('2017-11-01', '2017-11-03', freq='15min')})
+RAINFALL['RG_A'] = np.where(RAINFALL['time'] == pd.Timestamp('2017-11-01 20:00'), 0.4, 0.0)
+
+def test_interval_join():
+    spills = _spills('2017-11-01 01:00', '2017-11-01 10:30', '2017-11-01 13:00', '2017-11-01 14:00', '2017-11-01 23:30',
+                     '2017-11-02 10:00', '2017-11-02 12:30')
+    events = attribute_spills(spills, STORMS, RAINFALL)
+    assert list(events['storm_count']) == [1, 2, 2, 2, 0, 0, 1] # A window end (storm end + lag) is inclusive
+    assert events['storm_id'].tolist() == [1, 2, 2, 2, pd.NA, pd.NA, 3]
+    assert list(events['attributed_depth_mm']) == [5.0, 8.0, 8.0, 8.0, 0.0, 0.0, 10.0]
+    assert list(events['hours_since_rain'][:4]) == [0.0, 0.0, 2.0, 3.0]
+    assert events['storm_start'].isna().tolist() == [False] * 4 + [True] * 2 + [False]
+
+def test_no_storm_and_dry_weather():
+    events = attribute_spills(_spills('2017-11-01 23:30', '2017-11-02 10:00'), STORMS, RAINFALL)
+    assert list(events['no_storm']) == [True, True]
+    assert list(events['dry_weather']) == [False, True] # The shower is in the lag window of the first spill only
+    assert list(events['rain_12h_mm']) == pytest.approx([0.4, 0.0])
+    wetter = attribute_spills(_spills('2017-11-01 23:30'), STORMS, RAINFALL, dict(ATTRIBUTION_SETTINGS, dry_weather_max_mm=0.5))
+    assert wetter['dry_weather'].item()
+
+def test_matches_brute_force():
+    rng = np.random.default_rng(0)
+    starts = pd.Timestamp('2017-11-01') + pd.to_timedelta(np.sort(rng.choice(300, 40, replace=False)) * 60, unit='min')
+    storms = _storms(*zip(starts[::2], starts[::2] + pd.to_timedelta(rng.integers(1, 60, 20), unit='min')))
+    spills = _spills(*(pd.Timestamp('2017-11-01') + pd.to_timedelta(rng.integers(0, 19_000, 200), unit='min')))
+    lag = pd.Timedelta(hours=ATTRIBUTION_SETTINGS['catchment_lag_hours'])
+
+    expected = [((storms['start_time'] <= start) & (start <= storms['end_time'] + lag)).to_numpy() for start in spills['start_time']]
+    events = attribute_spills(spills, storms, RAINFALL)
+    assert list(events['storm_count']) == [int(matched.sum()) for matched in expected]
+    assert list(storm_spill_counts(storms, spills)['spill_count']) == list(np.sum(expected, axis=0))
+
+def test_lag_must_be_finite():
+    for lag in (np.nan, np.inf, -1):
+        with pytest.raises(ValueError):
+            attribute_spills(_spills('2017-11-01'), STORMS, RAINFALL, dict(ATTRIBUTION_SETTINGS, catchment_lag_hours=lag))
+
+def test_analyse_spill_attribution():
+    cso = pd.DataFrame({'DateTime': pd.date_range('2017-11-01', '2017-11-03', freq='15min')})
+    cso['Level'] = np.where(cso['DateTime'].isin(pd.to_datetime(['2017-11-01 01:00', '2017-11-02 06:00'])), 50.0, 30.0)
+    rainfall = RAINFALL.assign(RG_A=np.where(RAINFALL['time'] < pd.Timestamp('2017-11-01 01:00'), 1.0, 0.0))
+    result = analyse_spill_attribution(cso, rainfall)
+    assert (result['spill_count'], result['no_storm_count'], result['dry_weather_count'], result['storms_with_spills']) == (2, 1, 1, 1)
+    assert result['status'] == 'warning'
@@ -0,0 +1,26 @@
+import pytest
+
+from main import DATA_PATH, parse_args
+
+@pytest.mark.parametrize('argv', [
+    ['--workers', '4', '--force', '--timings', '--no-cache', '--data', 'x.tsa', '--rules', 'r.json', '--start', '2017-11-01',
+     '--end', '2017-11-02', 'quality'],
+    ['quality', '--workers', '4', '--force', '--timings', '--no-cache', '--data', 'x.tsa', '--rules', 'r.json', '--start',
+     '2017-11-01', '--end', '2017-11-02']
+])
+def test_common_options_before_or_after_command(argv):
+    args = parse_args(argv)
+    assert args.command == 'quality'
+    assert (args.workers, args.force, args.timings, args.no_cache) == (4, True, True, True)
+    assert (args.data, args.rules, args.start, args.end) == ('x.tsa', 'r.json', '2017-11-01', '2017-11-02')
+
+def test_defaults():
+    for argv in ([], ['plots']):
+        args = parse_args(argv)
+        assert args.command == (argv[0] if argv else 'all')
+        assert (args.data, args.workers, args.force, args.timings, args.no_cache) == (DATA_PATH, 1, False, False, False)
+        assert (args.rules, args.start, args.end) == (None, None, None)
+
+def test_subcommand_options():
+    args = parse_args(['--data', 'x.tsa', 'serve', '--port', '9000'])
+    assert (args.data, args.port, args.cache_size) == ('x.tsa', 9000, 256)
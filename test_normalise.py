@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from normalise import check_time_order, normalise_datasets, normalise_timestamps
+
+def _times(*values):
+    return pd.to_datetime(list(values))
+
+def test_sorts_and_drops_missing_timestamps():
+    df = pd.DataFrame({'time': _times('2017-11-01 00:10', None, '2017-11-01 00:00', '2017-11-01 00:05'), 'RG_A': [3., 9., 1., 2.]})
+    normalised, report = normalise_timestamps(df, 'time')
+    assert list(normalised['RG_A']) == [1., 2., 3.]
+    assert (report['missing_timestamps'], report['out_of_order'], report['sorted']) == (1, 1, True)
+    check_time_order(normalised['time'].to_numpy())
+
+def test_clean_data_is_unchanged():
+    df = pd.DataFrame({'time': _times('2017-11-01 00:00', '2017-11-01 00:05'), 'RG_A': [1., 2.]})
+    normalised, report = normalise_timestamps(df, 'time', policy='max')
+    pd.testing.assert_frame_equal(normalised, df)
+    assert (report['rows_out'], report['duplicate_rows'], report['sorted']) == (2, 0, False)
+
+def test_mean_policy():
+    df = pd.DataFrame({'Site': 'CSO_A', 'DateTime': _times('2017-11-01 00:01', '2017-11-01 00:00', '2017-11-01 00:01', '2017-11-01 00:01'),
+                       'Level': [1., 5., np.nan, 2.]})
+    normalised, report = normalise_timestamps(df, 'DateTime', ('Site',), 'mean')
+    assert list(normalised['Level']) == [5., 1.5] # NaN ignored
+    assert (report['duplicate_rows'], report['exact_duplicate_rows'], report['conflicting_timestamps']) == (2, 0, 1)
+
+def test_last_policy_per_site():
+    df = pd.DataFrame({'Site': ['A', 'B', 'A', 'A'], 'Timestamp': _times('2017-11-01', '2017-11-01', '2017-11-01', '2017-11-02'),
+                       'Status': [1, 0, 0, 1], 'StateDesc': ['RUNNING', 'STOPPED', 'STOPPED', 'RUNNING']})
+    normalised, report = normalise_timestamps(df, 'Timestamp', ('Site',), 'last')
+    assert list(zip(normalised['Site'], normalised['Status'])) == [('A', 0), ('B', 0), ('A', 1)] # Sites never merged
+    assert report['duplicate_rows'] == 1
+
+def test_max_policy_and_exact_duplicates():
+    df = pd.DataFrame({'time': _times('2017-11-01', '2017-11-01', '2017-11-01', '2017-11-02'), 'RG_A': [0.2, np.nan, 0.4, 0.0]})
+    normalised, report = normalise_timestamps(df, 'time', policy='max')
+    assert list(normalised['RG_A']) == [0.4, 0.0]
+    exact = normalise_timestamps(pd.concat([df, df.iloc[[3]]]), 'time', policy='max')[1]
+    assert (exact['duplicate_rows'], exact['exact_duplicate_rows']) == (3, 1)
+
+def test_dataset_policies():
+    cso = pd.DataFrame({'Site': 'CSO_A', 'DateTime': _times('2017-11-01', '2017-11-01'), 'Level': [1., 2.]})
+    sps = pd.DataFrame({'Site': 'A', 'Timestamp': _times('2017-11-01', '2017-11-01'), 'Status': [1, 0]})
+    rainfall = pd.DataFrame({'time': _times('2017-11-01', '2017-11-01'), 'RG_A': [1., 2.]})
+    (cso, sps_a1, sps_a2, rainfall), reports = normalise_datasets(cso, sps, sps, rainfall)
+    assert (cso['Level'].item(), sps_a1['Status'].item(), sps_a2['Status'].item(), rainfall['RG_A'].item()) == (1.5, 0, 0, 2.)
+    assert [report['policy'] for report in reports.values()] == ['mean', 'last', 'last', 'max']
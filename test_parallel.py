@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from alignment import align_datasets
+from data_quality import analyse_cso_data, analyse_rainfall_data, analyse_sps_data, detect_potential_false_spills
+from parallel import (analyse_cso_data_parallel, analyse_rainfall_data_parallel, analyse_sps_data_parallel,
+                      detect_potential_false_spills_parallel, partition_positions)
+
+def assert_same(single, partitioned, path='result'):
+    if isinstance(single, dict):
+        assert list(single) == list(partitioned), path
+        for key in single:
+            assert_same(single[key], partitioned[key], f'{path}/{key}')
+    elif isinstance(single, pd.DataFrame):
+        pd.testing.assert_frame_equal(single, partitioned, check_exact=True, obj=path)
+    elif isinstance(single, pd.Series):
+        pd.testing.assert_series_equal(single, partitioned, check_exact=True, obj=path)
+    elif isinstance(single, (list, tuple)):
+        assert len(single) == len(partitioned), path
+        for a, b in zip(single, partitioned):
+            assert_same(a, b, path)
+    else:
+        assert (single == partitioned) or (pd.isna(single) and pd.isna(partitioned)), (path, single, partitioned)
+
+@pytest.fixture(scope='module')
+def datasets():
+    # Three days of minute readings, with spikes, a flatline and spills on and around the day boundaries
+    rng = np.random.default_rng(0)
+    times = pd.date_range('2017-11-01', periods=3 * 1440, freq='min')
+    level = np.round(35 + rng.normal(0, 0.2, len(times)), 2)
+    for day_start in (1440, 2880):
+        level[day_start - 1] = level[day_start + 2] = 50.0 # Spikes next to the boundary, inside the halo
+        level[day_start - 30:day_start + 40] += 9.0 # Spill across the boundary
+    level[600:800] = 35.0 # Flatline
+    level[[100, 2000]] = np.nan
+    cso = pd.DataFrame({'Site': 'CSO_A', 'DateTime': times, 'Level': level})
+
+    def pumps(name, minutes):
+        status = np.arange(len(minutes)) % 2
+        return pd.DataFrame({'Site': name, 'Timestamp': times[0] + pd.to_timedelta(minutes, unit='min'),
+                             'Status': status, 'StateDesc': np.where(status == 1, 'RUNNING', 'STOPPED')})
+
+    sps_a1 = pumps('SPS_A1', [5, 60, 1420, 1450, 2870, 2950, 4000, 4100])
+    sps_a2 = pumps('SPS_A2', [30, 90, 1400, 1500, 2860, 2890])
+    rainfall = pd.DataFrame({'time': pd.date_range('2017-11-01', periods=3 * 96, freq='15min'),
+                             'RG_A': np.round(np.where(rng.random(3 * 96) < 0.2, rng.random(3 * 96) * 4, 0), 1)})
+    rainfall.loc[95, 'RG_A'] = 40.0 # Spike on the first boundary
+    return cso, sps_a1, sps_a2, rainfall
+
+def test_partition_positions():
+    times = pd.to_datetime(['2017-11-30 23:59', '2017-12-01 00:00', None, '2017-12-31 00:00'])
+    assert [list(positions) for positions in partition_positions(times)] == [[2], [0], [1, 3]]
+
+@pytest.mark.parametrize('freq', ['D', 'W', 'M'])
+def test_quality_matches_single_pass(datasets, freq):
+    cso, sps_a1, sps_a2, rainfall = datasets
+    assert_same(analyse_cso_data(cso.copy()), analyse_cso_data_parallel(cso.copy(), max_workers=1, freq=freq))
+    assert_same(analyse_sps_data(sps_a1.copy(), 'SPS_A1', paired_sps_df=sps_a2),
+                analyse_sps_data_parallel(sps_a1.copy(), 'SPS_A1', paired_sps_df=sps_a2, max_workers=1, freq=freq))
+    assert_same(analyse_rainfall_data(rainfall.copy()), analyse_rainfall_data_parallel(rainfall.copy(), max_workers=1, freq=freq))
+
+def test_spikes_next_to_partition_boundaries(datasets):
+    result = analyse_cso_data_parallel(datasets[0].copy(), max_workers=1, freq='D')['sensor_faults']['spikes']
+    assert_same(analyse_cso_data(datasets[0].copy())['sensor_faults']['spikes'], result)
+    assert result['status'] == 'warning' and result['spike_count'] >= 4
+
+@pytest.mark.parametrize('freq', ['D', 'h'])
+def test_false_spills_across_partition_boundaries(datasets, freq):
+    aligned = align_datasets(*datasets, use_cache=False)
+    single = detect_potential_false_spills(aligned)
+    assert_same(single, detect_potential_false_spills_parallel(aligned, max_workers=1, freq=freq))
+    assert single['status'] == 'warning'
+
+def test_process_pool(datasets):
+    assert_same(analyse_cso_data(datasets[0].copy()), analyse_cso_data_parallel(datasets[0].copy(), max_workers=2, freq='D'))
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from rules import DEFAULT_RULES, compile_rules, count_rule_violations, evaluate_rules, merge_rule_counts, rule_results
+
+SPS_RULES = compile_rules(DEFAULT_RULES['SPS_A1'], 'SPS_A1')
+
+def test_all_missing_categorical_column():
+    df = pd.DataFrame({'Site': ['A'] * 3, 'Status': [1., 0., np.nan], 'StateDesc': [np.nan] * 3})
+    result = evaluate_rules(df, SPS_RULES)
+    assert result['variable_ranges']['StateDesc']['status'] == 'ok'
+    assert result['cross_column']['Status/StateDesc']['violation_count'] == 2 # Status set, StateDesc missing
+
+def test_empty_frame():
+    df = pd.DataFrame({'Site': pd.Series(dtype=str), 'Status': pd.Series(dtype=float), 'StateDesc': pd.Series(dtype=str)})
+    result = evaluate_rules(df, SPS_RULES)
+    assert all(check['status'] == 'ok' for check in result['variable_ranges'].values())
+    assert result['cross_column']['Status/StateDesc']['status'] == 'ok'
+
+def test_all_missing_partition_merges():
+    df = pd.DataFrame({'Site': ['A'] * 4, 'Status': [1, 0, 1, 1], 'StateDesc': [np.nan, np.nan, 'RUNNING', 'TRIPPED']})
+    counts = merge_rule_counts([count_rule_violations(df.iloc[:2], SPS_RULES), count_rule_violations(df.iloc[2:], SPS_RULES)])
+    assert rule_results(SPS_RULES, counts) == evaluate_rules(df, SPS_RULES)
+    assert evaluate_rules(df, SPS_RULES)['variable_ranges']['StateDesc']['unexpected_values'] == ['TRIPPED']
+
+def test_site_overrides():
+    rules = compile_rules({'ranges': {'Level': [0, 100]}, 'allowed': {'State': ['OK']},
+                           'sites': {'B': {'ranges': {'Level': [0, 150]}, 'allowed': {'State': ['OK', 'TRIPPED']}}}})
+    df = pd.DataFrame({'Site': ['A', 'B', 'B', None], 'Level': [120., 120., 160., -1.], 'State': ['TRIPPED', 'TRIPPED', 'OK', np.nan]})
+    result = evaluate_rules(df, rules)['variable_ranges']
+    assert (result['Level']['below_min_count'], result['Level']['above_max_count']) == (1, 2)
+    assert result['State']['unexpected_count'] == 1
@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from service import make_handler
+
+def _request(handler, path, **query):
+    status, body, content_type, _ = asyncio.run(handler('GET', path, query, {}))
+    return status, json.loads(body) if content_type == 'application/json' else body
+
+@pytest.fixture
+def handler():
+    cso = pd.DataFrame({'Site': 'CSO_A', 'DateTime': pd.date_range('2017-11-02', periods=6, freq='h'), 'Level': np.arange(6.0)})
+    return make_handler({'datasets': {'CSO': cso}, 'loaded_at': pd.Timestamp('2017-11-03'), 'normalisation': {}}, tile_dir='.')
+
+def test_extract_time_range(handler):
+    status, body = _request(handler, '/extract', start='2017-11-02T01:00', end='2017-11-02T03:00')
+    assert status == 200
+    assert [row['Level'] for row in body['rows']] == [1.0, 2.0, 3.0]
+
+def test_extract_tz_aware_times(handler):
+    status, body = _request(handler, '/extract', start='2017-11-02T02:00+01:00', end='2017-11-02T02:00Z')
+    assert status == 200
+    assert [row['Level'] for row in body['rows']] == [1.0, 2.0]
+
+@pytest.mark.parametrize('query', [{'start': 'yesterday-ish'}, {'end': ''}, {'limit': '-1'}, {'limit': 'nan'}])
+def test_extract_bad_parameters(handler, query):
+    status, body = _request(handler, '/extract', **query)
+    assert status == 400 and body['status'] == 'error'
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', 'abc'])
+def test_bad_numbers(handler, value):
+    assert _request(handler, '/spills', threshold=value)[0] == 400
@@ -0,0 +1,390 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache import figure_code_version, fingerprint
+from rendering import save_figure, flush_figures
+
+TILE_DIR = Path('output/tiles')
+
+# Pyramid layout. Level 0 buckets are base_bucket wide and every level above merges zoom_factor buckets of
+# the level below. A tile always holds buckets_per_tile buckets, so a level 0 tile is one day, a level 1
+# tile four days, and so on. Buckets and tiles are counted from TILE_ORIGIN so tile numbers never depend
+# on where the data starts.
+TILE_SETTINGS = {
+    'base_bucket': '5min',
+    'zoom_factor': 4,
+    'levels': 6,
+    'buckets_per_tile': 288,
+    'tile_size': (1024, 256), # Pixels
+    'pump_sources': ('SPS_A1', 'SPS_A2')
+}
+
+TILE_ORIGIN = pd.Timestamp('1970-01-01')
+
+# How a bucket column is combined when buckets are merged into the next level (NaN = no readings)
+_REDUCERS = {'min': np.fmin, 'max': np.fmax, 'sum': np.add}
+
+PUMP_COLOURS = ('green', 'darkorange', 'purple', 'brown')
+
+def _bucket_columns(pump_sources):
+    columns = {
+        'level_min': 'min',
+        'level_max': 'max',
+        'level_count': 'sum',
+        'rain_total': 'sum',
+        'rain_max': 'max'
+    }
+    columns.update({f'{name}_activations': 'sum' for name in pump_sources})
+    return columns
+
+def _reduce_buckets(bucket_ids, columns, reducers):
+    """
+    Combine consecutive rows with the same bucket id. bucket_ids must be sorted.
+
+    :param bucket_ids: Sorted int64 bucket id per row
+    :param columns: Dictionary of column name -> value array (one value per row)
+    :param reducers: Dictionary of column name -> 'min', 'max' or 'sum'
+    :return: DataFrame with one row per bucket: 'bucket' plus the reduced columns
+    """
+    if len(bucket_ids) == 0:
+        return pd.DataFrame({'bucket': np.array([], dtype=np.int64), **{name: np.array([]) for name in columns}})
+    starts = np.flatnonzero(np.concatenate(([True], bucket_ids[1:] != bucket_ids[:-1])))
+    buckets = {'bucket': bucket_ids[starts]}
+    for name, values in columns.items():
+        buckets[name] = _REDUCERS[reducers[name]].reduceat(values, starts)
+    return pd.DataFrame(buckets)
+
+def base_buckets(aligned, settings=TILE_SETTINGS):
+    """
+    Aggregate the aligned frame into level 0 buckets: CSO level min/max, rainfall total and largest reading,
+    and the number of RUNNING reports of each pump. Every aggregate is one reduceat over the sorted timeline.
+
+    :param aligned: Aligned DataFrame from alignment.align_datasets
+    :param settings: Tile settings (see TILE_SETTINGS)
+    :return: DataFrame with one row per non-empty bucket
+    """
+    times = aligned['DateTime'].to_numpy(dtype='datetime64[ns]').view('i8')
+    width = pd.Timedelta(settings['base_bucket']).value
+    bucket_ids = (times - TILE_ORIGIN.value) // width
+
+    cso_observed = aligned['CSO_observed'].to_numpy()
+    level = np.where(cso_observed, aligned['CSO_Level'].to_numpy(dtype=float), np.nan)
+    rain_observed = aligned['Rainfall_observed'].to_numpy()
+    rain = np.where(rain_observed, aligned['Rainfall_RG_A'].to_numpy(dtype=float), np.nan)
+
+    columns = {
+        'level_min': level,
+        'level_max': level,
+        'level_count': cso_observed.astype(np.int64),
+        'rain_total': np.nan_to_num(rain),
+        'rain_max': rain
+    }
+    for name in settings['pump_sources']:
+        running = aligned[f'{name}_observed'].to_numpy() & (aligned[f'{name}_Status'].to_numpy() == 1)
+        columns[f'{name}_activations'] = running.astype(np.int64)
+
+    return _reduce_buckets(bucket_ids, columns, _bucket_columns(settings['pump_sources']))
+
+def build_pyramid(aligned, settings=TILE_SETTINGS):
+    """
+    Pre-aggregate the aligned frame at every zoom level. Each level is built from the level below it,
+    so the raw data is only read once.
+
+    :param aligned: Aligned DataFrame from alignment.align_datasets
+    :param settings: Tile settings (see TILE_SETTINGS)
+    :return: List of bucket DataFrames, finest level first
+    """
+    reducers = _bucket_columns(settings['pump_sources'])
+    pyramid = [base_buckets(aligned, settings)]
+    for _ in range(1, settings['levels']):
+        below = pyramid[-1]
+        pyramid.append(_reduce_buckets(below['bucket'].to_numpy() // settings['zoom_factor'],
+                                       {name: below[name].to_numpy() for name in reducers}, reducers))
+    return pyramid
+
+def _round_limit(value):
+    # Up to 1, 2 or 5 times a power of ten, so a scale only moves when the data outgrows it
+    if not np.isfinite(value) or value <= 0:
+        return 1.0
+    step = 10.0 ** np.floor(np.log10(value))
+    return float(next(multiple * step for multiple in (1, 2, 5, 10) if value <= multiple * step))
+
+def _level_range(base, threshold, settings):
+    """
+    Vertical scale shared by every tile, so tiles line up across levels and neighbours: the CSO level range
+    rounded out to whole metres, always including the threshold. The bottom margin keeps the level clear of
+    the pump strips (5% of the height each).
+    """
+    observed = base['level_count'].to_numpy() > 0
+    level_min, level_max = threshold, threshold
+    if observed.any():
+        level_min = min(np.floor(np.nanmin(base['level_min'].to_numpy()[observed])), threshold)
+        level_max = max(np.ceil(np.nanmax(base['level_max'].to_numpy()[observed])), threshold)
+    bottom, top = 0.05 * len(settings['pump_sources']) + 0.02, 0.05
+    span = (level_max - level_min) / (1 - bottom - top) if level_max > level_min else 1.0
+    return float(level_min - bottom * span), float(level_max + top * span)
+
+def _tile_renderer(settings, level_range, threshold):
+    """
+    Set up one figure that every tile is drawn on. Tiles have no axes or labels, so neighbouring tiles join
+    up seamlessly; the viewer draws the time axis. Uses the Agg canvas directly, without pyplot.
+
+    :return: Function (tile_buckets, rain_limit, output_path) that renders and saves one tile
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    width, height = settings['tile_size']
+    n = settings['buckets_per_tile']
+    edges = np.arange(n + 1)
+
+    fig = Figure(figsize=(width / 100, height / 100), dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    rain_ax = ax.twinx()
+    for axes in (ax, rain_ax):
+        axes.set_axis_off()
+        axes.set_xlim(0, n)
+    ax.set_ylim(*level_range)
+    ax.axhline(threshold, color='red', linestyle='--', linewidth=1)
+
+    def render(tile, rain_limit, output_path):
+        def padded(column):
+            # One value per bucket (NaN where the bucket is empty), repeated at the end for step='post'
+            values = np.full(n + 1, np.nan)
+            values[tile['position']] = tile[column]
+            values[n] = values[n - 1]
+            return values
+
+        # Rainfall hangs from the top and uses the upper third of the tile
+        rain_ax.set_ylim(rain_limit * 3, 0)
+        artists = [
+            rain_ax.fill_between(edges, 0, np.nan_to_num(padded('rain_total')), step='post', color='skyblue', linewidth=0),
+            ax.fill_between(edges, padded('level_min'), padded('level_max'), step='post', color='blue', linewidth=0.8)
+        ]
+        # A strip along the bottom per pump, marking buckets where it reported RUNNING
+        for i, name in enumerate(settings['pump_sources']):
+            active = tile['position'][tile[f'{name}_activations'] > 0]
+            artists.append(ax.vlines(active + 0.5, 0.05 * i, 0.05 * (i + 1), transform=ax.get_xaxis_transform(),
+                                     color=PUMP_COLOURS[i % len(PUMP_COLOURS)], linewidth=1.5))
+
+        save_figure(fig, output_path, temporary=artists)
+
+    return render
+
+def render_tiles(aligned, threshold=43.0, output_dir=TILE_DIR, settings=TILE_SETTINGS, force=False):
+    """
+    Build the tile pyramid for the aligned frame and render every tile as a PNG, plus index.json and a
+    static viewer (index.html) that picks the level and tiles for any time window.
+
+    Tiles are only re-rendered when their buckets, the settings, the code or the scales changed. The scales
+    are shared by all tiles (the level range per run, the rainfall limit per zoom level) and rounded, so a
+    re-run after adding a day of data usually renders a handful of tiles; data that moves a scale past its
+    rounded limit re-renders every tile drawn with it.
+
+    :param aligned: Aligned DataFrame from alignment.align_datasets
+    :param threshold: Spill threshold drawn on every tile
+    :param output_dir: Directory for the tiles, index.json and index.html
+    :param settings: Tile settings (see TILE_SETTINGS)
+    :param force: Render every tile even if it is unchanged
+    :return: Dictionary with the number of tiles rendered and skipped
+    """
+    output_dir = Path(output_dir)
+    pyramid = build_pyramid(aligned, settings)
+    base = pyramid[0]
+
+    level_range = _level_range(base, threshold, settings)
+
+    try:
+        previous = json.loads((output_dir / 'index.json').read_text())
+        previous_keys = {level['level']: level['keys'] for level in previous['levels']}
+    except (OSError, ValueError, KeyError):
+        previous_keys = {}
+
+    code_version = figure_code_version(__file__) # Tiles are drawn with rendering.py too
+    render = None
+    stats = {'rendered': 0, 'skipped': 0}
+    base_width = pd.Timedelta(settings['base_bucket'])
+    n = settings['buckets_per_tile']
+    levels = []
+
+    for level, buckets in enumerate(pyramid):
+        bucket_width = base_width * settings['zoom_factor'] ** level
+        rain_limit = _round_limit(buckets['rain_total'].max())
+
+        tile_ids = buckets['bucket'].to_numpy() // n
+        # No tiles at all when there is no data in the time range
+        bounds = np.flatnonzero(np.concatenate(([True], tile_ids[1:] != tile_ids[:-1], [True]))) if len(tile_ids) else []
+        keys = {}
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            tile_id = int(tile_ids[lo])
+            tile = buckets.iloc[lo:hi].reset_index(drop=True)
+            tile['position'] = tile['bucket'].to_numpy() - tile_id * n
+            key = fingerprint(tile, settings, level_range, rain_limit, threshold, code_version)
+            keys[str(tile_id)] = key
+
+            output_path = output_dir / str(level) / f'{tile_id}.png'
+            if not force and previous_keys.get(level, {}).get(str(tile_id)) == key and output_path.exists():
+                stats['skipped'] += 1
+                continue
+            if render is None:
+                render = _tile_renderer(settings, level_range, threshold)
+            render({column: tile[column].to_numpy() for column in tile.columns}, rain_limit, output_path)
+            stats['rendered'] += 1
+
+        # Tiles left over from an earlier run with different data
+        for stale in set(previous_keys.get(level, {})) - set(keys):
+            (output_dir / str(level) / f'{stale}.png').unlink(missing_ok=True)
+
+        levels.append({
+            'level': level,
+            'bucket_seconds': bucket_width.total_seconds(),
+            'tile_seconds': (bucket_width * n).total_seconds(),
+            'rain_limit_mm': rain_limit,
+            'keys': keys
+        })
+
+    flush_figures()
+
+    index = {
+        'origin': TILE_ORIGIN.isoformat(),
+        'start': pd.Timestamp(aligned['DateTime'].iloc[0]).isoformat() if len(aligned) else None,
+        'end': pd.Timestamp(aligned['DateTime'].iloc[-1]).isoformat() if len(aligned) else None,
+        'threshold': threshold,
+        'level_range': level_range,
+        'tile_size': list(settings['tile_size']),
+        'pump_sources': list(settings['pump_sources']),
+        'pump_colours': [PUMP_COLOURS[i % len(PUMP_COLOURS)] for i in range(len(settings['pump_sources']))],
+        'levels': levels
+    }
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / 'index.json').write_text(json.dumps(index, indent=1))
+    # The index is also embedded in the page so the viewer works when opened straight from disk
+    (output_dir / 'index.html').write_text(VIEWER_HTML.replace('__INDEX__', json.dumps(index)))
+    return stats
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>CSO Level, Pump Activation and Rainfall</title>
+<style>
+  body { font-family: sans-serif; margin: 16px; }
+  #controls { margin-bottom: 8px; }
+  #view { position: relative; height: 256px; overflow: hidden; border: 1px solid #999; cursor: grab; }
+  #view img { position: absolute; top: 0; height: 100%; image-rendering: pixelated; user-select: none; }
+  #axis { position: relative; height: 20px; font-size: 11px; }
+  #axis span { position: absolute; transform: translateX(-50%); white-space: nowrap; }
+  #legend { font-size: 12px; margin-top: 8px; }
+  .swatch { display: inline-block; width: 12px; height: 12px; margin: 0 4px 0 12px; vertical-align: middle; }
+</style>
+</head>
+<body>
+<div id="controls">
+  From <input id="start" type="datetime-local"> to <input id="end" type="datetime-local"> (UTC)
+  <button id="go">Show</button> <button id="zoom-in">+</button> <button id="zoom-out">&minus;</button>
+  <button id="all">All</button> <span id="info"></span>
+</div>
+<div id="view"></div>
+<div id="axis"></div>
+<div id="legend"></div>
+<script>
+const INDEX = __INDEX__;
+const MAX_TILES_ACROSS = 3; // Finest level whose tiles cover the window in at most this many tiles
+const origin = Date.parse(INDEX.origin + 'Z');
+const view = document.getElementById('view');
+const axis = document.getElementById('axis');
+let start = Date.parse(INDEX.start + 'Z'), end = Date.parse(INDEX.end + 'Z');
+
+function pickLevel() {
+  for (const level of INDEX.levels) {
+    if ((end - start) / (level.tile_seconds * 1000) <= MAX_TILES_ACROSS) return level;
+  }
+  return INDEX.levels[INDEX.levels.length - 1];
+}
+
+function toInput(ms) { return new Date(ms).toISOString().slice(0, 16); }
+
+function draw() {
+  const level = pickLevel(), tileMs = level.tile_seconds * 1000;
+  const scale = view.clientWidth / (end - start);
+  view.replaceChildren();
+  for (let t = Math.floor((start - origin) / tileMs); t <= Math.floor((end - origin) / tileMs); t++) {
+    if (!(String(t) in level.keys)) continue; // No data in this tile
+    const img = document.createElement('img');
+    img.src = level.level + '/' + t + '.png?' + level.keys[t].slice(0, 8);
+    img.style.left = ((origin + t * tileMs - start) * scale) + 'px';
+    img.style.width = (tileMs * scale) + 'px';
+    img.draggable = false;
+    view.appendChild(img);
+  }
+
+  // Time axis labels
+  axis.replaceChildren();
+  for (let i = 0; i <= 6; i++) {
+    const label = document.createElement('span');
+    const t = start + (end - start) * i / 6;
+    label.textContent = new Date(t).toISOString().slice(0, 16).replace('T', ' ');
+    label.style.left = (100 * i / 6) + '%';
+    axis.appendChild(label);
+  }
+
+  document.getElementById('start').value = toInput(start);
+  document.getElementById('end').value = toInput(end);
+  document.getElementById('info').textContent =
+    'level ' + level.level + ', ' + (level.bucket_seconds / 60) + ' min buckets';
+  document.getElementById('legend').innerHTML =
+    '<span class="swatch" style="background:blue"></span>CSO level (min-max per bucket, ' +
+    INDEX.level_range.map(v => v.toFixed(1)).join(' to ') + ' bottom to top)' +
+    '<span class="swatch" style="background:red"></span>Spill threshold ' + INDEX.threshold +
+    '<span class="swatch" style="background:skyblue"></span>Rainfall per bucket (top third = ' +
+    level.rain_limit_mm.toFixed(1) + ' mm)' +
+    INDEX.pump_sources.map((name, i) =>
+      '<span class="swatch" style="background:' + INDEX.pump_colours[i] + '"></span>' + name + ' running').join('');
+  history.replaceState(null, '', '#' + toInput(start) + '/' + toInput(end));
+}
+
+function zoom(factor, centre) {
+  centre = centre === undefined ? (start + end) / 2 : centre;
+  start = centre - (centre - start) * factor;
+  end = centre + (end - centre) * factor;
+  draw();
+}
+
+document.getElementById('go').onclick = () => {
+  const s = Date.parse(document.getElementById('start').value + 'Z');
+  const e = Date.parse(document.getElementById('end').value + 'Z');
+  if (s < e) { start = s; end = e; draw(); }
+};
+document.getElementById('zoom-in').onclick = () => zoom(0.5);
+document.getElementById('zoom-out').onclick = () => zoom(2);
+document.getElementById('all').onclick = () => {
+  start = Date.parse(INDEX.start + 'Z'); end = Date.parse(INDEX.end + 'Z'); draw();
+};
+view.addEventListener('wheel', event => {
+  event.preventDefault();
+  const rect = view.getBoundingClientRect();
+  zoom(event.deltaY > 0 ? 1.25 : 0.8, start + (end - start) * (event.clientX - rect.left) / rect.width);
+});
+let dragX = null;
+view.addEventListener('mousedown', event => { dragX = event.clientX; });
+window.addEventListener('mouseup', () => { dragX = null; });
+window.addEventListener('mousemove', event => {
+  if (dragX === null) return;
+  const shift = (dragX - event.clientX) * (end - start) / view.clientWidth;
+  start += shift; end += shift; dragX = event.clientX;
+  draw();
+});
+window.addEventListener('resize', draw);
+
+// Window from the address, e.g. index.html#2017-11-01T00:00/2017-11-20T00:00
+const [hashStart, hashEnd] = location.hash.slice(1).split('/').map(v => Date.parse(v + 'Z'));
+if (hashStart < hashEnd) { start = hashStart; end = hashEnd; }
+draw();
+</script>
+</body>
+</html>
+"""
@@ -1,163 +1,213 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
 import pandas as pd
 
-# OLD - PRENDING UPDATE/REMOVAL
-def create_missing_values_table(analyses):
+from alignment import pump_activation_mask
+from cache import cached_figure
+from data_quality import analyse_spill_events
+from rendering import figure_template, rescale, save_figure, flush_figures
+
+# Every plot family draws on a reused figure template (see rendering.py): the _build_* functions set up
+# the axes and artists once, the plot functions only swap in the data. PNGs are written in the background,
+# so call flush_figures() before using the files.
+
+HISTOGRAM_BINS = 50
+
+# Missing value heatmaps show at most this many rows; each drawn row marks a value missing anywhere in its
+# slice of the data, so a single gap never disappears between pixels
+HEATMAP_ROWS = 2000
+
+def _text_colour(rgba):
     """
-    Create a formatted table of missing values across all datasets.
-    
-    :param analyses: Dictionary containing analysis results for each dataset
-    :return: DataFrame containing the formatted table
+    Black or white, whichever reads better on the given background colour.
     """
-    # Create a list to store the data
-    data = []
-    
-    # Add data for each dataset
-    for dataset_name, analysis in analyses.items():
-        total_missing = analysis['missing_values']['Missing Values'].sum()
-        data.append({
-            'Dataset': dataset_name,
-            'Missing Values': total_missing
-        })
-    
-    # Create DataFrame and format it
-    df = pd.DataFrame(data)
-    df = df.set_index('Dataset')
-    
-    # Save to CSV
-    df.to_csv('output/tables/missing_values_summary.csv')
-    
-    return df
-
+    rgb = np.asarray(rgba[:3])
+    rgb = np.where(rgb <= 0.03928, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return 'black' if rgb @ [0.2126, 0.7152, 0.0722] > 0.408 else 'white'
+
+def _build_time_series(fig):
+    ax = fig.add_subplot()
+    ax.xaxis_date()
+    line, = ax.plot([], [])
+    ax.set_xlabel('Date')
+    ax.tick_params(axis='x', labelrotation=45)
+    return {'ax': ax, 'line': line}
+
+@cached_figure
 def plot_time_series(df, datetime_col, value_col, title, output_path):
     """
     Create a time series plot.
-    
+
     :param df: pandas DataFrame containing the data
     :param datetime_col: Name of the column containing datetime values
     :param value_col: Name of the column containing values to plot
     :param title: Title for the plot
     :param output_path: Path where to save the plot
     """
-    plt.figure(figsize=(15, 6))
-    plt.plot(df[datetime_col], df[value_col])
-    plt.title(title)
-    plt.xlabel('Date')
-    plt.ylabel(value_col)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
-
+    template = figure_template('time_series', (15, 6), _build_time_series)
+    ax = template['ax']
+    template['line'].set_data(df[datetime_col].to_numpy(), df[value_col].to_numpy())
+    ax.set_title(title)
+    ax.set_ylabel(value_col)
+    rescale(ax)
+    save_figure(template['fig'], output_path)
+
+def _build_distribution(fig):
+    ax = fig.add_subplot()
+    bars = ax.bar(np.arange(HISTOGRAM_BINS), np.zeros(HISTOGRAM_BINS), width=1, align='edge',
+                  color='C0', alpha=0.75, edgecolor='black', linewidth=1)
+    ax.set_ylabel('Count')
+    return {'ax': ax, 'bars': bars}
+
+@cached_figure
 def plot_distribution(df, column, title, output_path):
     """
     Create a distribution plot.
-    
+
     :param df: pandas DataFrame containing the data
     :param column: Name of the column to plot distribution for
     :param title: Title for the plot
     :param output_path: Path where to save the plot
     """
-    plt.figure(figsize=(10, 6))
-    sns.histplot(data=df, x=column, bins=50)
-    plt.title(title)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
-
-def plot_sps_status_distribution(df, title, output_path):
+    template = figure_template('distribution', (10, 6), _build_distribution)
+    ax = template['ax']
+
+    values = df[column].to_numpy(dtype=float)
+    counts, edges = np.histogram(values[~np.isnan(values)], bins=HISTOGRAM_BINS)
+    for bar, left, right, count in zip(template['bars'], edges[:-1], edges[1:], counts):
+        bar.set_x(left)
+        bar.set_width(right - left)
+        bar.set_height(count)
+
+    ax.set_title(title)
+    ax.set_xlabel(column)
+    rescale(ax)
+    save_figure(template['fig'], output_path)
+
+def _build_sps_status_distribution(fig):
+    ax = fig.add_subplot()
+    ax.set_xlabel('Site')
+    ax.set_ylabel('Count')
+    return {'ax': ax}
+
+@cached_figure(derived=('status_counts',))
+def plot_sps_status_distribution(df, title, output_path, status_counts=None):
     """
     Create a bar plot showing status distribution by site for SPS data.
-    
+
     :param df: pandas DataFrame containing SPS data
     :param title: Title for the plot
     :param output_path: Path where to save the plot
+    :param status_counts: Optional 'status_changes' from analyse_sps_data, to avoid recounting
     """
-    plt.figure(figsize=(10, 6))
-    
-    # Get status counts by site
-    status_counts = df.groupby('Site')['Status'].value_counts().unstack()
-    
-    # Create bar plot
-    status_counts.plot(kind='bar', width=0.8)
-    
-    plt.title(title)
-    plt.xlabel('Site')
-    plt.ylabel('Count')
-    plt.legend(title='Status')
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
+    template = figure_template('sps_status_distribution', (10, 6), _build_sps_status_distribution)
+    ax = template['ax']
 
+    # Get status counts by site
+    if status_counts is None:
+        status_counts = df.groupby('Site')['Status'].value_counts()
+    status_counts = status_counts.unstack().fillna(0)
+
+    # One group of bars per site, one bar per status. The number of bars varies, so they only live for this plot.
+    positions = np.arange(len(status_counts))
+    width = 0.8 / max(len(status_counts.columns), 1)
+    bars = []
+    for i, status in enumerate(status_counts.columns):
+        offset = (i - (len(status_counts.columns) - 1) / 2) * width
+        bars.append(ax.bar(positions + offset, status_counts[status].to_numpy(), width=width, color=f'C{i}', label=str(status)))
+    ax.set_xticks(positions, labels=[str(site) for site in status_counts.index], rotation=90)
+    ax.legend(title='Status')
+
+    ax.set_title(title)
+    rescale(ax)
+    save_figure(template['fig'], output_path, temporary=[patch for container in bars for patch in container])
+
+def _build_temporal_coverage(fig):
+    ax = fig.add_subplot()
+    labels = ['Total Days', 'Days with Data', 'Missing Days']
+    bars = ax.bar(labels, [0, 0, 0], color=['blue', 'green', 'red'])
+    values = [ax.text(i, 0, '', ha='center', va='bottom') for i in range(len(labels))]
+    ax.set_ylabel('Number of Days')
+    ax.tick_params(axis='x', labelrotation=45)
+    return {'ax': ax, 'bars': bars, 'values': values}
+
+@cached_figure
 def plot_temporal_coverage(temporal_stats, title, output_path):
     """
     Create a bar plot of temporal coverage statistics.
-    
+
     :param temporal_stats: Dictionary containing temporal coverage statistics
     :param title: Title for the plot
     :param output_path: Path where to save the plot
     """
-    plt.figure(figsize=(10, 6))
-    
-    # Prepare data for plotting
-    stats = {
-        'Total Days': temporal_stats['Total Days'],
-        'Days with Data': temporal_stats['Unique Days'],
-        'Missing Days': temporal_stats['Missing Dates']
-    }
-    
-    # Create bar plot
-    plt.bar(stats.keys(), stats.values(), color=['blue', 'green', 'red'])
-    
-    # Add value labels on top of bars
-    for i, (key, value) in enumerate(stats.items()):
-        plt.text(i, value, str(value), ha='center', va='bottom')
-    
-    plt.title(title)
-    plt.ylabel('Number of Days')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
+    template = figure_template('temporal_coverage', (10, 6), _build_temporal_coverage)
+    ax = template['ax']
+
+    stats = [temporal_stats['Total Days'], temporal_stats['Unique Days'], temporal_stats['Missing Dates']]
+    for i, (bar, label, value) in enumerate(zip(template['bars'], template['values'], stats)):
+        bar.set_height(value)
+        # Value labels on top of bars
+        label.set_position((i, value))
+        label.set_text(str(value))
+
+    ax.set_title(title)
+    rescale(ax)
+    save_figure(template['fig'], output_path)
+
+def _build_daily_counts(fig):
+    ax = fig.add_subplot()
+    ax.xaxis_date()
+    mean_line = ax.axhline(y=0, color='r', linestyle='--')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number of Entries')
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(True, alpha=0.3)
+    return {'ax': ax, 'mean_line': mean_line}
 
 # Could not use in ppt, but interesting plot.
+@cached_figure
 def plot_daily_counts(df, datetime_col, title, output_path):
     """
     Create a bar plot of daily entry counts.
-    
+
     :param df: pandas DataFrame containing the data
     :param datetime_col: Name of the column containing datetime values
     :param title: Title for the plot
     :param output_path: Path where to save the plot
     """
-    plt.figure(figsize=(15, 6))
-    
+    template = figure_template('daily_counts', (15, 6), _build_daily_counts)
+    ax = template['ax']
+
     # Count entries per day
     daily_counts = df.groupby(df[datetime_col].dt.date).size()
-    
-    # Create bar plot
-    plt.bar(daily_counts.index, daily_counts.values, alpha=0.7)
-    
-    # Add a line showing the mean count
-    mean_count = daily_counts.mean()
-    plt.axhline(y=mean_count, color='r', linestyle='--', label=f'Mean: {mean_count:.1f} entries/day')
-    
-    plt.title(title)
-    plt.xlabel('Date')
-    plt.ylabel('Number of Entries')
-    plt.xticks(rotation=45)
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
-
+    bars = ax.bar(daily_counts.index, daily_counts.values, color='C0', alpha=0.7) # Fixed colour, the axes' colour cycle carries on between plots
 
+    # Line showing the mean count
+    mean_count = daily_counts.mean()
+    template['mean_line'].set_ydata([mean_count, mean_count])
+    template['mean_line'].set_label(f'Mean: {mean_count:.1f} entries/day')
+    ax.legend(handles=[template['mean_line']])
+
+    ax.set_title(title)
+    rescale(ax)
+    save_figure(template['fig'], output_path, temporary=bars.patches)
+
+def _build_spill_events(fig):
+    ax = fig.add_subplot()
+    ax.xaxis_date()
+    spills, = ax.plot([], [], 'o', color='red', alpha=0.6, markersize=6, label='Spill Events')
+    threshold_line = ax.axhline(y=0, color='red', linestyle='--')
+    level_line, = ax.plot([], [], color='blue', alpha=0.3, label='CSO Level')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Level (m)')
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(True, alpha=0.3)
+    return {'ax': ax, 'spills': spills, 'threshold_line': threshold_line, 'level_line': level_line}
+
+@cached_figure
 def plot_spill_events(df, datetime_col, level_col, threshold, title, output_path):
     """
     Create a plot showing CSO spill events over time.
-    
+
     :param df: pandas DataFrame containing the data
     :param datetime_col: Name of the column containing datetime values
     :param level_col: Name of the column containing level values
@@ -165,321 +215,359 @@ def plot_spill_events(df, datetime_col, level_col, threshold, title, output_path
     :param title: Title for the plot
     :param output_path: Path where to save the plot
     """
-    plt.figure(figsize=(15, 6))
-    
-    # Identify spill events
-    spill_events = df[df[level_col] >= threshold].copy()
-    
-    # Create scatter plot of spill events
-    plt.scatter(spill_events[datetime_col], spill_events[level_col], color='red', alpha=0.6, label='Spill Events')
-    
-    # Add threshold line
-    plt.axhline(y=threshold, color='red', linestyle='--', label=f'Spill Threshold ({threshold}m)')
-    
-    # Add regular level data as background
-    plt.plot(df[datetime_col], df[level_col], color='blue', alpha=0.3, label='CSO Level')
-    
-    plt.title(title)
-    plt.xlabel('Date')
-    plt.ylabel('Level (m)')
-    plt.xticks(rotation=45)
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
-    
-    # Return spill event statistics
-    return {
-        'total_spills': len(spill_events),
-        'spill_dates': spill_events[datetime_col].dt.date.nunique(),
-        'max_level': spill_events[level_col].max(),
-        'avg_level': spill_events[level_col].mean()
-    }
+    template = figure_template('spill_events', (15, 6), _build_spill_events)
+    ax = template['ax']
+
+    # Spill events as markers, over the threshold and the regular level data
+    spill_events = df[df[level_col] >= threshold]
+    template['spills'].set_data(spill_events[datetime_col].to_numpy(), spill_events[level_col].to_numpy())
+    template['threshold_line'].set_ydata([threshold, threshold])
+    template['threshold_line'].set_label(f'Spill Threshold ({threshold}m)')
+    template['level_line'].set_data(df[datetime_col].to_numpy(), df[level_col].to_numpy())
+    ax.legend()
+
+    ax.set_title(title)
+    rescale(ax)
+    save_figure(template['fig'], output_path)
 
+    # Return spill event statistics
+    return analyse_spill_events(df, datetime_col, level_col, threshold)
+
+def _build_missing_values_heatmap(fig):
+    ax = fig.add_subplot()
+    image = ax.imshow(np.zeros((1, 1)), cmap='YlOrRd', vmin=0, vmax=1, aspect='auto', interpolation='nearest') # Orange themed heatmap
+    fig.colorbar(image, ax=ax, label='Missing Value')
+    ax.set_yticks([]) # No row labels
+    ax.set_xlabel('Columns', fontsize=12)
+    ax.set_ylabel('Rows', fontsize=12)
+    return {'ax': ax, 'image': image}
+
+@cached_figure
 def plot_missing_values_heatmap(df, title, output_path):
     """
     Create a heatmap visualisation of missing values in the dataset.
-    
+
     :param df: pandas DataFrame containing the data
     :param title: Title for the plot
     :param output_path: Path where to save the plot
     """
-    plt.figure(figsize=(12, 8))
-    
+    template = figure_template('missing_values_heatmap', (12, 8), _build_missing_values_heatmap)
+    ax = template['ax']
+
     # Calculate missing values
     missing_data = df.isnull()
-    
-    # Create heatmap
-    sns.heatmap(missing_data, cmap='YlOrRd', cbar_kws={'label': 'Missing Value'}, yticklabels=False) # Orange themed heatmap with no y-labels
-    
-    plt.title(f"{title} - Missing Values Heatmap", fontsize=14, pad=20)
-    plt.xlabel('Columns', fontsize=12)
-    plt.ylabel('Rows', fontsize=12)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
-    
+    missing = missing_data.to_numpy()
+    rows, columns = missing.shape
+    if rows > HEATMAP_ROWS:
+        missing = np.logical_or.reduceat(missing, np.linspace(0, rows, HEATMAP_ROWS, endpoint=False).astype(int), axis=0)
+    elif rows == 0:
+        missing = np.zeros((1, columns), dtype=bool)
+
+    template['image'].set_data(missing.astype(float))
+    template['image'].set_extent((0, columns, max(rows, 1), 0))
+    ax.set_xlim(0, columns)
+    ax.set_ylim(max(rows, 1), 0)
+    ax.set_xticks(np.arange(columns) + 0.5, labels=[str(column) for column in df.columns])
+
+    ax.set_title(f"{title} - Missing Values Heatmap", fontsize=14, pad=20)
+    save_figure(template['fig'], output_path)
+
     return {
-        'missing_counts': df.isnull().sum().to_dict(),
-        'missing_percentages': (df.isnull().sum() / len(df) * 100).to_dict()
+        'missing_counts': missing_data.sum().to_dict(),
+        'missing_percentages': (missing_data.sum() / len(df) * 100).to_dict()
     }
 
-def plot_rainfall_cso_correlation(cso_df, rainfall_df, start_date, end_date, title, output_path):
+def _aligned_window(aligned, start_date, end_date):
     """
-    Create a plot showing the correlation between rainfall and CSO levels over a specified time period.
-    
-    :param cso_df: pandas DataFrame containing CSO data
-    :param rainfall_df: pandas DataFrame containing rainfall data
-    :param start_date: Start date for the analysis period
-    :param end_date: End date for the analysis period
-    :param title: Title for the plot
-    :param output_path: Path where to save the plot
+    Slice the aligned frame to [start_date, end_date] using binary search on its sorted DateTime column.
     """
-    # Create figure with two y-axes
-    fig, ax1 = plt.subplots(figsize=(15, 8))
+    times = aligned['DateTime']
+    lo = times.searchsorted(pd.Timestamp(start_date), side='left')
+    hi = times.searchsorted(pd.Timestamp(end_date), side='right')
+    return aligned.iloc[lo:hi]
+
+def _build_rainfall_cso_correlation(fig):
+    # Figure with two y-axes
+    ax1 = fig.add_subplot()
     ax2 = ax1.twinx()
-    
-    # Filter data for the specified time period. Series of True and False values known as a mask. Not necessary, but cleaner.
-    cso_mask = (cso_df['DateTime'] >= start_date) & (cso_df['DateTime'] <= end_date)
-    rainfall_mask = (rainfall_df['time'] >= start_date) & (rainfall_df['time'] <= end_date)
-    
-    # Take the dates with the correct masks
-    cso_period = cso_df[cso_mask]
-    rainfall_period = rainfall_df[rainfall_mask]
-    
-    # Plot CSO levels
-    line1 = ax1.plot(cso_period['DateTime'], cso_period['Level'], color='blue', label='CSO Level', alpha=0.7)
+    ax1.xaxis_date()
+
+    # CSO levels, threshold and rainfall
+    level_line, = ax1.plot([], [], color='blue', label='CSO Level', alpha=0.7)
+    threshold_line = ax1.axhline(y=0, color='red', linestyle='--')
+    rain_line, = ax2.plot([], [], color='red', label='Rainfall', alpha=0.7)
+
     ax1.set_xlabel('Date', fontsize=12)
     ax1.set_ylabel('CSO Level (m)', color='blue', fontsize=12)
     ax1.tick_params(axis='y', labelcolor='blue')
-
-    # Add threshold line at 43mm
-    ax1.axhline(y=43.0, color='red', linestyle='--', label='Spill Threshold (43m)')
-    
-    # Plot rainfall
-    line2 = ax2.plot(rainfall_period['time'], rainfall_period['RG_A'], color='red', label='Rainfall', alpha=0.7)
     ax2.set_ylabel('Rainfall (mm)', color='red', fontsize=12)
     ax2.tick_params(axis='y', labelcolor='red')
-    
-    # Add title and legend
-    plt.title(title, fontsize=14, pad=20)
-    
-    # Combine legends
-    lines = line1 + line2
-    labels = [l.get_label() for l in lines]
-    ax1.legend(lines, labels, loc='upper left')
-    
-    # Format x-axis
-    plt.xticks(rotation=45)
-    
-    # Add grid
+    ax1.tick_params(axis='x', labelrotation=45)
     ax1.grid(True, alpha=0.3)
-    
-    # Adjust layout
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
 
-def plot_sps_cso_correlation(cso_df, sps_df, start_date, end_date, title, output_path):
+    # Combined legend
+    ax1.legend([level_line, rain_line], ['CSO Level', 'Rainfall'], loc='upper left')
+    correlation = ax1.text(0.99, 0.97, '', transform=ax1.transAxes, ha='right', va='top')
+    return {'ax1': ax1, 'ax2': ax2, 'level_line': level_line, 'threshold_line': threshold_line,
+            'rain_line': rain_line, 'correlation': correlation}
+
+@cached_figure
+def plot_rainfall_cso_correlation(aligned, start_date, end_date, title, output_path, threshold=43.0):
     """
-    Create a plot showing the correlation between SPS (pump status) and CSO levels over a specified time period.
-    
-    :param cso_df: pandas DataFrame containing CSO level data
-    :param sps_df: pandas DataFrame containing SPS pump status data
-    :param start_date: Start date for the plot
-    :param end_date: End date for the plot
-    :param title: Plot title
-    :param output_path: File path to save the output image
+    Create a plot showing the correlation between rainfall and CSO levels over a specified time period.
+
+    :param aligned: Aligned CSO / pump / rainfall frame from alignment.align_datasets
+    :param start_date: Start date for the analysis period
+    :param end_date: End date for the analysis period
+    :param title: Title for the plot
+    :param output_path: Path where to save the plot
+    :param threshold: Level threshold for spill events (in meters)
     """
-    # Create figure and axis
-    fig, ax1 = plt.subplots(figsize=(15, 8))
+    template = figure_template('rainfall_cso_correlation', (15, 8), _build_rainfall_cso_correlation)
+
+    # Both series on the CSO timeline, rainfall matched to each CSO reading by the alignment
+    period = _aligned_window(aligned, start_date, end_date)
+    period = period[period['CSO_observed']]
+    times = period['DateTime'].to_numpy()
+    template['level_line'].set_data(times, period['CSO_Level'].to_numpy())
+    template['rain_line'].set_data(times, period['Rainfall_RG_A'].to_numpy())
+    template['threshold_line'].set_ydata([threshold, threshold])
+    template['threshold_line'].set_label(f'Spill Threshold ({threshold:g}m)')
+
+    # Pearson correlation over the aligned readings in the window
+    correlation = period['CSO_Level'].corr(period['Rainfall_RG_A'])
+    template['correlation'].set_text(f'r = {correlation:.2f}' if pd.notna(correlation) else '')
+
+    template['ax1'].set_title(title, fontsize=14, pad=20)
+    rescale(template['ax1'], template['ax2'])
+    save_figure(template['fig'], output_path)
+
+def _build_sps_cso_correlation(fig):
+    # Figure with two y-axes
+    ax1 = fig.add_subplot()
     ax2 = ax1.twinx()
+    ax1.xaxis_date()
 
-    # Filter for the given time window
-    cso_period = cso_df[(cso_df['DateTime'] >= start_date) & (cso_df['DateTime'] <= end_date)].copy()
-    sps_period = sps_df[(sps_df['Timestamp'] >= start_date) & (sps_df['Timestamp'] <= end_date)].copy()
+    # Threshold, CSO levels and pump activations
+    threshold_line = ax1.axhline(y=0, color='red', linestyle='--')
+    level_line, = ax1.plot([], [], label='CSO Level', color='blue')
+    pump_markers, = ax2.plot([], [], '^', color='green', markersize=np.sqrt(60), label='Pump Activation')
 
-    # Add threshold line at 43mm
-    ax1.axhline(y=43.0, color='red', linestyle='--', label='Spill Threshold (43m)')
-
-    # Plot CSO levels
-    line1 = ax1.plot(cso_period['DateTime'], cso_period['Level'], label='CSO Level', color='blue')
     ax1.set_ylabel('CSO Level (m)', color='blue', fontsize=12)
     ax1.tick_params(axis='y', labelcolor='blue') # Match axis label to line colour :)
-
-    # Plot pump activations
-    running_pumps = sps_period[sps_period['Status'] == 1].copy()
-    # Match each pump activation to nearest CSO level for y-position
-    running_pumps = pd.merge_asof(
-        running_pumps.sort_values('Timestamp'),
-        cso_period[['DateTime', 'Level']].sort_values('DateTime'),
-        left_on='Timestamp',
-        right_on='DateTime',
-        direction='nearest'
-    )
-    scatter = ax2.scatter(
-        running_pumps['Timestamp'],
-        running_pumps['Level'],
-        marker='^',
-        color='green',
-        s=60,
-        label='Pump Activation'
-    )
     ax2.set_ylabel('Pump Activation (Markers)', color='green', fontsize=12)
     ax2.tick_params(axis='y', labelcolor='green')
-
-    # Format and title
     ax1.set_xlabel("Date")
-    plt.title(title, fontsize=14, pad=20)
+    ax1.tick_params(axis='x', labelrotation=45)
+    ax1.grid(True, alpha=0.3)
 
-    # Combine legend items
-    lines = line1 + [scatter]
-    labels = [l.get_label() for l in lines]
-    ax1.legend(lines, labels, loc='upper left')
+    # Combined legend
+    ax1.legend([level_line, pump_markers], ['CSO Level', 'Pump Activation'], loc='upper left')
+    return {'ax1': ax1, 'ax2': ax2, 'threshold_line': threshold_line, 'level_line': level_line, 'pump_markers': pump_markers}
 
-    plt.xticks(rotation=45)
-    ax1.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
+@cached_figure
+def plot_sps_cso_correlation(aligned, site, start_date, end_date, title, output_path, threshold=43.0):
+    """
+    Create a plot showing the correlation between SPS (pump status) and CSO levels over a specified time period.
 
+    :param aligned: Aligned CSO / pump / rainfall frame from alignment.align_datasets
+    :param site: Pump source in the aligned frame (e.g., 'SPS_A1')
+    :param start_date: Start date for the plot
+    :param end_date: End date for the plot
+    :param title: Plot title
+    :param output_path: File path to save the output image
+    :param threshold: Level threshold for spill events (in meters)
+    """
+    template = figure_template('sps_cso_correlation', (15, 8), _build_sps_cso_correlation)
+
+    # Filter for the given time window
+    period = _aligned_window(aligned, start_date, end_date)
+    cso_period = period[period['CSO_observed']]
+    template['threshold_line'].set_ydata([threshold, threshold])
+    template['threshold_line'].set_label(f'Spill Threshold ({threshold:g}m)')
+    template['level_line'].set_data(cso_period['DateTime'].to_numpy(), cso_period['CSO_Level'].to_numpy())
+
+    # Pump activations, at the CSO level the alignment matched to each activation
+    running_pumps = period[pump_activation_mask(period, [site])]
+    template['pump_markers'].set_data(running_pumps['DateTime'].to_numpy(), running_pumps['CSO_Level'].to_numpy())
+
+    template['ax1'].set_title(title, fontsize=14, pad=20)
+    rescale(template['ax1'], template['ax2'])
+    save_figure(template['fig'], output_path)
+
+def _build_duplicates(fig):
+    ax = fig.add_subplot()
+    bars = ax.bar(['Duplicates', 'Unique'], [0, 0], color=['red', 'green'])
+    counts = [ax.text(i, 0, '', ha='center', va='bottom') for i in range(2)] # Exact number above each bar
+    percentages = [ax.text(i, 0, '', ha='center', va='center', color='white') for i in range(2)] # % in the center of each bar. Stole this but it's cool.
+    ax.set_ylabel('Number of Records', fontsize=12)
+    return {'ax': ax, 'bars': bars, 'counts': counts, 'percentages': percentages}
+
+@cached_figure
 def plot_duplicates(df, title, output_path):
     """
     Create a simple visualisation of duplicates in the dataset.
-    
+
     :param df: pandas DataFrame containing the data
     :param title: Title for the plot
     :param output_path: Path where to save the plot
     """
-    plt.figure(figsize=(10, 6))
-    
+    template = figure_template('duplicates', (10, 6), _build_duplicates)
+    ax = template['ax']
+
     # Find duplicates based on entire row
-    duplicates = df.duplicated(keep='first')
-    duplicate_records = df[duplicates]
-    duplicate_count = len(duplicate_records)
+    duplicate_count = int(df.duplicated(keep='first').sum())
     total_count = len(df)
-    
-    # Create a simple bar chart
-    plt.bar(['Duplicates', 'Unique'], [duplicate_count, total_count - duplicate_count], color=['red', 'green'])
-    
-    # Add count labels on top of bars
-    plt.text(0, duplicate_count, f"{duplicate_count:,}", ha='center', va='bottom')
-    plt.text(1, total_count - duplicate_count, f"{total_count - duplicate_count:,}", ha='center', va='bottom')
-    
-    # Add percentage labels
     duplicate_percentage = (duplicate_count / total_count) * 100
-    if duplicate_count > 0:  # Only show percentage label for duplicates if there are any. 
-        plt.text(0, duplicate_count/2, f"{duplicate_percentage:.2f}%", ha='center', va='center', color='white') # Show % in the center of the bar.
-    plt.text(1, (total_count - duplicate_count)/2, f"{100-duplicate_percentage:.2f}%", ha='center', va='center', color='white') # Show exact number above bar plot. Stole this but it's cool.
-    
-    plt.title(f"{title} - Duplicates", fontsize=14, pad=20)
-    plt.ylabel('Number of Records', fontsize=12)
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
-    
+
+    heights = [duplicate_count, total_count - duplicate_count]
+    percentages = [duplicate_percentage, 100 - duplicate_percentage]
+    for i, (bar, count, percentage) in enumerate(zip(template['bars'], template['counts'], template['percentages'])):
+        bar.set_height(heights[i])
+        count.set_position((i, heights[i]))
+        count.set_text(f"{heights[i]:,}")
+        percentage.set_position((i, heights[i] / 2))
+        percentage.set_text(f"{percentages[i]:.2f}%")
+    template['percentages'][0].set_visible(duplicate_count > 0) # Only show percentage label for duplicates if there are any.
+
+    ax.set_title(f"{title} - Duplicates", fontsize=14, pad=20)
+    rescale(ax)
+    save_figure(template['fig'], output_path)
+
     return {
         'duplicate_count': duplicate_count,
         'unique_count': total_count - duplicate_count,
         'duplicate_percentage': duplicate_percentage
     }
 
+def _build_sps_status_consistency(fig):
+    ax = fig.add_subplot()
+    image = ax.imshow(np.zeros((1, 1)), cmap='YlOrRd', aspect='auto', interpolation='nearest') # did not turn out orange because values ended up lying on far ends :(
+    fig.colorbar(image, ax=ax)
+    ax.set_xlabel('State Description')
+    ax.set_ylabel('Status')
+    return {'ax': ax, 'image': image}
+
+@cached_figure
 def plot_sps_status_consistency(df, title, output_path):
     """
     Create a heatmap showing the distribution of Status-StateDesc combinations.
     This helps identify any inconsistencies between Status and StateDesc values.
-    
+
     :param df: pandas DataFrame containing SPS data
     :param title: Title for the plot
     :param output_path: Path where to save the plot
     """
-    plt.figure(figsize=(8, 6))
-    
+    template = figure_template('sps_status_consistency', (8, 6), _build_sps_status_consistency)
+    ax, image = template['ax'], template['image']
+
     # Create cross-tabulation of Status and StateDesc
     status_matrix = pd.crosstab(df['Status'], df['StateDesc'])
-    
-    # Create heatmap
-    sns.heatmap(status_matrix, annot=True, fmt='d', cmap='YlOrRd') # did not turn out orange because values ended up lying on far ends :(
-    
-    plt.title(f"{title} - Status vs StateDesc Distribution")
-    plt.xlabel('State Description')
-    plt.ylabel('Status')
-    plt.tight_layout()
-    plt.savefig(output_path)
-    plt.close()
-    
+    values = status_matrix.to_numpy()
+    rows, columns = values.shape
+
+    image.set_data(values)
+    image.set_clim(values.min(initial=0), values.max(initial=1))
+    image.set_extent((0, columns, rows, 0))
+    ax.set_xlim(0, columns)
+    ax.set_ylim(rows, 0)
+    ax.set_xticks(np.arange(columns) + 0.5, labels=[str(state) for state in status_matrix.columns])
+    ax.set_yticks(np.arange(rows) + 0.5, labels=[str(status) for status in status_matrix.index])
+
+    # Count in each cell, readable on the cell's colour
+    annotations = [ax.text(j + 0.5, i + 0.5, f"{values[i, j]:d}", ha='center', va='center',
+                           color=_text_colour(image.cmap(image.norm(values[i, j]))))
+                   for i in range(rows) for j in range(columns)]
+
+    ax.set_title(f"{title} - Status vs StateDesc Distribution")
+    save_figure(template['fig'], output_path, temporary=annotations)
+
     # Return inconsistency count if any
     expected_combinations = {(1, 'RUNNING'), (0, 'STOPPED')}
     actual_combinations = set((status, state) for status, state in zip(df['Status'], df['StateDesc']))
     inconsistent_combinations = actual_combinations - expected_combinations
-    
+
     return {
         'inconsistent_combinations': list(inconsistent_combinations),
-        'inconsistent_count': len(df[~((df['Status'] == 1) & (df['StateDesc'] == 'RUNNING')) & 
+        'inconsistent_count': len(df[~((df['Status'] == 1) & (df['StateDesc'] == 'RUNNING')) &
                                     ~((df['Status'] == 0) & (df['StateDesc'] == 'STOPPED'))])
     }
 
-def plot_potential_false_spills(cso_df, sps_df, false_spills, threshold=43.0, title="Potential False Spill Events", output_path="output/figures/potential_false_spills.png"):
+def _build_potential_false_spills(fig):
+    ax = fig.add_subplot()
+    ax.xaxis_date()
+    level_line, = ax.plot([], [], color='blue', label='CSO Level')
+    threshold_line = ax.axhline(y=0, color='red', linestyle='--', label='Spill Threshold')
+    pump_markers, = ax.plot([], [], '^', color='green', markersize=np.sqrt(80), label='Pump Activated', zorder=1) # Under the level line, like a scatter
+    ax.set_xlabel("Date")
+    ax.set_ylabel("CSO Level")
+    ax.legend(handles=[level_line, threshold_line, pump_markers], loc='upper left')
+    return {'ax': ax, 'level_line': level_line, 'threshold_line': threshold_line, 'pump_markers': pump_markers}
+
+def _build_false_spills_overview(fig):
+    ax = fig.add_subplot()
+    ax.xaxis_date()
+    level_line, = ax.plot([], [], color='blue', alpha=0.3, label='CSO Level')
+    threshold_line = ax.axhline(y=0, color='red', linestyle='--', label='Spill Threshold')
+    false_spill_markers, = ax.plot([], [], 'o', color='orange', markeredgecolor='black', markersize=8, label='Potential False Spill')
+    ax.set_xlabel("Date")
+    ax.set_ylabel("CSO Level")
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(True, alpha=0.3)
+    ax.legend(handles=[level_line, threshold_line, false_spill_markers], loc='upper left')
+    return {'ax': ax, 'level_line': level_line, 'threshold_line': threshold_line, 'false_spill_markers': false_spill_markers}
+
+@cached_figure
+def plot_potential_false_spills(aligned, false_spills, threshold=43.0, title="Potential False Spill Events", output_path="output/figures/potential_false_spills.png",
+                                zoom_output_path="output/figures/zoomed_false_spill.png", zoom_start=None, zoom_end=None):
     """
-    Create a visualisation to show potential false spill events.
-    
-    :param cso_df: DataFrame containing CSO level data
-    :param sps_df: DataFrame containing pump status data
+    Create a visualisation to show potential false spill events: an overview of the whole period with each
+    false spill marked at its peak level, and a zoomed-in view with the pump activations.
+    Any other window can be browsed in the tile viewer (python main.py tiles) without re-rendering.
+
+    :param aligned: Aligned CSO / pump / rainfall frame from alignment.align_datasets
     :param false_spills: List of dictionaries containing false spill event details
     :param threshold: Level threshold for spill events (in meters)
     :param title: Title for the plot
-    :param output_path: Path where to save the plot
+    :param output_path: Path where to save the overview
+    :param zoom_output_path: Path where to save the zoomed-in view
+    :param zoom_start: Start of the zoomed-in view (default: 2 days before the first false spill)
+    :param zoom_end: End of the zoomed-in view (default: 20 days after zoom_start)
     """
-    # Ensure datetime columns are properly formatted
-    cso_df['DateTime'] = pd.to_datetime(cso_df['DateTime'])
-    sps_df['Timestamp'] = pd.to_datetime(sps_df['Timestamp'])
-
     # Define the zoomed-in window. Picked a timeframe of 20 days.
-    start_date = '2017-11-01'
-    end_date = '2017-11-20'
-
-    # Filter both CSO and pump data
-    cso_zoom = cso_df[(cso_df['DateTime'] >= start_date) & (cso_df['DateTime'] <= end_date)].copy()
-    sps_zoom = sps_df[(sps_df['Timestamp'] >= start_date) & (sps_df['Timestamp'] <= end_date)].copy()
-
-    # Create visualisation
-    plt.figure(figsize=(14, 6))
-
-    # Plot CSO level
-    level_line, = plt.plot(cso_zoom['DateTime'], cso_zoom['Level'], color='blue', label='CSO Level')
-
-    # Threshold line
-    threshold_line = plt.axhline(y=threshold, color='red', linestyle='--', label='Spill Threshold')
-
-    # Pump activations at correct CSO levels
-    pump_activations = sps_zoom[sps_zoom['Status'] == 1].copy()
-    pump_activations['DateTime'] = pd.to_datetime(pump_activations['Timestamp'])
-
-    # Match to nearest CSO level for correct y-values
-    pump_activations = pd.merge_asof(
-        pump_activations.sort_values('DateTime'),
-        cso_zoom[['DateTime', 'Level']].sort_values('DateTime'),
-        on='DateTime',
-        direction='nearest'
-    )
-
-    # Plot pumps
-    pump_markers = plt.scatter(
-        pump_activations['DateTime'],
-        pump_activations['Level'],
-        marker='^', color='green', s=80, label='Pump Activated'
-    )
-
-    # Create plot
-    plt.title(f"Zoomed-In View: CSO Level & Pump Activation ({start_date} to {end_date})")
-    plt.xlabel("Date")
-    plt.ylabel("CSO Level")
-    plt.legend(handles=[level_line, threshold_line, pump_markers], loc='upper left')
-    plt.tight_layout()
-    plt.savefig("output/figures/zoomed_false_spill.png")
-    plt.close()
+    if zoom_start is None:
+        zoom_start = (pd.Timestamp(false_spills[0]['start_time']).floor('D') - pd.Timedelta(days=2)) if false_spills else aligned['DateTime'].iloc[0]
+    start_date = pd.Timestamp(zoom_start)
+    end_date = pd.Timestamp(zoom_end) if zoom_end is not None else start_date + pd.Timedelta(days=20)
+
+    # Overview of the whole period
+    cso = aligned[aligned['CSO_observed']]
+    overview = figure_template('false_spills_overview', (14, 6), _build_false_spills_overview)
+    overview['level_line'].set_data(cso['DateTime'].to_numpy(), cso['CSO_Level'].to_numpy())
+    overview['threshold_line'].set_ydata([threshold, threshold])
+    overview['false_spill_markers'].set_data([pd.Timestamp(spill['start_time']) for spill in false_spills],
+                                             [spill['max_level'] for spill in false_spills])
+    overview['ax'].set_title(title)
+    rescale(overview['ax'])
+    save_figure(overview['fig'], output_path)
+
+    template = figure_template('potential_false_spills', (14, 6), _build_potential_false_spills)
+    ax = template['ax']
+
+    # Filter the aligned data
+    zoom = _aligned_window(aligned, start_date, end_date)
+    cso_zoom = zoom[zoom['CSO_observed']]
+    template['level_line'].set_data(cso_zoom['DateTime'].to_numpy(), cso_zoom['CSO_Level'].to_numpy())
+    template['threshold_line'].set_ydata([threshold, threshold])
+
+    # Pump activations at the CSO level matched by the alignment
+    pump_activations = zoom[pump_activation_mask(zoom)]
+    template['pump_markers'].set_data(pump_activations['DateTime'].to_numpy(), pump_activations['CSO_Level'].to_numpy())
+
+    ax.set_title(f"Zoomed-In View: CSO Level & Pump Activation ({start_date:%Y-%m-%d} to {end_date:%Y-%m-%d})")
+    rescale(ax)
+    save_figure(template['fig'], zoom_output_path)
 
     return {
         'count': len(false_spills)
-    } 
\ No newline at end of file
+    }